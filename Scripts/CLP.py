@@ -1,163 +1,523 @@
-import opcua
+import asyncio
 import threading
-import socket
 import queue
+import itertools
 import time
 import sys
+from datetime import datetime
 
+from canais import CommandChannel, TelemetryBuffer
+from conexao_opc import OpcSession, is_connection_error
+from opc_helpers import BatchIO, subscribe_nodes
+from metricas import REGISTRY, start_http_server
+from tracer import get_tracer
+import protocolo
 
-def thread_opcua(stop_event: threading.Event, pos_queue: queue.Queue, tgt_queue: queue.Queue):
-    # Definir o cliente OPC UA
-    cliente = opcua.Client("opc.tcp://localhost:53530/OPCUA/SimulationServer")
+############################
+# CONFIG
+############################
+OPCUA_URL = "opc.tcp://localhost:53530/OPCUA/SimulationServer"
+DRONE_FOLDER = "3:Drone"
+DRONE_VARS = ("TargetX", "TargetY", "TargetZ", "DroneX", "DroneY", "DroneZ")
+TRACE_VARS = ("CommandId", "CommandAck")
 
-    # Define tempo de timeout da sessão
-    cliente.session_timeout = 2000
+# Modo de aquisição da telemetria do drone:
+#   "subscription" -> monitored items em DroneX/DroneY/DroneZ (padrão)
+#   "polling"      -> leitura periódica a cada POLL_PERIOD segundos (fallback)
+TELEMETRY_MODE = "subscription"
+PUBLISHING_INTERVAL_MS = 50     # intervalo de publicação da subscription
+SAMPLING_INTERVAL_MS = 25       # intervalo de amostragem no servidor
+POLL_PERIOD = 0.5               # período do modo polling (s)
+LATENCY_REPORT_PERIOD = 10.0    # período do relatório de latência dos comandos (s)
 
-    # Tentar conectar ao servidor OPC UA
-    try:
-        cliente.connect()
-    except Exception as e:
-        print("[OPC] Erro ao conectar ao servidor OPC UA:", e)
-        return
-    print("[OPC] Conectado ao servidor OPC UA")
+# Buffer de telemetria entre as threads OPC e TCP:
+#   "ring"   -> anel que sobrescreve as amostras mais antigas
+#   "latest" -> apenas a amostra mais recente
+TELEMETRY_BUFFER_POLICY = "ring"
+TELEMETRY_BUFFER_SIZE = 128
+
+# Servidor TCP para as IHMs (sinotico.py)
+HOST = 'localhost'
+PORT = 65432
+CLIENT_SEND_BUFFER = 256        # amostras pendentes por cliente antes de desconectá-lo
+CLIENT_SEND_TIMEOUT = 2.0       # tempo máximo de um envio (s) antes de desconectar
+ALLOW_BINARY_PROTOCOL = True    # aceita a negociação do protocolo binário (protocolo.py)
+MAX_SAMPLES_PER_FRAME = 64      # amostras por quadro TELEMETRY binário
+
+# Rastreamento dos comandos (tracer.py): usa CommandId/CommandAck quando o
+# servidor OPC UA tem essas variáveis
+TRACE_COMMANDS = True
+
+# Endpoint Prometheus (metricas.py); 0 desliga
+METRICS_PORT = 9102
+
+
+class TelemetryHandler:
+    """
+    Handler da subscription OPC UA: mantém a última posição conhecida do
+    drone e coloca uma amostra na pos_queue por pose nova.
+
+    Os eixos de um mesmo Write chegam em notificações separadas (e, com
+    várias poses na mesma resposta de Publish, agrupados por variável).
+    As mudanças de cada resposta são guardadas e, no fim dela
+    (datachange_batch_end), aplicadas em ordem de timestamp (de origem ou
+    do servidor; sem eles, intercaladas por eixo): uma amostra
+    sai quando um eixo já alterado muda de novo (próxima pose) e no fim,
+    de modo que nenhuma amostra mistura eixos de poses diferentes.
+
+    Com o nó CommandAck, cada ack novo do bridge marca a amostra seguinte
+    com o ID do comando (a primeira que reflete o comando).
+    """
+    def __init__(self, pos_queue: TelemetryBuffer, dX, dY, dZ, seq=None, ack=None, tracer=None):
+        self.pos_queue = pos_queue
+        self.seq = seq if seq is not None else itertools.count(1)
+        self.axis_by_node = {dX.nodeid: 'x', dY.nodeid: 'y', dZ.nodeid: 'z'}
+        if ack is not None:
+            self.axis_by_node[ack.nodeid] = 'ack'
+        self.position = {'x': None, 'y': None, 'z': None}
+        self.batch = []             # (timestamp, nº da mudança do eixo, ordem, eixo, valor)
+        self.ranks = {}             # eixo -> nº da última mudança na resposta atual
+        self.last_ack = None
+        self.pending_ack = None
+        self.tracer = tracer
+
+    def datachange_notification(self, node, val, data):
+        axis = self.axis_by_node.get(node.nodeid)
+        if axis is None:
+            return
+        dv = data.monitored_item.Value
+        ts = dv.SourceTimestamp or dv.ServerTimestamp or datetime.min
+        # Sem timestamps, a k-ésima mudança de cada eixo fica com a k-ésima pose
+        rank = self.ranks[axis] = self.ranks.get(axis, -1) + 1
+        self.batch.append((ts, rank, len(self.batch), axis, val))
+
+    def datachange_batch_end(self):
+        batch, self.batch = sorted(self.batch), []
+        self.ranks.clear()
+        changed = set()
+        for _, _, _, axis, val in batch:
+            if axis == 'ack':
+                # O primeiro valor é o estado inicial da subscription, não um ack
+                if self.last_ack is not None:
+                    self.pending_ack = int(val)
+                self.last_ack = int(val)
+                continue
+            if axis in changed:
+                self._flush(changed)
+            self.position[axis] = val
+            changed.add(axis)
+        self._flush(changed)
+
+    def _flush(self, changed: set):
+        # Só publica depois de receber o valor inicial dos três eixos
+        if (changed or self.pending_ack) and None not in self.position.values():
+            self._publish(self.pending_ack)
+            self.pending_ack = None
+        changed.clear()
+
+    def _publish(self, cmd_id: int = None):
+        position = dict(self.position)
+        position['timestamp'] = time.time()
+        position['mono'] = time.monotonic()
+        position['drone'] = 0
+        position['seq'] = next(self.seq)
+        if cmd_id:
+            position['cmd_id'] = cmd_id
+            if self.tracer is not None:
+                self.tracer.stamp(cmd_id, 'clp.amostra', seq=position['seq'])
+        self.pos_queue.put_nowait(position)
+
+    def status_change_notification(self, status):
+        print("[OPC] Status da subscription alterado:", status)
+
+
+def thread_opcua(stop_event: threading.Event, pos_queue: TelemetryBuffer, tgt_queue: CommandChannel):
+    """
+    Thread OPC UA: mantém a sessão com o servidor e reconecta (com backoff)
+    quando a conexão cai; os comandos pendentes são escritos na volta.
+    """
+    paths = [f"{DRONE_FOLDER}/3:{name}" for name in DRONE_VARS]
+    optional = [f"{DRONE_FOLDER}/3:{name}" for name in TRACE_VARS] if TRACE_COMMANDS else []
+    session = OpcSession(OPCUA_URL, paths + optional, "OPC", required=paths)
+    tracer = get_tracer("clp", enabled=TRACE_COMMANDS)
+    seq = itertools.count(1)        # número de sequência das amostras (segue entre conexões)
+
+    while session.connect(stop_event):
+        try:
+            run_opcua_session(session, stop_event, pos_queue, tgt_queue, seq, tracer)
+            break
+        except Exception as e:
+            if not is_connection_error(e):
+                print("[OPC] Erro na thread OPC UA:", e)
+                break
+            session.lost(e)
+    print("[OPC] Encerrando conexão com o servidor OPC UA")
+    session.close()
+
+
+def run_opcua_session(session: OpcSession, stop_event: threading.Event, pos_queue: TelemetryBuffer,
+                      tgt_queue: CommandChannel, seq, tracer):
+    """Loop de uma conexão; retorna com o stop_event e propaga os erros de I/O."""
+    tX, tY, tZ, dX, dY, dZ = (session.nodes[f"{DRONE_FOLDER}/3:{name}"] for name in DRONE_VARS)
+
+    # Variáveis de rastreamento dos comandos (opcionais)
+    cmd_node = session.nodes.get(f"{DRONE_FOLDER}/3:CommandId")
+    ack_node = session.nodes.get(f"{DRONE_FOLDER}/3:CommandAck")
+    if cmd_node is None or ack_node is None:
+        cmd_node = ack_node = None
+    else:
+        print("[OPC] Rastreamento de comandos via CommandId/CommandAck")
+
+    # Assinar a telemetria; se não for possível, cair para o modo polling
+    subscription = None
+    if TELEMETRY_MODE == "subscription":
+        try:
+            handler = TelemetryHandler(pos_queue, dX, dY, dZ, seq, ack_node, tracer)
+            nodes = [dX, dY, dZ] + ([ack_node] if ack_node is not None else [])
+            subscription = subscribe_nodes(session.client, nodes, handler,
+                                           PUBLISHING_INTERVAL_MS, SAMPLING_INTERVAL_MS)
+            print(f"[OPC] Telemetria por subscription "
+                  f"(publicação {PUBLISHING_INTERVAL_MS} ms, amostragem {SAMPLING_INTERVAL_MS} ms)")
+        except Exception as e:
+            if is_connection_error(e):
+                raise
+            print("[OPC] Erro ao criar a subscription, usando polling:", e)
+    if subscription is None:
+        print(f"[OPC] Telemetria por polling a cada {POLL_PERIOD} s")
+
+    # Nós de target por drone (por enquanto apenas o drone 0)
+    target_nodes = {0: [tX, tY, tZ]}
+    command_nodes = {0: cmd_node} if cmd_node is not None else {}
+    opc_io = BatchIO(session.client, "OPC", LATENCY_REPORT_PERIOD)
+    last_ack = None
+
+    # O loop roda a poucos Hz: mede todos os ciclos
+    loop_timer = REGISTRY.timer('sda_loop_work_seconds', "Tempo gasto no corpo do loop",
+                                {'loop': 'clp.opc'}, every=1)
+    write_hist = REGISTRY.histogram('sda_command_write_seconds',
+                                    "Latência entre a chegada do comando e sua escrita no OPC UA")
+
+    next_poll = time.monotonic()
+    next_report = next_poll + LATENCY_REPORT_PERIOD
+    reported = 0
+    reported_lost = 0
 
-    # Tentar acessar o nó "Drone"
-    try:
-        root = cliente.get_objects_node()
-        drone_node = root.get_child(["3:Drone"])
-    except Exception as e:
-        print("[OPC] Erro ao acessar o nó 'Drone':", e)
-        cliente.disconnect()
-        return
-    print("[OPC] Nó 'Drone' acessado com sucesso")
-
-    # Mapeamento dos nós esperados
-    try:
-        tX = drone_node.get_child(["3:TargetX"])
-        tY = drone_node.get_child(["3:TargetY"])
-        tZ = drone_node.get_child(["3:TargetZ"])
-        dX = drone_node.get_child(["3:DroneX"])
-        dY = drone_node.get_child(["3:DroneY"])
-        dZ = drone_node.get_child(["3:DroneZ"])
-    except Exception as e:
-        print("[OPC] Erro ao mapear os nós esperados:", e)
-        cliente.disconnect()
-        return
-    print("[OPC] Nós mapeados com sucesso")
-    
     # Loop principal da thread
     while not stop_event.is_set():
-        # Verificar se há novos comandos na fila tgt_queue
+        # Aguardar comandos até o próximo ciclo de leitura; um comando novo
+        # acorda a thread imediatamente e todos os pendentes são escritos
+        if subscription is None:
+            timeout = max(0.0, next_poll - time.monotonic())
+        else:
+            timeout = 0.2
+        pending = tgt_queue.drain(timeout)
+        t_drain = time.time()
+        t0 = loop_timer.start()
+
         try:
-            target = tgt_queue.get(timeout=0.2)     # Obtem o próximo comando
-            
-            # Atualizar os valores no servidor OPC UA
-            tX.set_value(target['x'])
-            tY.set_value(target['y'])
-            tZ.set_value(target['z'])
-        
-        except queue.Empty:
-            pass    # Nenhum comando novo, continue
-
-        # Ler a posição atual do drone e colocar na fila pos_queue
+            for drone, (target, t_arrival) in list(pending.items()):
+                nodes = target_nodes.get(drone)
+                if nodes is None:
+                    print(f"[OPC] Comando para drone desconhecido: {drone}")
+                    continue
+                values = [target['x'], target['y'], target['z']]
+                cmd_id = target.get('cmd_id')
+                tracer.stamp(cmd_id, 'clp.desenfileirado', t_drain)
+                if cmd_id and drone in command_nodes:
+                    # O CommandId vai no mesmo Write, depois dos targets
+                    nodes = nodes + [command_nodes[drone]]
+                    values.append(float(cmd_id))
+                # Atualizar os valores no servidor OPC UA (um único Write)
+                opc_io.write(nodes, values)
+                tgt_queue.record_write(t_arrival)
+                write_hist.observe(time.monotonic() - t_arrival)
+                tracer.stamp(cmd_id, 'clp.escrito')
+                del pending[drone]
+        except Exception as e:
+            # Os comandos não escritos voltam ao canal para a próxima conexão
+            tgt_queue.requeue(pending)
+            print("[OPC] Erro ao escrever o target do drone:", e)
+            raise
+
+        now = time.monotonic()
+        if now >= next_report:
+            stats = tgt_queue.write_latency.summary()
+            if stats['n'] != reported:
+                print(f"[OPC] Latência comando->escrita: n={stats['n']} "
+                      f"p50={stats['p50_ms']:.2f} ms p99={stats['p99_ms']:.2f} ms "
+                      f"max={stats['max_ms']:.2f} ms (coalescidos={tgt_queue.coalesced})")
+                reported = stats['n']
+            buf = pos_queue.stats()
+            lost = buf['dropped'] + buf['conflated']
+            if lost != reported_lost:
+                reported_lost = lost
+                print(f"[OPC] Buffer de telemetria ({buf['policy']}): "
+                      f"descartadas={buf['dropped']} conflacionadas={buf['conflated']}")
+            next_report = now + LATENCY_REPORT_PERIOD
+
+        # Com subscription, a posição chega pelo TelemetryHandler; sem I/O,
+        # a conexão é verificada periodicamente
+        if subscription is not None or now < next_poll:
+            session.check()
+            opc_io.end_cycle()
+            loop_timer.stop(t0)
+            continue
+
+        # Ler a posição atual do drone (um único Read) e colocar na fila pos_queue
         try:
+            if ack_node is not None:
+                x, y, z, ack = opc_io.read([dX, dY, dZ, ack_node])
+            else:
+                x, y, z = opc_io.read([dX, dY, dZ])
+                ack = None
             position = {
-                'x': dX.get_value(),
-                'y': dY.get_value(),
-                'z': dZ.get_value(),
-                'timestamp': time.time()
+                'x': x,
+                'y': y,
+                'z': z,
+                'timestamp': time.time(),
+                'mono': time.monotonic(),
+                'drone': 0,
+                'seq': next(seq),
             }
-            pos_queue.put(position)
+            if ack is not None:
+                if last_ack is not None and int(ack) != last_ack:
+                    position['cmd_id'] = int(ack)
+                    tracer.stamp(position['cmd_id'], 'clp.amostra', seq=position['seq'])
+                last_ack = int(ack)
+            pos_queue.put_nowait(position)
         except Exception as e:
             print("[OPC] Erro ao ler a posição do drone:", e)
-            break
+            raise
+
+        opc_io.end_cycle()
+        loop_timer.stop(t0)
+
+        # Próximo ciclo de leitura, sem acumular atraso
+        next_poll += POLL_PERIOD
+        if next_poll < now:
+            next_poll = now + POLL_PERIOD
+
+    if subscription is not None:
+        try:
+            subscription.delete()
+        except Exception:
+            pass
+
+
+class ClientSession:
+    """
+    Um cliente TCP conectado, com seu próprio buffer de envio limitado.
+    """
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.addr = writer.get_extra_info('peername')
+        self.send_queue = asyncio.Queue(CLIENT_SEND_BUFFER)
+        self.slow = False
+        self.binary = False         # protocolo binário negociado
+        self.trace = False          # cliente aceita quadros TRACE
+        self.decoder = protocolo.StreamDecoder(legacy_chunks=True)
+
+    def offer(self, position: dict):
+        """Enfileira uma amostra; um cliente com o buffer cheio é desconectado."""
+        if self.slow:
+            return
+        try:
+            self.send_queue.put_nowait(position)
+        except asyncio.QueueFull:
+            self.slow = True
+            print(f"[TCP] Cliente {self.addr} lento demais, desconectando")
+            self.writer.close()
 
-        time.sleep(0.5)  # Pequena pausa para evitar uso excessivo de CPU
-    print("[OPC] Encerrando conexão com o servidor OPC UA")
-    cliente.disconnect()
 
+class TelemetryServer:
+    """
+    Servidor TCP assíncrono que atende várias IHMs ao mesmo tempo.
 
-def thread_tcp(stop_event: threading.Event, pos_queue: queue.Queue, tgt_queue: queue.Queue):
-    HOST = 'localhost'
-    PORT = 65432
+    Cada amostra de telemetria é distribuída a todos os clientes conectados
+    e os comandos recebidos de qualquer cliente vão para o tgt_queue.
+    """
+    def __init__(self, stop_event: threading.Event, pos_queue: TelemetryBuffer, tgt_queue: CommandChannel):
+        self.stop_event = stop_event
+        self.pos_queue = pos_queue
+        self.tgt_queue = tgt_queue
+        self.clients = set()
+        self.handlers = set()
+        self.tracer = get_tracer("clp", enabled=TRACE_COMMANDS)
+        self.register_metrics()
 
-    # Criando o socket do servidor, que permanecerá aberto
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind((HOST, PORT))
-        s.listen()
-        
-        # Adiciona um timeout ao socket do servidor para que o s.accept() não
-        # bloqueie indefinidamente, permitindo que o loop verifique o stop_event.
-        s.settimeout(1.0) 
+    def register_metrics(self):
+        """Métricas lidas por callback: filas, descartes e clientes."""
+        pos, tgt = self.pos_queue, self.tgt_queue
+        REGISTRY.callback('sda_queue_depth', "Itens pendentes na fila",
+                          pos.qsize, {'queue': 'pos_queue'})
+        REGISTRY.callback('sda_queue_depth', "Itens pendentes na fila",
+                          tgt.qsize, {'queue': 'tgt_queue'})
+        REGISTRY.callback('sda_queue_depth', "Itens pendentes na fila",
+                          lambda: sum(c.send_queue.qsize() for c in list(self.clients)),
+                          {'queue': 'client_send'})
+        REGISTRY.callback('sda_telemetry_samples_total', "Amostras recebidas pelo buffer de telemetria",
+                          lambda: pos.received, kind='counter')
+        for reason in ('dropped', 'conflated'):
+            REGISTRY.callback('sda_samples_dropped_total', "Amostras perdidas pelo buffer",
+                              lambda reason=reason: getattr(pos, reason),
+                              {'buffer': 'pos_queue', 'reason': reason}, 'counter')
+        REGISTRY.callback('sda_commands_total', "Comandos de target recebidos",
+                          lambda: tgt.received, {'result': 'received'}, 'counter')
+        REGISTRY.callback('sda_commands_total', "Comandos de target recebidos",
+                          lambda: tgt.coalesced, {'result': 'coalesced'}, 'counter')
+        REGISTRY.callback('sda_tcp_clients', "Clientes TCP conectados", lambda: len(self.clients))
+        self.bytes_sent = REGISTRY.counter('sda_tcp_bytes_total', "Bytes trafegados no TCP",
+                                           {'direction': 'sent'})
+        self.bytes_received = REGISTRY.counter('sda_tcp_bytes_total', "Bytes trafegados no TCP",
+                                               {'direction': 'received'})
+        self.connections = REGISTRY.counter('sda_connections_total', "Conexões estabelecidas",
+                                            {'link': 'tcp_client'})
+        self.slow_clients = REGISTRY.counter('sda_tcp_slow_clients_total',
+                                             "Clientes desconectados por lentidão")
+
+    async def run(self):
+        server = await asyncio.start_server(self.handle_client, HOST, PORT)
         print(f"[TCP] Servidor escutando em {HOST}:{PORT}")
+        pump = asyncio.create_task(self.pump_telemetry())
+        async with server:
+            # Verifica periodicamente o stop_event
+            while not self.stop_event.is_set():
+                await asyncio.sleep(0.2)
+            pump.cancel()
+            for client in list(self.clients):
+                client.writer.close()
+            # Aguarda os handlers perceberem o fechamento das conexões
+            if self.handlers:
+                await asyncio.wait(self.handlers, timeout=1.0)
 
-        # Este loop garante que o servidor continue rodando e aceitando novas
-        # conexões mesmo depois que um cliente se desconectar.
-        while not stop_event.is_set():
+    async def pump_telemetry(self):
+        """Retira amostras do buffer de telemetria e as distribui aos clientes."""
+        loop = asyncio.get_running_loop()
+        while True:
             try:
-                # Espera por uma nova conexão.
-                # Se nenhuma conexão chegar em 1.0s, um socket.timeout será lançado.
-                conn, addr = s.accept()
-            except socket.timeout:
-                # Nenhuma conexão foi feita, simplesmente continue para a próxima
-                # iteração do loop, onde o stop_event será verificado novamente.
+                position = await loop.run_in_executor(None, self.pos_queue.get, True, 0.2)
+            except queue.Empty:
                 continue
-            
-            # Se uma conexão for bem-sucedida:
-            with conn:
-                print(f"[TCP] Conectado por {addr}")
-                conn.settimeout(0.5)
-
-                # Loop de comunicação com o cliente conectado
-                while not stop_event.is_set():
-                    # Obter novas posições e enviar via TCP
-                    try:
-                        position = pos_queue.get(block=False)
-                        msg = f"{position['x']},{position['y']},{position['z']},{position['timestamp']}\n"
-                        conn.sendall(msg.encode('utf-8'))
-                    except queue.Empty:
-                        pass
-                    except (ConnectionResetError, BrokenPipeError) as e:
-                        print(f"[TCP] Erro ao enviar dados: {e}")
-                        break # Encerra o loop de comunicação
-
-                    # Receber novos comandos via TCP
+            for sample in [position] + self.pos_queue.drain():
+                for client in list(self.clients):
+                    client.offer(sample)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = ClientSession(reader, writer)
+        self.clients.add(client)
+        self.handlers.add(asyncio.current_task())
+        self.connections.inc()
+        print(f"[TCP] Conectado por {client.addr} ({len(self.clients)} cliente(s))")
+
+        tasks = [asyncio.create_task(self.send_loop(client)),
+                 asyncio.create_task(self.receive_loop(client))]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.clients.discard(client)
+            self.handlers.discard(asyncio.current_task())
+            if client.slow:
+                self.slow_clients.inc()
+            writer.close()
+            print(f"[TCP] Cliente {client.addr} desconectado ({len(self.clients)} cliente(s))")
+
+    async def send_loop(self, client: ClientSession):
+        """Envia as amostras do buffer do cliente, agrupadas em lotes."""
+        while True:
+            batch = [await client.send_queue.get()]
+            while len(batch) < MAX_SAMPLES_PER_FRAME and not client.send_queue.empty():
+                batch.append(client.send_queue.get_nowait())
+
+            if client.binary:
+                msg = protocolo.encode_telemetry(batch)
+                if client.trace:
+                    # Um TRACE por amostra marcada, logo depois do TELEMETRY
+                    msg += b''.join(protocolo.encode_trace(s['cmd_id'], s['seq'], s['drone'])
+                                    for s in batch if 'cmd_id' in s)
+            else:
+                msg = protocolo.encode_csv_telemetry(batch)
+            try:
+                client.writer.write(msg)
+                self.bytes_sent.inc(len(msg))
+                await asyncio.wait_for(client.writer.drain(), CLIENT_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                print(f"[TCP] Cliente {client.addr} não consome os dados, desconectando")
+                self.slow_clients.inc()
+                return
+            except (ConnectionResetError, BrokenPipeError) as e:
+                print(f"[TCP] Erro ao enviar dados: {e}")
+                return
+
+    async def receive_loop(self, client: ClientSession):
+        """Recebe comandos do cliente e os publica no tgt_queue."""
+        while True:
+            try:
+                # Com um comando legado partido no buffer, espera o resto só até o timeout
+                data = await asyncio.wait_for(client.reader.read(4096),
+                                              client.decoder.chunk_timeout())
+            except asyncio.TimeoutError:
+                data = None
+            except (ConnectionResetError, BrokenPipeError) as e:
+                print(f"[TCP] Erro ao receber dados: {e}")
+                return
+            if data is None:
+                messages = client.decoder.take_chunk()
+            elif not data:
+                print("[TCP] Conexão encerrada pelo cliente")
+                return
+            else:
+                self.bytes_received.inc(len(data))
+                try:
+                    messages = client.decoder.feed(data)
+                except protocolo.ProtocolError as e:
+                    print(f"[TCP] Erro de protocolo com {client.addr}: {e}")
+                    return
+
+            for kind, content in messages:
+                if kind == 'hello' and ALLOW_BINARY_PROTOCOL:
+                    client.writer.write(protocolo.encode_hello_ack())
+                    client.binary = True
+                    client.trace = bool(content & protocolo.FEATURE_TRACE)
+                    client.decoder.legacy_chunks = False
+                    print(f"[TCP] Cliente {client.addr} usando protocolo binário")
+                elif kind == 'target':
+                    target = {'x': content['x'], 'y': content['y'], 'z': content['z']}
+                    if content['seq']:
+                        # O seq do TARGET é o ID do comando
+                        target['cmd_id'] = content['seq']
+                        self.tracer.stamp(content['seq'], 'clp.recebido')
+                    self.tgt_queue.put(target, content['drone'])
+                elif kind == 'csv' and len(content) == 3:
                     try:
-                        data = conn.recv(1024)
-                        if not data:
-                            print("[TCP] Conexão encerrada pelo cliente")
-                            break # Encerra o loop de comunicação
-                        
-                        msg = data.decode('utf-8').strip()
-                        parts = msg.split(',')
-                        if len(parts) == 3:
-                            try:
-                                target = {'x': float(parts[0]), 'y': float(parts[1]), 'z': float(parts[2])}
-                                tgt_queue.put(target)
-                            except ValueError:
-                                print("[TCP] Dados inválidos recebidos:", msg)
-                        else:
-                            print("[TCP] Formato de dados inválido:", msg)
-                    
-                    except socket.timeout:
-                        pass
-                    except (ConnectionResetError, BrokenPipeError) as e:
-                        print(f"[TCP] Erro ao receber dados: {e}")
-                        break # Encerra o loop de comunicação
-            # Esta mensagem é exibida quando o loop de comunicação com o cliente
-            # termina, e o servidor volta a aguardar uma nova conexão.
-            print(f"[TCP] Cliente {addr} desconectado. Aguardando nova conexão...")
+                        target = {'x': float(content[0]), 'y': float(content[1]), 'z': float(content[2])}
+                        self.tgt_queue.put(target)
+                    except ValueError:
+                        print("[TCP] Dados inválidos recebidos:", ','.join(content))
+                else:
+                    print("[TCP] Formato de dados inválido:", kind, content)
+
 
+def thread_tcp(stop_event: threading.Event, pos_queue: TelemetryBuffer, tgt_queue: CommandChannel):
+    server = TelemetryServer(stop_event, pos_queue, tgt_queue)
+    try:
+        asyncio.run(server.run())
+    except OSError as e:
+        print(f"[TCP] Erro no servidor TCP: {e}")
     print("[TCP] Servidor TCP encerrado.")
 
-        
+
 def main():
     # Definir evento que encerra as threads
     encerrar = threading.Event()
 
+    start_http_server(METRICS_PORT)
+
     # Definir filas para comunicação entre threads
-    pos_queue = queue.Queue(128)
-    tgt_queue = queue.Queue(128)
+    pos_queue = TelemetryBuffer(TELEMETRY_BUFFER_POLICY, TELEMETRY_BUFFER_SIZE)
+    tgt_queue = CommandChannel()
     
     # Iniciar a thread OPC UA
     t_opc = threading.Thread(target=thread_opcua, args=(encerrar, pos_queue, tgt_queue))
@@ -0,0 +1,130 @@
+"""
+Agendador de taxa fixa para loops de controle.
+"""
+import time
+from collections import deque
+
+from metricas import REGISTRY
+
+
+def _percentile(data: list, q: float) -> float:
+    return data[min(len(data) - 1, int(len(data) * q))]
+
+
+class FixedRateScheduler:
+    """
+    Mantém um loop em uma taxa fixa usando deadlines absolutos.
+
+    Os deadlines ficam numa grade start + k * período, então o tempo gasto
+    no corpo do loop não acumula atraso. Se um ciclo estoura o período, o
+    deadline perdido é contado e o agendador realinha na próxima posição
+    da grade em vez de tentar "recuperar" ciclos.
+
+    Uso:
+        sched = FixedRateScheduler(20.0, "RUN")
+        while True:
+            dt = sched.wait()   # tempo real desde o ciclo anterior
+            ...
+
+    Args:
+        rate_hz (float): taxa desejada.
+        name (str): prefixo das mensagens de relatório e rótulo `loop` das
+            métricas sda_loop_*.
+        report_period (float): intervalo (s) entre relatórios (0 desliga).
+        window (int): número de ciclos usados nos percentis.
+    """
+    def __init__(self, rate_hz: float, name: str = "RUN", report_period: float = 10.0,
+                 window: int = 1000):
+        self.period = 1.0 / rate_hz
+        self.name = name
+        self.report_period = report_period
+
+        self.cycle_times = deque(maxlen=window)     # duração de cada ciclo (s)
+        self.work_times = deque(maxlen=window)      # tempo gasto no corpo do loop (s)
+        self.jitters = deque(maxlen=window)         # atraso em relação ao deadline (s)
+        self.cycles = 0
+        self.missed = 0
+
+        labels = {'loop': name}
+        self._work_hist = REGISTRY.histogram('sda_loop_work_seconds',
+                                             "Tempo gasto no corpo do loop", labels)
+        self._cycle_hist = REGISTRY.histogram('sda_loop_cycle_seconds',
+                                              "Duração de cada ciclo do loop", labels)
+        self._missed_counter = REGISTRY.counter('sda_loop_deadlines_missed_total',
+                                                "Deadlines perdidos pelo loop", labels)
+
+        now = time.monotonic()
+        self.start = now
+        self.last_tick = now
+        self.next_deadline = now + self.period
+        self._next_report = now + report_period
+
+    def wait(self) -> float:
+        """Dorme até o próximo deadline e retorna o tempo real do ciclo."""
+        now = time.monotonic()
+        self.work_times.append(now - self.last_tick)
+        self._work_hist.observe(now - self.last_tick)
+
+        if now > self.next_deadline:
+            # Deadline perdido: segue imediatamente e realinha o próximo
+            # deadline na grade, sem acumular atraso
+            self.missed += 1
+            self._missed_counter.inc()
+            tick = now
+            self.jitters.append(tick - self.next_deadline)
+            k = int((tick - self.start) / self.period) + 1
+            self.next_deadline = self.start + k * self.period
+        else:
+            time.sleep(self.next_deadline - now)
+            tick = time.monotonic()
+            self.jitters.append(max(0.0, tick - self.next_deadline))
+            self.next_deadline += self.period
+
+        dt = tick - self.last_tick
+        self.cycle_times.append(dt)
+        self._cycle_hist.observe(dt)
+        self.cycles += 1
+        self.last_tick = tick
+
+        if self.report_period and tick >= self._next_report:
+            self._next_report = tick + self.report_period
+            print(self.report())
+        return dt
+
+    def reset(self):
+        """
+        Reinicia a grade de deadlines a partir de agora, sem contar o
+        intervalo desde o último ciclo como estouro (use ao voltar de uma
+        pausa intencional do loop).
+        """
+        now = time.monotonic()
+        self.start = now
+        self.last_tick = now
+        self.next_deadline = now + self.period
+
+    def stats(self) -> dict:
+        """Estatísticas dos ciclos recentes (tempos em ms)."""
+        cycles = sorted(self.cycle_times)
+        work = sorted(self.work_times)
+        jitter = sorted(self.jitters)
+        if not cycles:
+            return {'cycles': 0, 'missed': 0}
+        return {
+            'cycles': self.cycles,
+            'missed': self.missed,
+            'period_ms': self.period * 1000.0,
+            'cycle_p50_ms': _percentile(cycles, 0.50) * 1000.0,
+            'cycle_p99_ms': _percentile(cycles, 0.99) * 1000.0,
+            'cycle_max_ms': cycles[-1] * 1000.0,
+            'work_p50_ms': _percentile(work, 0.50) * 1000.0,
+            'work_p99_ms': _percentile(work, 0.99) * 1000.0,
+            'jitter_p99_ms': _percentile(jitter, 0.99) * 1000.0,
+        }
+
+    def report(self) -> str:
+        st = self.stats()
+        if not st['cycles']:
+            return f"[{self.name}] Nenhum ciclo executado"
+        return (f"[{self.name}] Ciclo p50={st['cycle_p50_ms']:.1f} ms p99={st['cycle_p99_ms']:.1f} ms "
+                f"(alvo {st['period_ms']:.1f} ms), trabalho p99={st['work_p99_ms']:.1f} ms, "
+                f"jitter p99={st['jitter_p99_ms']:.2f} ms, deadlines perdidos={st['missed']}/{st['cycles']}")
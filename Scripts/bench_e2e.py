@@ -0,0 +1,513 @@
+"""
+Benchmark ponta a ponta das cadeias bridge -> CLP -> IHM e gateway -> MES.
+
+Sobe os componentes reais como subprocessos contra os stand-ins
+(standin/), conecta clientes sinotico.TCPClient ao CLP e envia comandos de
+target pelo mesmo caminho da IHM. Mede:
+
+* comando -> movimento: do envio do target até a primeira pose diferente
+  publicada pelo bridge e até a primeira amostra diferente na IHM;
+* frescor: idade de cada pose nova quando chega à IHM e quando é lida
+  pelo MES, contada a partir da escrita da pose pelo bridge;
+* amostras/s em cada salto (bridge, entrada e saída do CLP, IHM, gateway,
+  MES);
+* CPU e RSS de cada processo (via /proc, só Linux).
+
+Os componentes rodam sem alteração: cada um é iniciado por este script
+(--componente), que ajusta constantes de configuração e instala sondas
+que contam chamadas e registram poses. Poses são casadas entre processos
+pelo valor exato (x, y, z) e os tempos usam time.monotonic(), que no
+Linux é comum a todos os processos.
+
+Uso:
+    python bench_e2e.py [--drones 1] [--clientes 1] [--bridge-hz 20]
+                        [--clp-ms 50] [--gateway-ms 50] [--mes-periodo 1.0]
+                        [--comandos 4] [--intervalo 5.0] [--aquecimento 3.0]
+                        [--json resultado.json]
+"""
+import ast
+import functools
+import importlib
+import json
+import os
+import queue
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+from canais import LatencyStats
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+OPC_PORT = 53530
+GATEWAY_PORT = 4841
+CLP_PORT = 65432
+STARTUP_TIMEOUT = 15.0      # espera máxima por cada porta (s)
+STOP_TIMEOUT = 5.0          # espera após o SIGINT antes de matar o processo (s)
+PROC_SAMPLE_PERIOD = 0.5    # período de amostragem de CPU/RSS (s)
+MOTION_EPS = 1e-3           # deslocamento mínimo para contar como movimento (m)
+POSE_IDS = ('Drone.DroneX', 'Drone.DroneY', 'Drone.DroneZ')
+STATS_ENV = 'BENCH_E2E_STATS'
+
+
+############################
+# Sondas (rodam dentro de cada componente)
+############################
+class Probe:
+    """
+    Contadores por segundo e séries de poses de um componente, gravados
+    em JSON no arquivo indicado por BENCH_E2E_STATS ao encerrar.
+    """
+    def __init__(self):
+        self.counts = defaultdict(Counter)      # nome -> {segundo: n}
+        self.poses = []                         # [mono, x, y, z]
+        self.lock = threading.Lock()
+
+    def count(self, name: str, n: int = 1):
+        with self.lock:
+            self.counts[name][int(time.monotonic())] += n
+
+    def pose(self, point, t: float):
+        with self.lock:
+            if not self.poses or self.poses[-1][1:] != list(point):
+                self.poses.append([t, *point])
+
+    def wrap(self, owner, attr: str, on_call):
+        """
+        Substitui owner.attr por um wrapper que chama on_call(args,
+        resultado, t), com t = instante em que a chamada começou.
+        """
+        original = getattr(owner, attr)
+
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            t = time.monotonic()
+            result = original(*args, **kwargs)
+            on_call(args, result, t)
+            return result
+        setattr(owner, attr, wrapper)
+
+    def dump(self, path: str):
+        with self.lock:
+            data = {'counts': {name: dict(c) for name, c in self.counts.items()},
+                    'poses': self.poses}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+
+
+def _install_probes(name: str, probe: Probe):
+    if name == 'brigde':
+        from opc_helpers import BatchIO
+
+        def on_write(args, _, t):
+            _, nodes, values = args[:3]
+            probe.count('values', len(values))
+            pose = {}
+            for node, value in zip(nodes, values):
+                if node.nodeid.Identifier in POSE_IDS:
+                    pose[node.nodeid.Identifier] = value
+            if len(pose) == 3:
+                probe.count('samples')
+                probe.pose([pose[k] for k in POSE_IDS], t)
+        probe.wrap(BatchIO, 'write', on_write)
+
+    elif name == 'CLP':
+        import canais
+        import protocolo
+        probe.wrap(canais.TelemetryBuffer, 'put', lambda args, _, t: probe.count('samples_in'))
+        for attr in ('encode_telemetry', 'encode_csv_telemetry'):
+            probe.wrap(protocolo, attr, lambda args, _, t: probe.count('samples_out', len(args[0])))
+
+    elif name == 'gateway':
+        import gateway
+        probe.wrap(gateway.MirrorHandler, 'datachange_notification',
+                   lambda args, _, t: probe.count('updates'))
+
+    elif name == 'mes':
+        from historico_opc import ChangeMerger
+        from opc_helpers import BatchIO
+
+        def on_read(args, values, t):
+            # O MES lê [dx, dy, dz, tx, ty, tz]
+            probe.count('samples')
+            probe.pose(values[:3], t)
+
+        def on_feed(args, samples, t):
+            # Mudanças da subscription ou do histórico: [(instante, [dx, dy, dz, tx, ty, tz]), ...]
+            for _, values in samples:
+                on_read(args, values, t)
+        probe.wrap(BatchIO, 'read', on_read)
+        probe.wrap(ChangeMerger, 'feed', on_feed)
+
+
+def run_component(args: list):
+    """Entrada dos subprocessos: --componente NOME [--frota N] [CHAVE=VALOR ...]."""
+    name = args[0]
+    fleet = int(_option(args, '--frota', 0))
+    if name == 'brigde':
+        from standin.sim import install
+        install(fleet)
+    module = importlib.import_module(name)
+    for item in args[1:]:
+        key, value = item.split('=', 1)
+        setattr(module, key, ast.literal_eval(value))
+    if name == 'brigde' and fleet:
+        module.FLEET_MODE = True
+
+    # Os argumentos do subprocesso são do benchmark, não do componente
+    sys.argv = [f"{name}.py"]
+    probe = Probe()
+    _install_probes(name, probe)
+    try:
+        module.main()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        probe.dump(os.environ[STATS_ENV])
+
+
+############################
+# Processos
+############################
+class Component:
+    """Um subprocesso com log próprio e amostragem de CPU/RSS via /proc."""
+    def __init__(self, name: str, cmd: list, workdir: str):
+        self.name = name
+        self.stats_path = os.path.join(workdir, f"{name}.json")
+        self.log_path = os.path.join(workdir, f"{name}.log")
+        env = dict(os.environ, PYTHONPATH=SCRIPTS_DIR, PYTHONUNBUFFERED='1')
+        env[STATS_ENV] = self.stats_path
+        self.log = open(self.log_path, 'w', encoding='utf-8')
+        self.proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=self.log,
+                                     stderr=subprocess.STDOUT)
+        self.cpu = []       # (mono, segundos de CPU)
+        self.rss = []       # kB
+
+    def sample(self):
+        try:
+            with open(f"/proc/{self.proc.pid}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+            with open(f"/proc/{self.proc.pid}/status") as f:
+                rss = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+        except (OSError, StopIteration, ValueError, IndexError):
+            return
+        self.cpu.append((time.monotonic(), cpu))
+        self.rss.append(rss)
+
+    def usage(self) -> dict:
+        if len(self.cpu) < 2:
+            return {'cpu_pct': None, 'rss_mb_mean': None, 'rss_mb_max': None}
+        (t0, c0), (t1, c1) = self.cpu[0], self.cpu[-1]
+        return {
+            'cpu_pct': 100.0 * (c1 - c0) / (t1 - t0),
+            'rss_mb_mean': sum(self.rss) / len(self.rss) / 1024.0,
+            'rss_mb_max': max(self.rss) / 1024.0,
+        }
+
+    def stop(self):
+        if self.proc.poll() is None:
+            self.proc.send_signal(signal.SIGINT)
+            try:
+                self.proc.wait(STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+        self.log.close()
+
+    def probe_data(self) -> dict:
+        try:
+            with open(self.stats_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'counts': {}, 'poses': []}
+
+
+def component_cmd(name: str, fleet: int, overrides: dict) -> list:
+    cmd = [sys.executable, os.path.join(SCRIPTS_DIR, 'bench_e2e.py'), '--componente', name]
+    if fleet:
+        cmd += ['--frota', str(fleet)]
+    return cmd + [f"{key}={value!r}" for key, value in overrides.items()]
+
+
+def wait_port(port: int, proc: Component):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.proc.poll() is not None:
+            raise RuntimeError(f"{proc.name} encerrou na partida (ver {proc.log_path})")
+        try:
+            socket.create_connection(('localhost', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Porta {port} não abriu em {STARTUP_TIMEOUT} s ({proc.name})")
+
+
+############################
+# IHM
+############################
+class HmiProbe:
+    """Um cliente sinotico.TCPClient e as amostras que ele recebeu."""
+    def __init__(self):
+        import sinotico
+        self.events = queue.Queue()
+        self.client = sinotico.TCPClient('localhost', CLP_PORT, self.events)
+        self.samples = []       # (mono de chegada, x, y, z)
+        self.thread = threading.Thread(target=self._drain, daemon=True)
+
+    def start(self):
+        if not self.client.connect():
+            raise RuntimeError("Falha ao conectar ao CLP")
+        self.client.start_threads()
+        self.thread.start()
+
+    def _drain(self):
+        while not self.client.stop_event.is_set():
+            try:
+                event = self.events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if event['type'] == 'position_update':
+                p = event['payload']
+                self.samples.append((time.monotonic(), float(p['x']), float(p['y']), float(p['z'])))
+
+    def stop(self):
+        self.client.stop()
+
+
+############################
+# Métricas
+############################
+def _rate(counts: dict, t0: float, t1: float) -> float:
+    total = sum(n for sec, n in counts.items() if t0 <= int(sec) < int(t1))
+    return total / max(int(t1) - int(t0), 1)
+
+
+def _first_motion(samples, t_cmd: float, t_end: float):
+    """Instante da primeira amostra após t_cmd que difere da pose em t_cmd."""
+    before = None
+    for t, *p in samples:
+        if t <= t_cmd:
+            before = p
+        elif t < t_end:
+            if before is None:
+                before = p
+            elif max(abs(a - b) for a, b in zip(p, before)) > MOTION_EPS:
+                return t
+        else:
+            break
+    return None
+
+
+def _freshness(samples, first_write: dict, stats: LatencyStats, t0: float, t1: float):
+    """Idade de cada pose nova (chegada menos primeira escrita pelo bridge)."""
+    last = None
+    for t, *p in samples:
+        key = tuple(p)
+        if key == last:
+            continue
+        last = key
+        written = first_write.get(key)
+        if written is not None and t0 <= t < t1 and t >= written:
+            stats.record(t - written)
+
+
+def run_benchmark(drones: int, clients: int, bridge_hz: float, clp_ms: float,
+                  gateway_ms: float, mes_period: float, commands: int,
+                  interval: float, warmup: float) -> dict:
+    workdir = tempfile.mkdtemp(prefix='bench_e2e_')
+    procs = {}
+    hmis = []
+    extra_io = None
+    try:
+        server_cmd = [sys.executable, '-m', 'standin', 'servidor']
+        if drones > 1:
+            server_cmd += ['--frota', str(drones)]
+        procs['servidor'] = Component('servidor', server_cmd, workdir)
+        wait_port(OPC_PORT, procs['servidor'])
+
+        fleet = drones if drones > 1 else 0
+        dt = 1.0 / bridge_hz
+        procs['brigde'] = Component('brigde', component_cmd(
+            'brigde', fleet, {'DT': dt, 'MAX_DT': 4 * dt}), workdir)
+        procs['CLP'] = Component('CLP', component_cmd('CLP', 0, {
+            'PUBLISHING_INTERVAL_MS': clp_ms, 'SAMPLING_INTERVAL_MS': clp_ms / 2}), workdir)
+        procs['gateway'] = Component('gateway', component_cmd('gateway', 0, {
+            'PUBLISHING_INTERVAL_MS': gateway_ms, 'SAMPLING_INTERVAL_MS': gateway_ms / 2}), workdir)
+        wait_port(CLP_PORT, procs['CLP'])
+        wait_port(GATEWAY_PORT, procs['gateway'])
+        procs['mes'] = Component('mes', component_cmd('mes', 0, {'MES_POLL_PERIOD': mes_period}),
+                                 workdir)
+
+        for _ in range(clients):
+            hmi = HmiProbe()
+            hmi.start()
+            hmis.append(hmi)
+
+        if drones > 1:
+            # Os demais drones da frota recebem os alvos por escrita OPC direta
+            from opcua import Client
+            from opc_helpers import BatchIO
+            extra = Client(f"opc.tcp://localhost:{OPC_PORT}/OPCUA/SimulationServer")
+            extra.connect()
+            root = extra.get_objects_node()
+            extra_nodes = []
+            for k in range(2, drones + 1):
+                folder = root.get_child([f"3:Drone{k}"])
+                extra_nodes += [folder.get_child([f"3:Target{a}"]) for a in "XYZ"]
+            extra_io = (extra, BatchIO(extra, "BENCH", report_period=0), extra_nodes)
+
+        sampler_stop = threading.Event()
+
+        def sampler():
+            while not sampler_stop.is_set():
+                for proc in procs.values():
+                    proc.sample()
+                sampler_stop.wait(PROC_SAMPLE_PERIOD)
+
+        time.sleep(warmup)
+        sampler_thread = threading.Thread(target=sampler, daemon=True)
+        sampler_thread.start()
+
+        import sinotico
+        stations = list(sinotico.STATIONS.items())
+        t_start = time.monotonic()
+        sent = []
+        for i in range(commands):
+            station, coords = stations[i % len(stations)]
+            target = dict(coords, station=station)
+            t_cmd = time.monotonic()
+            hmis[0].client.send_target(target)
+            if extra_io is not None:
+                _, io, nodes = extra_io
+                io.write(nodes, [target[a] for _ in range(drones - 1) for a in 'xyz'])
+            sent.append(t_cmd)
+            time.sleep(interval)
+        t_end = time.monotonic()
+        sampler_stop.set()
+        sampler_thread.join()
+    finally:
+        for hmi in hmis:
+            hmi.stop()
+        if extra_io is not None:
+            extra_io[0].disconnect()
+        for name in ('mes', 'gateway', 'CLP', 'brigde', 'servidor'):
+            if name in procs:
+                procs[name].stop()
+
+    data = {name: proc.probe_data() for name, proc in procs.items()}
+    bridge_poses = data['brigde']['poses']
+    first_write = {}
+    for t, *p in bridge_poses:
+        first_write.setdefault(tuple(p), t)
+
+    motion_bridge, motion_hmi = LatencyStats(10000), LatencyStats(10000)
+    for i, t_cmd in enumerate(sent):
+        t_next = sent[i + 1] if i + 1 < len(sent) else t_end
+        t = _first_motion([(t, *p) for t, *p in bridge_poses], t_cmd, t_next)
+        if t is not None:
+            motion_bridge.record(t - t_cmd)
+        t = _first_motion(hmis[0].samples, t_cmd, t_next)
+        if t is not None:
+            motion_hmi.record(t - t_cmd)
+
+    fresh_hmi, fresh_mes = LatencyStats(100000), LatencyStats(100000)
+    for hmi in hmis:
+        _freshness(hmi.samples, first_write, fresh_hmi, t_start, t_end)
+    _freshness([(t, *p) for t, *p in data['mes']['poses']], first_write, fresh_mes,
+               t_start, t_end)
+
+    window = t_end - t_start
+    hmi_rate = sum(sum(1 for t, *_ in hmi.samples if t_start <= t < t_end) for hmi in hmis)
+    counts = {name: d['counts'] for name, d in data.items()}
+    return {
+        'params': {'drones': drones, 'clients': clients, 'bridge_hz': bridge_hz,
+                   'clp_publishing_ms': clp_ms, 'gateway_publishing_ms': gateway_ms,
+                   'mes_period_s': mes_period, 'commands': commands,
+                   'interval_s': interval, 'warmup_s': warmup},
+        'window_s': window,
+        'command_to_motion': {'bridge': motion_bridge.summary(), 'hmi': motion_hmi.summary()},
+        'freshness': {'hmi': fresh_hmi.summary(), 'mes': fresh_mes.summary()},
+        'samples_per_s': {
+            'bridge_poses': _rate(counts['brigde'].get('samples', {}), t_start, t_end),
+            'bridge_values': _rate(counts['brigde'].get('values', {}), t_start, t_end),
+            'clp_in': _rate(counts['CLP'].get('samples_in', {}), t_start, t_end),
+            'clp_out': _rate(counts['CLP'].get('samples_out', {}), t_start, t_end),
+            'hmi_total': hmi_rate / window,
+            'gateway_updates': _rate(counts['gateway'].get('updates', {}), t_start, t_end),
+            'mes_reads': _rate(counts['mes'].get('samples', {}), t_start, t_end),
+        },
+        'processes': {name: proc.usage() for name, proc in procs.items()},
+        'workdir': workdir,
+    }
+
+
+def _fmt(summary: dict) -> str:
+    if summary['p50_ms'] is None:
+        return f"n={summary['n']} (sem amostras)"
+    return (f"n={summary['n']} p50={summary['p50_ms']:.1f} ms "
+            f"p99={summary['p99_ms']:.1f} ms max={summary['max_ms']:.1f} ms")
+
+
+def print_report(result: dict):
+    print(f"--- Benchmark ponta a ponta ({result['window_s']:.1f} s medidos) ---")
+    print(f"Parâmetros: {result['params']}")
+    for hop, summary in result['command_to_motion'].items():
+        print(f"Comando -> movimento ({hop}): {_fmt(summary)}")
+    for hop, summary in result['freshness'].items():
+        print(f"Frescor ({hop}): {_fmt(summary)}")
+    for hop, rate in result['samples_per_s'].items():
+        print(f"{hop:>16}: {rate:8.1f} /s")
+    for name, usage in result['processes'].items():
+        if usage['cpu_pct'] is None:
+            print(f"{name:>16}: sem dados de /proc")
+        else:
+            print(f"{name:>16}: CPU {usage['cpu_pct']:5.1f}%  RSS médio {usage['rss_mb_mean']:.1f} MB "
+                  f"(máx {usage['rss_mb_max']:.1f} MB)")
+    print(f"Logs dos processos em {result['workdir']}")
+
+
+def _option(args: list, name: str, default):
+    if name not in args:
+        return default
+    i = args.index(name)
+    value = args[i + 1]
+    del args[i:i + 2]
+    return value
+
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] == '--componente':
+        run_component(args[1:])
+        return
+
+    json_path = _option(args, '--json', None)
+    params = dict(
+        drones=int(_option(args, '--drones', 1)),
+        clients=int(_option(args, '--clientes', 1)),
+        bridge_hz=float(_option(args, '--bridge-hz', 20.0)),
+        clp_ms=float(_option(args, '--clp-ms', 50.0)),
+        gateway_ms=float(_option(args, '--gateway-ms', 50.0)),
+        mes_period=float(_option(args, '--mes-periodo', 1.0)),
+        commands=int(_option(args, '--comandos', 4)),
+        interval=float(_option(args, '--intervalo', 5.0)),
+        warmup=float(_option(args, '--aquecimento', 3.0)),
+    )
+    if args:
+        print(f"Argumentos não reconhecidos: {' '.join(args)}")
+        sys.exit(1)
+    result = run_benchmark(**params)
+    print_report(result)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"Resultado salvo em {json_path}")
+
+
+if __name__ == "__main__":
+    main()
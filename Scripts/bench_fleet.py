@@ -0,0 +1,149 @@
+"""
+Benchmark do passo de controle do bridge em modo frota.
+
+Compara, para frotas de tamanhos crescentes, o custo por ciclo em Python
+do passo escalar (step_towards chamado drone a drone) com o passo
+vetorizado (step_towards_np sobre um array (N, 3)), além de montar as
+requisições OPC UA do ciclo (3 Writes por drone contra um Write único) e
+contar as chamadas à API `sim` de um ciclo com todos os drones em
+movimento, no stand-in FakeSim: uma por objeto (setObjectPosition por
+target, getObjectPosition por drone) contra uma callScriptFunction do
+script fleet_bridge.lua. Não precisa de CoppeliaSim nem de servidor OPC UA.
+
+O custo de rede é estimado multiplicando o número de requisições por um
+RTT configurável: --rtt-ms para o OPC UA (padrão 0,5 ms) e --zmq-ms para a
+API ZMQ do CoppeliaSim (padrão 0,2 ms). O tempo de execução das chamadas
+dentro do simulador não entra na conta.
+
+Uso:
+    python bench_fleet.py [N ...] [--rtt-ms 0.5] [--zmq-ms 0.2] [--json]
+"""
+import json
+import random
+import sys
+import timeit
+
+import numpy as np
+from opcua import ua
+
+from brigde import DT, TARGET_SPEED, FleetSim, step_towards, step_towards_np
+from standin.sim import FakeSim
+
+DEFAULT_SIZES = [1, 10, 50, 100, 200]
+SIM_CYCLES = 5                  # ciclos contados por tamanho de frota
+
+
+def write_request(values) -> ua.WriteParameters:
+    """Monta um Write com um WriteValue por valor (como o BatchIO)."""
+    params = ua.WriteParameters()
+    for i, value in enumerate(values):
+        wv = ua.WriteValue()
+        wv.NodeId = ua.NodeId(i, 3)
+        wv.AttributeId = ua.AttributeIds.Value
+        wv.Value = ua.DataValue(ua.Variant(value, ua.VariantType.Double))
+        params.NodesToWrite.append(wv)
+    return params
+
+
+def sim_calls_per_cycle(n: int, batched: bool) -> float:
+    """Chamadas à API sim por ciclo do run_fleet, com todos os drones se movendo."""
+    sim = FakeSim(fleet=n, fleet_script=batched)
+    sim.startSimulation()
+    fleet = FleetSim(sim, sim.pairs[1:], batched=batched)
+    rnd = random.Random(n)
+    goal = np.array([[rnd.uniform(5, 10), rnd.uniform(5, 10), 1.0] for _ in range(n)])
+    p_target = fleet.read_targets()
+    before = sum(sim.calls.values())
+    for _ in range(SIM_CYCLES):
+        p_next = step_towards_np(p_target, goal, TARGET_SPEED, DT)
+        moving = np.flatnonzero(np.any(p_next != p_target, axis=1))
+        fleet.step(moving, p_next[moving])
+        p_target = p_next
+    return (sum(sim.calls.values()) - before) / SIM_CYCLES
+
+
+def bench_size(n: int, rtt_ms: float, zmq_ms: float, repeat: int = 5) -> dict:
+    rnd = random.Random(n)
+    pos = [[rnd.uniform(-2, 2), rnd.uniform(-2, 2), rnd.uniform(0.5, 1.5)] for _ in range(n)]
+    goal = [[rnd.uniform(-2, 2), rnd.uniform(-2, 2), rnd.uniform(0.5, 1.5)] for _ in range(n)]
+    pos_np, goal_np = np.array(pos), np.array(goal)
+
+    def scalar_step():
+        for i in range(n):
+            step_towards(pos[i], goal[i], TARGET_SPEED, DT)
+
+    def vector_step():
+        step_towards_np(pos_np, goal_np, TARGET_SPEED, DT)
+
+    def scalar_requests():
+        for i in range(n):
+            for v in goal[i]:
+                write_request([v])
+
+    def vector_requests():
+        write_request(goal_np.ravel().tolist())
+
+    def best(fn):
+        number = max(1, 2000 // n)
+        return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+    requests_scalar = 6 * n     # 3 leituras + 3 escritas por drone
+    requests_vector = 2         # um Read + um Write
+    result = {
+        'drones': n,
+        'step_scalar_us': best(scalar_step),
+        'step_vector_us': best(vector_step),
+        'pack_scalar_us': best(scalar_requests),
+        'pack_vector_us': best(vector_requests),
+        'opc_requests_scalar': requests_scalar,
+        'opc_requests_vector': requests_vector,
+        'sim_calls_per_object': sim_calls_per_cycle(n, batched=False),
+        'sim_calls_batched': sim_calls_per_cycle(n, batched=True),
+        'rtt_ms': rtt_ms,
+        'zmq_ms': zmq_ms,
+    }
+    # Custo estimado do ciclo: Python + round trips sequenciais (OPC UA e ZMQ)
+    scalar = (result['step_scalar_us'] + result['pack_scalar_us']) / 1000 + requests_scalar * rtt_ms
+    vector = (result['step_vector_us'] + result['pack_vector_us']) / 1000 + requests_vector * rtt_ms
+    result['cycle_scalar_ms'] = scalar + result['sim_calls_per_object'] * zmq_ms
+    result['cycle_vector_ms'] = vector + result['sim_calls_per_object'] * zmq_ms
+    result['cycle_batched_ms'] = vector + result['sim_calls_batched'] * zmq_ms
+    return result
+
+
+def _option(args: list, name: str, default: float) -> float:
+    if name not in args:
+        return default
+    i = args.index(name)
+    value = float(args[i + 1])
+    del args[i:i + 2]
+    return value
+
+
+def main():
+    args = sys.argv[1:]
+    as_json = '--json' in args
+    rtt_ms = _option(args, '--rtt-ms', 0.5)
+    zmq_ms = _option(args, '--zmq-ms', 0.2)
+    sizes = [int(a) for a in args if a != '--json'] or DEFAULT_SIZES
+    results = [bench_size(n, rtt_ms, zmq_ms) for n in sizes]
+
+    if as_json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"Passo (us por ciclo), requisições OPC UA e chamadas sim por ciclo, e ciclo estimado "
+          f"com RTT de {rtt_ms} ms por requisição OPC UA e {zmq_ms} ms por chamada sim")
+    print(f"{'N':>5} {'passo esc.':>11} {'passo vet.':>11} {'us/drone':>9} "
+          f"{'req esc.':>9} {'req vet.':>9} {'sim obj.':>9} {'sim lote':>9} "
+          f"{'ciclo esc.':>11} {'vet.+obj.':>11} {'vet.+lote':>11}")
+    for r in results:
+        print(f"{r['drones']:>5} {r['step_scalar_us']:>11.1f} {r['step_vector_us']:>11.1f} "
+              f"{r['step_vector_us'] / r['drones']:>9.3f} "
+              f"{r['opc_requests_scalar']:>9} {r['opc_requests_vector']:>9} "
+              f"{r['sim_calls_per_object']:>9.0f} {r['sim_calls_batched']:>9.0f} "
+              f"{r['cycle_scalar_ms']:>9.1f}ms {r['cycle_vector_ms']:>9.1f}ms "
+              f"{r['cycle_batched_ms']:>9.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Benchmark do gateway com várias fontes.
+
+Sobe no mesmo processo N stand-ins do SimulationServer (standin/servidor.py,
+em portas consecutivas a partir de BASE_PORT), cada um com M pastas de
+drone, e o gateway real (build_gateway + start_workers) espelhando todos
+eles por subscription. Um escritor grava a pose de todos os drones a --hz,
+com SourceTimestamp, direto no espaço de endereços de cada stand-in (sem
+cliente no caminho). Para cada N mede:
+
+* atualizações espelhadas por segundo e a fração das escritas que chegou
+  ao espelho;
+* atraso origem -> espelho (do SourceTimestamp até a escrita no espelho);
+* CPU do processo (inclui os stand-ins e o escritor).
+
+Uso:
+    python bench_gateway.py [N ...] [--drones 4] [--hz 20] [--workers 4]
+                            [--duracao 5] [--aquecimento 2] [--json resultado.json]
+"""
+import json
+import logging
+import math
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from opcua import ua
+
+import gateway
+from canais import LatencyStats
+from standin.servidor import build_server
+
+DEFAULT_SIZES = [1, 2, 4, 8, 16]
+BASE_PORT = 53700
+GATEWAY_PORT = 48410
+POSE_VARS = ("DroneX", "DroneY", "DroneZ")
+LAG_SAMPLES = 200000            # amostras de atraso guardadas por medição
+CONNECT_TIMEOUT = 30.0          # espera máxima pelas conexões do gateway (s)
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def write_poses(fleets: list, hz: float, stop_event: threading.Event, written: list):
+    """Grava a pose de todos os drones a hz, com SourceTimestamp do instante da escrita."""
+    period = 1.0 / hz
+    deadline = time.monotonic()
+    tick = 0
+    while not stop_event.is_set():
+        for fleet in fleets:
+            for k, nodes in enumerate(fleet):
+                for axis, node in enumerate(nodes):
+                    value = math.sin(0.1 * tick + k + axis)
+                    node.set_value(ua.DataValue(ua.Variant(value, ua.VariantType.Double),
+                                                sourceTimestamp=datetime.utcnow()))
+                    written[0] += 1
+        tick += 1
+        deadline += period
+        stop_event.wait(max(0.0, deadline - time.monotonic()))
+
+
+def run_size(n_sources: int, drones: int, hz: float, workers: int,
+             duration: float, warmup: float) -> dict:
+    servers, fleets, sources = [], [], []
+    for k in range(n_sources):
+        url = f"opc.tcp://127.0.0.1:{BASE_PORT + k}/OPCUA/SimulationServer"
+        server, folders = build_server(url, fleet=drones)
+        server.start()
+        servers.append(server)
+        fleets.append([[folders[f"Drone{d}"][name] for name in POSE_VARS]
+                       for d in range(1, drones + 1)])
+        sources.append({"cell": f"Cell{k + 1}", "url": url, "drones": ["Drone{k}"], "count": drones})
+
+    gw_server, mirrors, _ = gateway.build_gateway(
+        sources, f"opc.tcp://127.0.0.1:{GATEWAY_PORT}/freeopcua/server/", history_points=0)
+    gw_server.start()
+    stop_event = threading.Event()
+    threads = gateway.start_workers(mirrors, workers, stop_event)
+
+    # Atraso de cada escrita no espelho (sonda no MirrorHandler.apply)
+    lag = [LatencyStats(LAG_SAMPLES)]
+    original_apply = gateway.MirrorHandler.apply
+
+    def apply(self, mirror, dv):
+        original_apply(self, mirror, dv)
+        if dv.SourceTimestamp is not None:
+            lag[0].record((datetime.utcnow() - dv.SourceTimestamp).total_seconds())
+    gateway.MirrorHandler.apply = apply
+
+    writer_stop = threading.Event()
+    written = [0]
+    writer = threading.Thread(target=write_poses, args=(fleets, hz, writer_stop, written), daemon=True)
+    try:
+        t_connect = time.monotonic()
+        while not all(m.session.connected and m.subscription is not None for m in mirrors):
+            if time.monotonic() - t_connect > CONNECT_TIMEOUT:
+                raise RuntimeError("gateway não conectou a todas as fontes")
+            time.sleep(0.05)
+        connect_s = time.monotonic() - t_connect
+
+        writer.start()
+        time.sleep(warmup)
+        lag[0] = LatencyStats(LAG_SAMPLES)
+        updates0 = sum(m.handler.updates for m in mirrors)
+        written0, cpu0, t0 = written[0], _cpu_seconds(), time.monotonic()
+        time.sleep(duration)
+        t1 = time.monotonic()
+        updates = sum(m.handler.updates for m in mirrors) - updates0
+        writes = written[0] - written0
+        cpu = _cpu_seconds() - cpu0
+    finally:
+        writer_stop.set()
+        writer.join(timeout=5.0)
+        gateway.MirrorHandler.apply = original_apply
+        stop_event.set()
+        for thread in threads:
+            thread.join(timeout=5.0)
+        gw_server.stop()
+        for server in servers:
+            server.stop()
+
+    elapsed = t1 - t0
+    return {
+        'sources': n_sources,
+        'drones': n_sources * drones,
+        'connect_s': connect_s,
+        'writes_per_s': writes / elapsed,
+        'updates_per_s': updates / elapsed,
+        'delivered': updates / writes if writes else None,
+        'lag': lag[0].summary(),
+        'cpu_pct': 100.0 * cpu / elapsed,
+    }
+
+
+def print_report(result: dict):
+    p = result['params']
+    print(f"--- Gateway: {p['drones']} drone(s) por fonte a {p['hz']:.0f} Hz, "
+          f"{p['workers']} worker(s), {p['duration']:.0f} s medidos ---")
+    print(f"{'fontes':>6} {'drones':>6} {'conexão':>8} {'escritas/s':>10} {'espelhadas/s':>12} "
+          f"{'entregues':>9} {'atraso p50':>10} {'p99':>8} {'máx':>8} {'CPU':>6}")
+    for r in result['runs']:
+        lag = r['lag']
+        if lag['p50_ms'] is None:
+            lag_text = f"{'-':>10} {'-':>8} {'-':>8}"
+        else:
+            lag_text = f"{lag['p50_ms']:8.1f}ms {lag['p99_ms']:6.1f}ms {lag['max_ms']:6.1f}ms"
+        delivered = '-' if r['delivered'] is None else f"{100.0 * r['delivered']:.1f}%"
+        print(f"{r['sources']:>6} {r['drones']:>6} {r['connect_s']:7.2f}s {r['writes_per_s']:10.0f} "
+              f"{r['updates_per_s']:12.0f} {delivered:>9} {lag_text} {r['cpu_pct']:5.0f}%")
+
+
+def _option(args: list, name: str, default):
+    if name not in args:
+        return default
+    i = args.index(name)
+    value = args[i + 1]
+    del args[i:i + 2]
+    return value
+
+
+def main():
+    args = sys.argv[1:]
+    json_path = _option(args, '--json', None)
+    params = dict(
+        drones=int(_option(args, '--drones', 4)),
+        hz=float(_option(args, '--hz', 20.0)),
+        workers=int(_option(args, '--workers', gateway.GATEWAY_WORKERS)),
+        duration=float(_option(args, '--duracao', 5.0)),
+        warmup=float(_option(args, '--aquecimento', 2.0)),
+    )
+    sizes = [int(a) for a in args] or DEFAULT_SIZES
+
+    # Cache de nós e logs do python-opcua fora do diretório do projeto
+    logging.getLogger("opcua").setLevel(logging.ERROR)
+    if json_path:
+        json_path = os.path.abspath(json_path)
+    os.chdir(tempfile.mkdtemp(prefix="bench_gateway_"))
+
+    runs = []
+    for n in sizes:
+        print(f"[BENCH] {n} fonte(s)...")
+        runs.append(run_size(n, **params))
+    result = {'params': params, 'runs': runs}
+    print_report(result)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"Resultado salvo em {json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Benchmark do armazenamento do MES em SQLite (mes_store.py).
+
+Um produtor enfileira posições no MesStore o mais rápido que a gravação
+aguenta (com no máximo --fila linhas pendentes, para que a medida seja de
+vazão sustentada e não do tamanho da fila), com um evento de target ou de
+estação a cada --eventos-cada posições. Compara:
+
+* lote (WAL)           -> configuração do MES: uma transação a cada
+                          MES_BATCH_SIZE linhas ou MES_COMMIT_PERIOD s;
+* por evento (WAL)     -> uma transação por linha;
+* por evento (DELETE)  -> uma transação por linha, sem WAL (journal padrão
+                          do SQLite, com fsync a cada commit).
+
+Para cada modo mede linhas gravadas por segundo, duração das transações,
+CPU do processo, tamanho do banco e o tempo de uma consulta de eventos por
+tipo e intervalo (índice events_kind_t).
+
+Uso:
+    python bench_mes.py [--duracao 5] [--fila 20000] [--eventos-cada 50]
+                        [--json resultado.json]
+"""
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import mes_store
+from canais import LatencyStats
+from mes_store import MesStore
+
+MODES = [
+    ("lote (WAL)", dict(batch_size=mes_store.MES_BATCH_SIZE, journal_mode="WAL")),
+    ("por evento (WAL)", dict(batch_size=1, journal_mode="WAL")),
+    ("por evento (DELETE)", dict(batch_size=1, journal_mode="DELETE")),
+]
+EVENT_KINDS = ("TARGET DETECTADO", "CHEGADA ESTACAO", "SAIDA ESTACAO")
+COMMIT_SAMPLES = 200000         # durações de transação guardadas por modo
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _db_size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def produce(store: MesStore, stop_event: threading.Event, max_pending: int, event_every: int):
+    """Posições de uma trajetória sintética, com um evento a cada event_every."""
+    t = time.time()
+    i = 0
+    while not stop_event.is_set():
+        if store.enqueued - store.written >= max_pending:
+            time.sleep(0.0005)
+            continue
+        t += 0.01
+        store.position(t, 0.001 * i, 2.0, 1.0)
+        i += 1
+        if i % event_every == 0:
+            station = f"Estacao {1 + (i // event_every) % 4}"
+            store.event(t, EVENT_KINDS[(i // event_every) % 3], station, 2.0, 0.0, 1.0)
+
+
+def run_mode(name: str, options: dict, duration: float, max_pending: int, event_every: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_mes_")
+    path = os.path.join(workdir, "mes.db")
+    store = MesStore(path, **options)
+
+    # Duração de cada transação (sonda no MesStore._commit)
+    commits = LatencyStats(COMMIT_SAMPLES)
+    original_commit = MesStore._commit
+
+    def commit(self, db, rows):
+        t0 = time.perf_counter()
+        original_commit(self, db, rows)
+        commits.record(time.perf_counter() - t0)
+    MesStore._commit = commit
+
+    stop_event = threading.Event()
+    producer = threading.Thread(target=produce, args=(store, stop_event, max_pending, event_every),
+                                daemon=True)
+    try:
+        written0, commits0, cpu0, t0 = store.written, store.commits, _cpu_seconds(), time.monotonic()
+        producer.start()
+        time.sleep(duration)
+        t1 = time.monotonic()
+        written, n_commits, cpu = store.written - written0, store.commits - commits0, _cpu_seconds() - cpu0
+        stop_event.set()
+        producer.join(timeout=5.0)
+        store.close()
+    finally:
+        MesStore._commit = original_commit
+
+    # Consulta por tipo e intervalo (metade central do período gravado)
+    db = mes_store.connect(path)
+    t_min, t_max = db.execute("SELECT min(t), max(t) FROM positions").fetchone()
+    span = (t_max - t_min) if t_min is not None else 0.0
+    q0 = time.perf_counter()
+    found = db.execute("SELECT count(*) FROM events WHERE kind = ? AND t BETWEEN ? AND ?",
+                       ("CHEGADA ESTACAO", (t_min or 0.0) + span / 4, (t_max or 0.0) - span / 4)).fetchone()[0]
+    query_ms = (time.perf_counter() - q0) * 1000.0
+    db.close()
+    size = _db_size(path)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    elapsed = t1 - t0
+    return {
+        'mode': name,
+        'rows_per_s': written / elapsed,
+        'commits_per_s': n_commits / elapsed,
+        'rows_per_commit': written / n_commits if n_commits else None,
+        'commit': commits.summary(),
+        'cpu_pct': 100.0 * cpu / elapsed,
+        'db_bytes': size,
+        'query_ms': query_ms,
+        'query_rows': found,
+    }
+
+
+def print_report(result: dict):
+    p = result['params']
+    print(f"--- MES/SQLite: {p['duration']:.0f} s por modo, até {p['max_pending']} linhas na fila, "
+          f"1 evento a cada {p['event_every']} posições ---")
+    print(f"{'modo':<20} {'linhas/s':>10} {'commits/s':>10} {'linhas/commit':>13} "
+          f"{'commit p50':>10} {'p99':>8} {'CPU':>6} {'banco':>9} {'consulta':>9}")
+    for r in result['runs']:
+        c = r['commit']
+        per_commit = '-' if r['rows_per_commit'] is None else f"{r['rows_per_commit']:.0f}"
+        commit_text = (f"{'-':>10} {'-':>8}" if c['p50_ms'] is None
+                       else f"{c['p50_ms']:8.2f}ms {c['p99_ms']:6.2f}ms")
+        print(f"{r['mode']:<20} {r['rows_per_s']:10.0f} {r['commits_per_s']:10.1f} {per_commit:>13} "
+              f"{commit_text} {r['cpu_pct']:5.0f}% {r['db_bytes'] / 1e6:7.1f}MB {r['query_ms']:7.2f}ms")
+
+
+def _option(args: list, name: str, default):
+    if name not in args:
+        return default
+    i = args.index(name)
+    value = args[i + 1]
+    del args[i:i + 2]
+    return value
+
+
+def main():
+    args = sys.argv[1:]
+    json_path = _option(args, '--json', None)
+    params = dict(
+        duration=float(_option(args, '--duracao', 5.0)),
+        max_pending=int(_option(args, '--fila', 20000)),
+        event_every=int(_option(args, '--eventos-cada', 50)),
+    )
+    runs = []
+    for name, options in MODES:
+        print(f"[BENCH] {name}...")
+        runs.append(run_mode(name, options, **params))
+    result = {'params': params, 'runs': runs}
+    print_report(result)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"Resultado salvo em {json_path}")
+
+
+if __name__ == "__main__":
+    main()
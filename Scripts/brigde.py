@@ -1,8 +1,19 @@
 import time
 import math
-from opcua import Client
+import threading
 from coppeliasim_zmqremoteapi_client import RemoteAPIClient
 
+try:
+    import numpy as np      # necessário apenas no modo frota
+except ImportError:
+    np = None
+
+from agendador import FixedRateScheduler
+from conexao_opc import OpcSession, is_connection_error
+from metricas import REGISTRY, start_http_server
+from opc_helpers import BatchIO, subscribe_nodes
+from tracer import get_tracer
+
 ############################
 # CONFIG
 ############################
@@ -14,35 +25,90 @@ TARGET_PATH = "/target"
 TARGET_SPEED = 0.35
 DT           = 0.05         # 20 Hz
 POS_TOL      = 1e-4         # tolerância para “parado”
+MAX_DT       = 4 * DT       # limite do passo após um ciclo muito atrasado
+COMMAND_HOLD = 2 * DT       # espera máx. pelo CommandId de coordenadas novas (s)
+STATS_PERIOD = 10.0         # intervalo do relatório de tempo de ciclo (s)
+METRICS_PORT = 9101         # endpoint Prometheus (metricas.py); 0 desliga
+
+# modo frota: N pares drone/target na cena ("/Quadcopter[i]/base", "/target[i]")
+# ligados às pastas Drone1..DroneN do servidor OPC UA
+FLEET_MODE       = False
+FLEET_MAX_DRONES = 200
+FLEET_DRONE_PATH  = "/Quadcopter[{i}]/base"
+FLEET_TARGET_PATH = "/target[{i}]"
+FLEET_FOLDER      = "Drone{k}"      # k = i + 1
+# script de customização da cena (fleet_bridge.lua) que move os targets e lê
+# as poses da frota em uma única chamada ZMQ por ciclo; sem ele na cena (ou
+# com FLEET_BATCH_SIM = False) o bridge faz uma chamada por objeto
+FLEET_BATCH_SIM   = True
+FLEET_SCRIPT_PATH = "/FleetBridge"
+FLEET_SCRIPT_FUNC = "bridgeFleetStep"
+
+# variáveis de cada pasta de drone (resolvidas pelo cache de nós de conexao_opc)
+DRONE_VARS = ("TargetX", "TargetY", "TargetZ", "DroneX", "DroneY", "DroneZ")
+TRACE_VARS = ("CommandId", "CommandAck")
+
+# publicação adaptativa: só publica a pose quando ela se move além do
+# deadband; com o alvo convergido, o loop cai para a taxa de heartbeat e
+# volta à taxa cheia assim que um novo comando chega (via subscription)
+ADAPTIVE_PUBLISH = True
+PUBLISH_DEADBAND = 1e-3     # variação mínima da pose para publicar (m)
+HEARTBEAT_RATE   = 1.0      # taxa de publicação com o alvo convergido (Hz)
+
+# rastreamento de comandos (tracer.py): lê CommandId junto com os targets e
+# escreve CommandAck com a primeira pose publicada após cada comando novo
+# (só quando a pasta do drone tem essas variáveis)
+TRACE_COMMANDS = True
 
 ############################
 # OPC UA helpers
 ############################
-def connect_opc(url=OPCUA_URL):
-    client = Client(url)
-    client.connect()
-    print("[OPC] Connected")
+def folder_paths(folder_name):
+    """Caminhos das variáveis de uma pasta de drone (as de rastreamento por último)."""
+    names = DRONE_VARS + (TRACE_VARS if TRACE_COMMANDS else ())
+    return [f"3:{folder_name}/3:{name}" for name in names]
 
-    root = client.get_objects_node()
+def connect_opc(url=OPCUA_URL, folders=("Drone",)):
+    """Sessão OPC UA (com reconexão) e nós das pastas resolvidos pelo cache."""
+    paths = [p for folder in folders for p in folder_paths(folder)]
+    session = OpcSession(url, paths, "OPC", required=[])
+    session.connect()
+    return session
 
-    # Tente achar a pasta "Drone" no ns=3 (padrão do SimulationServer),
-    # e tenha fallback para procurar por nome entre os filhos.
-    drone_folder = None
+def find_drone_folder(client):
+    """Fallback: procura a pasta "Drone" pelo nome entre os filhos de Objects."""
+    root = client.get_objects_node()
     try:
-        drone_folder = root.get_child(["3:Drone"])
+        return root.get_child(["3:Drone"])
     except Exception:
-        # fallback: varrer filhos e procurar "Drone"
+        # varrer filhos e procurar "Drone"
         for n in root.get_children():
             try:
                 name = n.get_browse_name().Name
                 if name.lower() == "drone":
-                    drone_folder = n
-                    break
+                    return n
             except Exception:
                 pass
-    if drone_folder is None:
-        raise RuntimeError("Não encontrei a pasta 'Drone' no servidor OPC UA.")
+    raise RuntimeError("Não encontrei a pasta 'Drone' no servidor OPC UA.")
+
+def bind_drone(session, folder_name="Drone", browse_fallback=True):
+    """
+    (vars_, trace_vars) de uma pasta a partir dos nós da sessão; trace_vars
+    é (CommandId, CommandAck) ou None. Sem os nós e com browse_fallback,
+    mapeia as variáveis navegando pelos filhos (nomes fora do padrão).
+    """
+    paths = folder_paths(folder_name)
+    vars_ = tuple(session.nodes.get(p) for p in paths[:6])
+    if not all(vars_):
+        if not browse_fallback:
+            return None, None
+        vars_ = bind_drone_vars(find_drone_folder(session.client))
+    trace = tuple(session.nodes.get(p) for p in paths[6:])
+    trace_vars = trace if len(trace) == 2 and all(trace) else None
+    return vars_, trace_vars
 
+def bind_drone_vars(drone_folder):
+    """Mapeia as seis variáveis de uma pasta de drone, por nome."""
     # Mapeie variáveis por nome (case-insensitive)
     name_to_node = {}
     for v in drone_folder.get_children():
@@ -67,17 +133,164 @@ def connect_opc(url=OPCUA_URL):
             "Quero TargetX, TargetY, TargetZ, DroneX, DroneY, DroneZ. "
             f"Encontradas: {found}"
         )
+    return (tX, tY, tZ, dX, dY, dZ)
+
+def bind_fleet(session, max_drones=FLEET_MAX_DRONES):
+    """Nós das pastas Drone1..DroneN (para na primeira ausente)."""
+    fleet, traces = [], []
+    for i in range(max_drones):
+        vars_, trace_vars = bind_drone(session, FLEET_FOLDER.format(k=i + 1), browse_fallback=False)
+        if vars_ is None:
+            break
+        fleet.append(vars_)
+        traces.append(trace_vars)
+    if not fleet:
+        raise RuntimeError(f"Nenhuma pasta '{FLEET_FOLDER.format(k=1)}' no servidor OPC UA.")
+    return fleet, traces
+
+class OpcLink:
+    """
+    Estado OPC do loop que depende da conexão (nós, BatchIO e subscription
+    dos comandos); refeito a cada reconexão da sessão.
+
+    bind(session) retorna (command_nodes, pose_nodes, ack_nodes, command_groups),
+    com um (índices de X/Y/Z, índice do CommandId ou None) por drone em
+    command_groups.
+    """
+    def __init__(self, session, bind):
+        self.session = session
+        self._bind = bind
+        self.bind()
+
+    def bind(self):
+        self.command_nodes, self.pose_nodes, self.ack_nodes, groups = self._bind(self.session)
+        self.io = BatchIO(self.session.client, "OPC")
+        self.watcher = watch_commands(self.session.client, self.command_nodes, groups) \
+            if ADAPTIVE_PUBLISH else None
+
+    def recover(self, error):
+        """Reconecta e refaz o estado se o erro for de conexão; False para outros erros."""
+        if not is_connection_error(error):
+            return False
+        self.session.reconnect(error)
+        self.bind()
+        return True
+
+class CommandWatcher:
+    """
+    Handler da subscription dos targets: guarda o último comando completo de
+    cada drone e sinaliza `changed` a cada comando novo, acordando o loop parado.
+
+    As mudanças de uma resposta de Publish chegam uma a uma e só são aplicadas
+    em datachange_batch_end. Num drone com CommandId (o CLP o escreve no mesmo
+    Write dos targets), as coordenadas novas passam a valer junto com o ID
+    novo, de modo que get() nunca vê eixos de comandos diferentes nem
+    coordenadas novas com o ID anterior; coordenadas sem ID novo (escritor sem
+    rastreamento) valem após COMMAND_HOLD s.
+    """
+    def __init__(self, nodes, groups):
+        self.index = {node.nodeid: i for i, node in enumerate(nodes)}
+        self.groups = groups        # [(índices de X/Y/Z, índice do CommandId ou None)]
+        self.values = [None] * len(nodes)   # comandos aplicados (lidos por get)
+        self.staged = [None] * len(nodes)   # valores recebidos, ainda não aplicados
+        self.batch = {}             # mudanças da resposta de Publish em curso
+        self.held = {}              # drone -> geração do timer de COMMAND_HOLD
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.changed = threading.Event()
+
+    def datachange_notification(self, node, val, data):
+        i = self.index.get(node.nodeid)
+        if i is not None:
+            self.batch[i] = val
 
-    print("[OPC] Vars bound:",
-          "TargetX/TargetY/TargetZ & DroneX/DroneY/DroneZ")
-    return client, (tX, tY, tZ, dX, dY, dZ)
+    def datachange_batch_end(self):
+        batch, self.batch = self.batch, {}
+        applied = False
+        with self.lock:
+            for g, (axes, id_index) in enumerate(self.groups):
+                moved = False
+                for i in axes:
+                    if i in batch:
+                        self.staged[i] = batch[i]
+                        moved = True
+                new_id = id_index is not None and id_index in batch \
+                    and batch[id_index] != self.values[id_index]
+                if new_id:
+                    self.staged[id_index] = batch[id_index]
+                if new_id or (moved and id_index is None):
+                    self._apply(g)
+                    applied = True
+                elif moved and g not in self.held:
+                    self.generation += 1
+                    self.held[g] = self.generation
+                    timer = threading.Timer(COMMAND_HOLD, self._release, (g, self.generation))
+                    timer.daemon = True
+                    timer.start()
+        if applied:
+            self.changed.set()
+
+    def _apply(self, g):
+        axes, id_index = self.groups[g]
+        for i in list(axes) + ([] if id_index is None else [id_index]):
+            self.values[i] = self.staged[i]
+        self.held.pop(g, None)
+
+    def _release(self, g, generation):
+        """Aplica as coordenadas que esperaram COMMAND_HOLD s sem um ID novo."""
+        with self.lock:
+            if self.held.get(g) != generation:
+                return
+            self._apply(g)
+        self.changed.set()
+
+    def get(self):
+        """Último comando completo, ou None se algum nó ainda não chegou."""
+        with self.lock:
+            if any(v is None for v in self.values):
+                return None
+            return [float(v) for v in self.values]
+
+def watch_commands(client, nodes, groups):
+    """Assina os nós de target; None se a subscription não for possível."""
+    watcher = CommandWatcher(nodes, groups)
+    try:
+        subscribe_nodes(client, nodes, watcher, DT * 1000.0)
+    except Exception as e:
+        print("[OPC] subscription error, polling targets:", e)
+        return None
+    return watcher
+
+class PublishStats:
+    """Contadores da publicação adaptativa (também expostos como métricas)."""
+    def __init__(self):
+        self.writes = 0
+        self.suppressed_writes = 0
+        self.sets = 0
+        self.suppressed_sets = 0
+        self.idle_waits = 0
+
+        for result, attr in (('written', 'writes'), ('suppressed', 'suppressed_writes')):
+            REGISTRY.callback('sda_bridge_pose_writes_total', "Publicações de pose por resultado",
+                              lambda attr=attr: getattr(self, attr), {'result': result}, 'counter')
+        for result, attr in (('applied', 'sets'), ('suppressed', 'suppressed_sets')):
+            REGISTRY.callback('sda_bridge_target_sets_total', "setObjectPosition do target por resultado",
+                              lambda attr=attr: getattr(self, attr), {'result': result}, 'counter')
+        REGISTRY.callback('sda_bridge_idle_waits_total', "Esperas em repouso (alvo convergido)",
+                          lambda: self.idle_waits, kind='counter')
+
+    def report(self):
+        return (f"[RUN] Escritas OPC: {self.writes} (suprimidas {self.suppressed_writes}), "
+                f"setObjectPosition: {self.sets} (suprimidos {self.suppressed_sets}), "
+                f"esperas em repouso: {self.idle_waits}")
 
 ############################
 # Coppelia helpers
 ############################
-def connect_coppelia():
+def start_coppelia():
     client = RemoteAPIClient()   # 127.0.0.1:23000
     sim = client.getObject('sim')
+    REGISTRY.counter('sda_connections_total', "Conexões estabelecidas", {'link': 'sim'}).inc()
 
     # garanta sim parada e inicie
     if sim.getSimulationState() != sim.simulation_stopped:
@@ -86,18 +299,72 @@ def connect_coppelia():
             time.sleep(0.1)
     sim.startSimulation()
     time.sleep(0.5)
+    return sim
 
+def connect_coppelia():
+    sim = start_coppelia()
     drone  = sim.getObject(DRONE_PATH)
     target = sim.getObject(TARGET_PATH)
     print("[SIM] Connected; handles ok")
     return sim, drone, target
 
+def get_fleet_handles(sim, max_drones=FLEET_MAX_DRONES):
+    """Descobre os pares (drone, target) da cena pelo índice do alias."""
+    handles = []
+    for i in range(max_drones):
+        drone  = sim.getObject(FLEET_DRONE_PATH.format(i=i), {'noError': True})
+        target = sim.getObject(FLEET_TARGET_PATH.format(i=i), {'noError': True})
+        if drone == -1 or target == -1:
+            break
+        handles.append((drone, target))
+    print(f"[SIM] Fleet handles ok: {len(handles)} drone(s)")
+    return handles
+
 def get_pos(sim, handle):
     return sim.getObjectPosition(handle, -1)  # world
 
 def set_pos(sim, handle, p):
     sim.setObjectPosition(handle, -1, list(p))
 
+def find_fleet_script(sim):
+    """Handle do script de fleet_bridge.lua na cena, ou None se não houver."""
+    try:
+        obj = sim.getObject(FLEET_SCRIPT_PATH, {'noError': True})
+        if obj == -1:
+            return None
+        return sim.getScript(sim.scripttype_customizationscript, obj)
+    except Exception:
+        return None
+
+class FleetSim:
+    """
+    Acesso à cena no modo frota. Com o script fleet_bridge.lua na cena,
+    step() move os targets e lê as N poses em uma chamada ZMQ; sem ele,
+    faz um setObjectPosition por target movido e um getObjectPosition por drone.
+    """
+    def __init__(self, sim, handles, batched=FLEET_BATCH_SIM):
+        self.sim = sim
+        self.drones = [int(d) for d, _ in handles]
+        self.targets = [int(t) for _, t in handles]
+        self.script = find_fleet_script(sim) if batched else None
+
+    def read_targets(self):
+        """Posições atuais dos targets (N, 3); só na partida."""
+        return np.array([get_pos(self.sim, t) for t in self.targets], dtype=float)
+
+    def step(self, indices, positions):
+        """Move os targets `indices` para `positions` (k, 3) e retorna as poses (N, 3) dos drones."""
+        if self.script is not None:
+            flat = self.sim.callScriptFunction(
+                FLEET_SCRIPT_FUNC, self.script,
+                [self.targets[i] for i in indices],
+                np.asarray(positions, dtype=float).ravel().tolist(),
+                self.drones)
+            return np.array(flat, dtype=float).reshape(len(self.drones), 3)
+        for i, p in zip(indices, positions):
+            set_pos(self.sim, self.targets[i], p)
+        return np.array([get_pos(self.sim, d) for d in self.drones], dtype=float)
+
 def step_towards(p_now, p_goal, vmax, dt):
     """Dá um passo de p_now -> p_goal, respetando velocidade máxima."""
     dx = [p_goal[i] - p_now[i] for i in range(3)]
@@ -110,13 +377,176 @@ def step_towards(p_now, p_goal, vmax, dt):
     s = max_step / dist
     return [p_now[i] + s * dx[i] for i in range(3)]
 
+def step_towards_np(p_now, p_goal, vmax, dt):
+    """step_towards vetorizado para arrays (N, 3): um passo para toda a frota."""
+    delta = p_goal - p_now
+    dist = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+    max_step = vmax * dt
+    # escala 1 leva direto ao objetivo (dist <= max_step, inclui POS_TOL)
+    scale = np.where(dist > max_step, max_step / np.maximum(dist, POS_TOL), 1.0)
+    return p_now + delta * scale[:, None]
+
 ############################
 # Main
 ############################
+def run_fleet():
+    """Loop do modo frota: um passo vetorizado, um Read/Write OPC e (com o script da cena) uma chamada ZMQ por ciclo."""
+    if np is None:
+        raise RuntimeError("O modo frota requer NumPy (pip install numpy).")
+
+    # a cena define quantas pastas resolver (evita traduzir pastas inexistentes)
+    sim = start_coppelia()
+    handles = get_fleet_handles(sim)
+    session = connect_opc(folders=[FLEET_FOLDER.format(k=i + 1) for i in range(len(handles))])
+    n = min(len(handles), len(bind_fleet(session, len(handles))[0]))
+    handles = handles[:n]
+    traced = []
+
+    def bind(session):
+        fleet_nodes, fleet_traces = bind_fleet(session, n)
+        if len(fleet_nodes) < n:
+            raise RuntimeError(f"Servidor OPC UA com {len(fleet_nodes)} pasta(s) de drone; esperava {n}.")
+        # drones com CommandId/CommandAck: os IDs são lidos junto com os targets
+        traced[:] = [i for i in range(n) if fleet_traces[i] is not None]
+        command_nodes = [node for nodes in fleet_nodes for node in nodes[:3]] \
+            + [fleet_traces[i][0] for i in traced]
+        drone_nodes = [node for nodes in fleet_nodes for node in nodes[3:]]
+        groups = [((3 * i, 3 * i + 1, 3 * i + 2), 3 * n + traced.index(i) if i in traced else None)
+                  for i in range(n)]
+        return command_nodes, drone_nodes, {i: fleet_traces[i][1] for i in traced}, groups
+
+    link = OpcLink(session, bind)
+    tracer = get_tracer("bridge", enabled=TRACE_COMMANDS)
+    last_ids, pending_acks = {}, {}
+    sched = None
+
+    try:
+        # Inicial: alvos na altura mínima; a posição dos alvos fica em
+        # memória (só o bridge os move), sem reler da cena a cada ciclo
+        fleet = FleetSim(sim, handles)
+        print("[SIM] Fleet access: " + (f"script {FLEET_SCRIPT_PATH}" if fleet.script is not None
+                                         else "per-object calls"))
+        p_target = fleet.read_targets()
+        p_drone = fleet.step([], p_target[:0])
+        p_target[:, 2] = np.maximum(p_drone[:, 2], 1.2)
+        fleet.step(range(n), p_target)
+
+        print(f"[RUN] Fleet loop started with {n} drone(s). Press Ctrl+C to stop.")
+        sched = FixedRateScheduler(1.0 / DT, "RUN", STATS_PERIOD)
+        stats = PublishStats()
+        converged = False
+        last_pub = np.full((n, 3), np.nan)      # últimas poses publicadas
+        last_pub_t = 0.0
+        next_report = time.monotonic() + STATS_PERIOD
+        while True:
+            watcher = link.watcher
+            if converged and watcher is not None:
+                stats.idle_waits += 1
+                watcher.changed.wait(1.0 / HEARTBEAT_RATE)
+                sched.reset()
+                dt = DT
+            else:
+                dt = min(sched.wait(), MAX_DT)
+
+            if watcher is not None:
+                watcher.changed.clear()
+                values = watcher.get()
+                if values is None:
+                    continue
+            else:
+                try:
+                    values = link.io.read(link.command_nodes)
+                except Exception as e:
+                    print("[OPC] read error:", e)
+                    if link.recover(e):
+                        sched.reset()
+                    continue
+            cmd = np.array(values[:3 * n], dtype=float).reshape(n, 3)
+            for i, cmd_id in zip(traced, values[3 * n:]):
+                cmd_id = int(cmd_id)
+                if last_ids.get(i, cmd_id) != cmd_id:
+                    tracer.stamp(cmd_id, 'bridge.lido', drone=i)
+                    pending_acks[i] = cmd_id
+                last_ids[i] = cmd_id
+
+            p_next = step_towards_np(p_target, cmd, TARGET_SPEED, dt)
+            moving = np.flatnonzero(np.any(p_next != p_target, axis=1))
+            # targets movidos + poses da frota (uma chamada com o script da cena)
+            poses = fleet.step(moving, p_next[moving])
+            stats.sets += len(moving)
+            stats.suppressed_sets += n - len(moving)
+            p_target = p_next
+
+            now = time.monotonic()
+            if ADAPTIVE_PUBLISH and now - last_pub_t < 1.0 / HEARTBEAT_RATE:
+                # só os drones que se moveram além do deadband
+                changed = np.flatnonzero(~(np.abs(poses - last_pub) <= PUBLISH_DEADBAND).all(axis=1))
+            else:
+                changed = np.arange(n)
+                last_pub_t = now
+            if len(changed):
+                nodes = [link.pose_nodes[3 * i + k] for i in changed for k in range(3)]
+                values = poses[changed].ravel().tolist()
+                acks = [(i, pending_acks[i]) for i in changed if i in pending_acks]
+                for i, cmd_id in acks:
+                    nodes.append(link.ack_nodes[i])
+                    values.append(float(cmd_id))
+                try:
+                    link.io.write(nodes, values)
+                    last_pub[changed] = poses[changed]
+                    stats.writes += len(changed)
+                    for i, cmd_id in acks:
+                        tracer.stamp(cmd_id, 'bridge.publicado', drone=i)
+                        del pending_acks[i]
+                except Exception as e:
+                    print("[OPC] write error:", e)
+                    if link.recover(e):
+                        # republica todas as poses na nova sessão
+                        last_pub[:] = np.nan
+                        sched.reset()
+            stats.suppressed_writes += n - len(changed)
+            link.io.end_cycle()
+
+            converged = ADAPTIVE_PUBLISH and len(moving) == 0 and len(changed) == 0 \
+                and bool(np.all(p_target == cmd))
+            if ADAPTIVE_PUBLISH and now >= next_report:
+                print(stats.report())
+                next_report = now + STATS_PERIOD
+
+    except KeyboardInterrupt:
+        print("\n[RUN] Stopping...")
+        if sched is not None:
+            print(sched.report())
+    finally:
+        try:
+            sim.stopSimulation()
+        except Exception:
+            pass
+        session.close()
+        print("[CLEAN] Done.")
+
 def main():
+    start_http_server(METRICS_PORT)
+    if FLEET_MODE:
+        run_fleet()
+        return
+
     # 1) Conectar
-    opc_client, (tX, tY, tZ, dX, dY, dZ) = connect_opc()
+    session = connect_opc()
     sim, drone, target = connect_coppelia()
+    sched = None
+
+    def bind(session):
+        (tX, tY, tZ, dX, dY, dZ), trace_vars = bind_drone(session)
+        if trace_vars is None:
+            return [tX, tY, tZ], [dX, dY, dZ], [], [((0, 1, 2), None)]
+        # CommandId (opcional) é lido junto com os targets
+        return [tX, tY, tZ, trace_vars[0]], [dX, dY, dZ], [trace_vars[1]], [((0, 1, 2), 3)]
+
+    link = OpcLink(session, bind)
+    tracer = get_tracer("bridge", enabled=TRACE_COMMANDS)
+    last_cmd_id = None
+    pending_ack = None          # ID a confirmar com a próxima pose publicada
 
     try:
         # 2) Inicial: mantenha alvo na altura mínima (decola suave)
@@ -126,44 +556,100 @@ def main():
         p_target = [p_target[0], p_target[1], alt]
         set_pos(sim, target, p_target)
 
-        # 3) loop
+        # 3) loop com deadlines fixos (sem deriva pelo tempo de I/O)
         print("[RUN] Control loop started. Press Ctrl+C to stop.")
+        sched = FixedRateScheduler(1.0 / DT, "RUN", STATS_PERIOD)
+        stats = PublishStats()
+        converged = False
+        last_pub = None             # última pose publicada
+        last_pub_t = 0.0
+        next_report = time.monotonic() + STATS_PERIOD
         while True:
-            # 3.1) ler comandos do Prosys
-            try:
-                cmd = [float(tX.get_value()), float(tY.get_value()), float(tZ.get_value())]
-            except Exception as e:
-                print("[OPC] read error:", e)
-                time.sleep(DT)
-                continue
+            watcher = link.watcher
+            if converged and watcher is not None:
+                # alvo parado: dorme até um comando novo ou o heartbeat
+                stats.idle_waits += 1
+                watcher.changed.wait(1.0 / HEARTBEAT_RATE)
+                sched.reset()
+                dt = DT
+            else:
+                # passo calculado com o tempo real decorrido desde o ciclo anterior
+                dt = min(sched.wait(), MAX_DT)
+
+            # 3.1) ler comandos do Prosys (subscription ou um único Read)
+            if watcher is not None:
+                watcher.changed.clear()
+                values = watcher.get()
+                if values is None:
+                    continue
+            else:
+                try:
+                    values = [float(v) for v in link.io.read(link.command_nodes)]
+                except Exception as e:
+                    print("[OPC] read error:", e)
+                    if link.recover(e):
+                        sched.reset()
+                    continue
+            cmd = values[:3]
+            if len(values) > 3:
+                cmd_id = int(values[3])
+                if last_cmd_id is not None and cmd_id != last_cmd_id:
+                    tracer.stamp(cmd_id, 'bridge.lido')
+                    pending_ack = cmd_id
+                last_cmd_id = cmd_id
 
             # 3.2) avançar o target suavemente até o comando
-            p_target = get_pos(sim, target)
-            p_next   = step_towards(p_target, cmd, TARGET_SPEED, DT)
-            set_pos(sim, target, p_next)
+            if not ADAPTIVE_PUBLISH:
+                p_target = get_pos(sim, target)
+            p_next   = step_towards(p_target, cmd, TARGET_SPEED, dt)
+            if ADAPTIVE_PUBLISH and p_next == p_target:
+                stats.suppressed_sets += 1
+            else:
+                set_pos(sim, target, p_next)
+                stats.sets += 1
+            p_target = p_next
 
-            # 3.3) publicar pose do drone no Prosys
+            # 3.3) publicar pose do drone no Prosys (um único Write)
             p_drone = get_pos(sim, drone)
-            try:
-                dX.set_value(p_drone[0])
-                dY.set_value(p_drone[1])
-                dZ.set_value(p_drone[2])
-            except Exception as e:
-                print("[OPC] write error:", e)
+            now = time.monotonic()
+            moved = last_pub is None or max(abs(a - b) for a, b in zip(p_drone, last_pub)) > PUBLISH_DEADBAND
+            if not ADAPTIVE_PUBLISH or moved or now - last_pub_t >= 1.0 / HEARTBEAT_RATE:
+                nodes, values = list(link.pose_nodes), list(p_drone)
+                if pending_ack is not None and link.ack_nodes:
+                    # o ack vai no mesmo Write da pose que reflete o comando
+                    nodes.append(link.ack_nodes[0])
+                    values.append(float(pending_ack))
+                try:
+                    link.io.write(nodes, values)
+                    stats.writes += 1
+                    last_pub, last_pub_t = p_drone, now
+                    if pending_ack is not None:
+                        tracer.stamp(pending_ack, 'bridge.publicado')
+                        pending_ack = None
+                except Exception as e:
+                    print("[OPC] write error:", e)
+                    if link.recover(e):
+                        last_pub = None
+                        sched.reset()
+            else:
+                stats.suppressed_writes += 1
+            link.io.end_cycle()
 
-            time.sleep(DT)
+            converged = ADAPTIVE_PUBLISH and p_target == cmd and not moved
+            if ADAPTIVE_PUBLISH and now >= next_report:
+                print(stats.report())
+                next_report = now + STATS_PERIOD
 
     except KeyboardInterrupt:
         print("\n[RUN] Stopping...")
+        if sched is not None:
+            print(sched.report())
     finally:
         try:
             sim.stopSimulation()
         except Exception:
             pass
-        try:
-            opc_client.disconnect()
-        except Exception:
-            pass
+        session.close()
         print("[CLEAN] Done.")
 
 if __name__ == "__main__":
@@ -0,0 +1,170 @@
+"""
+Canais de comunicação entre as threads do CLP.
+"""
+import queue
+import threading
+import time
+from collections import deque
+
+
+class LatencyStats:
+    """
+    Mantém as últimas latências medidas (em segundos) e calcula percentis.
+    """
+    def __init__(self, maxlen: int = 1024):
+        self.samples = deque(maxlen=maxlen)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def record(self, latency: float):
+        with self.lock:
+            self.samples.append(latency)
+            self.count += 1
+
+    def summary(self) -> dict:
+        """Retorna n, p50, p99 e máximo (em ms) das amostras recentes."""
+        with self.lock:
+            data = sorted(self.samples)
+            count = self.count
+        if not data:
+            return {'n': count, 'p50_ms': None, 'p99_ms': None, 'max_ms': None}
+        return {
+            'n': count,
+            'p50_ms': data[len(data) // 2] * 1000.0,
+            'p99_ms': data[min(len(data) - 1, int(len(data) * 0.99))] * 1000.0,
+            'max_ms': data[-1] * 1000.0,
+        }
+
+
+class CommandChannel:
+    """
+    Canal de comandos com semântica "latest-wins" por drone.
+
+    Cada drone tem um único slot: um novo target substitui o anterior que
+    ainda não foi escrito no servidor OPC UA. O consumidor é acordado assim
+    que um comando chega, sem esperar o próximo ciclo de leitura.
+    """
+    def __init__(self):
+        self.pending = {}
+        self.cond = threading.Condition()
+        self.received = 0
+        self.coalesced = 0
+        self.write_latency = LatencyStats()
+
+    def put(self, target: dict, drone: int = 0):
+        """Publica um target para o drone, descartando o pendente anterior."""
+        with self.cond:
+            if drone in self.pending:
+                self.coalesced += 1
+            self.pending[drone] = (target, time.monotonic())
+            self.received += 1
+            self.cond.notify()
+
+    def drain(self, timeout: float = None) -> dict:
+        """
+        Aguarda até `timeout` segundos por comandos e retorna todos os
+        pendentes como {drone: (target, instante_de_chegada)}.
+        """
+        with self.cond:
+            if not self.pending and timeout != 0:
+                self.cond.wait(timeout)
+            pending, self.pending = self.pending, {}
+        return pending
+
+    def requeue(self, pending: dict):
+        """
+        Devolve comandos retirados por drain() e não escritos (ex.: conexão
+        perdida), sem sobrescrever um comando mais novo do mesmo drone.
+        """
+        with self.cond:
+            for drone, item in pending.items():
+                self.pending.setdefault(drone, item)
+            if self.pending:
+                self.cond.notify()
+
+    def record_write(self, t_arrival: float):
+        """Registra a latência entre a chegada do comando e sua escrita no OPC UA."""
+        self.write_latency.record(time.monotonic() - t_arrival)
+
+    def qsize(self) -> int:
+        with self.cond:
+            return len(self.pending)
+
+
+class TelemetryBuffer:
+    """
+    Buffer de telemetria não bloqueante entre a thread OPC UA e a TCP.
+
+    Políticas:
+        "latest" -> slot único; uma amostra nova substitui a não lida
+                    (contada em `conflated`).
+        "ring"   -> anel de tamanho fixo; quando cheio, a amostra mais
+                    antiga é sobrescrita (contada em `dropped`).
+
+    O produtor nunca bloqueia, então um consumidor lento ou ausente não
+    consegue travar o caminho de controle. A leitura segue a interface de
+    queue.Queue (get/get_nowait levantam queue.Empty).
+    """
+    POLICIES = ("latest", "ring")
+
+    def __init__(self, policy: str = "ring", maxsize: int = 128):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Politica de buffer invalida: {policy}")
+        if maxsize < 1:
+            raise ValueError("maxsize deve ser >= 1")
+        self.policy = policy
+        self.maxsize = 1 if policy == "latest" else maxsize
+        self.samples = deque()
+        self.cond = threading.Condition()
+        self.received = 0
+        self.dropped = 0
+        self.conflated = 0
+
+    def put(self, sample, block: bool = True, timeout: float = None):
+        """Insere uma amostra sem nunca bloquear (block/timeout são ignorados)."""
+        with self.cond:
+            if len(self.samples) >= self.maxsize:
+                self.samples.popleft()
+                if self.policy == "latest":
+                    self.conflated += 1
+                else:
+                    self.dropped += 1
+            self.samples.append(sample)
+            self.received += 1
+            self.cond.notify()
+
+    def put_nowait(self, sample):
+        self.put(sample)
+
+    def get(self, block: bool = True, timeout: float = None):
+        """Retira a amostra mais antiga; levanta queue.Empty se não houver."""
+        with self.cond:
+            if block and not self.samples:
+                self.cond.wait(timeout)
+            if not self.samples:
+                raise queue.Empty
+            return self.samples.popleft()
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def drain(self) -> list:
+        """Retira e retorna todas as amostras disponíveis."""
+        with self.cond:
+            samples = list(self.samples)
+            self.samples.clear()
+        return samples
+
+    def qsize(self) -> int:
+        with self.cond:
+            return len(self.samples)
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                'policy': self.policy,
+                'size': len(self.samples),
+                'received': self.received,
+                'dropped': self.dropped,
+                'conflated': self.conflated,
+            }
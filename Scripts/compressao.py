@@ -0,0 +1,197 @@
+"""
+Compressão de trajetórias por banda morta e swinging door (SDT).
+
+O compressor recebe amostras (t, (x, y, z)) e devolve apenas os pontos
+necessários para reconstruir a trajetória por interpolação linear com
+erro máximo `deviation` em cada eixo, mais um ponto de heartbeat
+periódico. O interpolador faz o caminho inverso: dado um timestamp,
+reconstrói a posição a partir dos pontos arquivados.
+
+Uso pela linha de comando:
+    python compressao.py mes.txt "2025-11-24 21:06:35.5"
+"""
+import math
+import re
+import sys
+from bisect import bisect_right
+from datetime import datetime
+
+
+class SwingingDoorCompressor:
+    """
+    Compressor swinging door em três eixos.
+
+    Cada eixo mantém sua própria "porta" a partir do último ponto
+    arquivado; quando a amostra não cabe na porta de algum eixo, a amostra
+    anterior é arquivada para todos os eixos, o que mantém as três
+    coordenadas alinhadas no tempo. Toda amostra aceita fica a no máximo
+    `deviation` da reta entre os pontos arquivados que a cercam.
+
+    Args:
+        deviation: tolerância (mesma unidade das coordenadas), um valor
+            para os três eixos ou uma tupla (dx, dy, dz).
+        deadband (float): amostras que diferem da última aceita menos que
+            isto em todos os eixos são descartadas antes do SDT (0 desliga).
+        heartbeat (float): intervalo máximo (s) entre pontos arquivados
+            (None desliga).
+    """
+    def __init__(self, deviation=0.005, deadband: float = 0.0, heartbeat: float = 60.0):
+        if isinstance(deviation, (int, float)):
+            deviation = (deviation,) * 3
+        self.deviation = tuple(float(d) for d in deviation)
+        self.deadband = deadband
+        self.heartbeat = heartbeat
+
+        self.archived = None        # último ponto arquivado (t, p)
+        self.held = None            # última amostra aceita e não arquivada
+        self.last_accepted = None
+        self.slope_up = None
+        self.slope_low = None
+
+        self.received = 0
+        self.stored = 0
+
+    def add(self, t: float, point) -> list:
+        """Processa uma amostra e retorna os pontos a arquivar (pode ser vazio)."""
+        point = tuple(float(v) for v in point)
+        self.received += 1
+        out = []
+
+        if self.archived is None:
+            self._archive(t, point, out)
+            self.last_accepted = point
+            return out
+
+        # Banda morta: ignora variações menores que o deadband
+        if (self.deadband > 0 and self.last_accepted is not None
+                and all(abs(a - b) < self.deadband for a, b in zip(point, self.last_accepted))):
+            if self._heartbeat_due(t):
+                if self.held is not None:
+                    self._archive(*self.held, out)
+                self._archive(t, point, out)
+            return out
+        self.last_accepted = point
+
+        if not self._door_open(t, point):
+            # A amostra atual não cabe na porta: arquiva a anterior e
+            # recomeça a porta a partir dela
+            if self.held is not None:
+                self._archive(*self.held, out)
+            if not self._door_open(t, point):
+                self._archive(t, point, out)
+                return out
+
+        self.held = (t, point)
+        if self._heartbeat_due(t):
+            self._archive(t, point, out)
+        return out
+
+    def flush(self) -> list:
+        """Arquiva a amostra pendente (use no encerramento)."""
+        out = []
+        if self.held is not None:
+            self._archive(*self.held, out)
+        return out
+
+    def ratio(self) -> float:
+        """Razão entre amostras recebidas e pontos arquivados."""
+        return self.received / self.stored if self.stored else 0.0
+
+    def _heartbeat_due(self, t: float) -> bool:
+        return self.heartbeat is not None and t - self.archived[0] >= self.heartbeat
+
+    def _door_open(self, t: float, point) -> bool:
+        """
+        Testa a amostra contra as portas; False se ela não couber.
+
+        A amostra cabe se a reta do ponto arquivado até ela passa a menos
+        de `deviation` de todas as amostras aceitas desde então, ou seja,
+        se a sua inclinação está entre as portas inferior e superior.
+        """
+        t_a, p_a = self.archived
+        dt = t - t_a
+        if dt <= 0:
+            return all(abs(v - a) <= e for v, a, e in zip(point, p_a, self.deviation))
+
+        slope_up, slope_low = [], []
+        for i in range(3):
+            slope = (point[i] - p_a[i]) / dt
+            up = slope - self.deviation[i] / dt
+            low = slope + self.deviation[i] / dt
+            if self.slope_up is not None:
+                if not self.slope_up[i] <= slope <= self.slope_low[i]:
+                    return False
+                up = max(up, self.slope_up[i])
+                low = min(low, self.slope_low[i])
+            slope_up.append(up)
+            slope_low.append(low)
+        self.slope_up, self.slope_low = slope_up, slope_low
+        return True
+
+    def _archive(self, t: float, point, out: list):
+        self.archived = (t, point)
+        self.held = None
+        self.slope_up = self.slope_low = None
+        self.stored += 1
+        out.append((t, point))
+
+
+class TrajectoryInterpolator:
+    """
+    Reconstrói a posição em qualquer instante a partir dos pontos
+    arquivados, por interpolação linear (valores fora do intervalo
+    gravado são limitados às extremidades).
+    """
+    def __init__(self, points):
+        points = sorted(points)
+        self.times = [p[0] for p in points]
+        self.points = [p[1] for p in points]
+
+    def at(self, t: float):
+        if not self.times:
+            return (math.nan, math.nan, math.nan)
+        i = bisect_right(self.times, t)
+        if i == 0:
+            return self.points[0]
+        if i == len(self.times):
+            return self.points[-1]
+        t0, t1 = self.times[i - 1], self.times[i]
+        p0, p1 = self.points[i - 1], self.points[i]
+        s = (t - t0) / (t1 - t0)
+        return tuple(a + s * (b - a) for a, b in zip(p0, p1))
+
+
+_POSITION_LINE = re.compile(
+    r"^\[(?P<ts>[^\]]+)\] \[POSICAO LIDA\] - X=(?P<x>\S+), Y=(?P<y>\S+), Z=(?P<z>\S+)$")
+
+
+def load_mes_log(path: str) -> list:
+    """Lê os pontos [POSICAO LIDA] de um log do MES como (t, (x, y, z))."""
+    points = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            m = _POSITION_LINE.match(line.strip())
+            if not m:
+                continue
+            t = datetime.strptime(m.group('ts'), '%Y-%m-%d %H:%M:%S.%f').timestamp()
+            points.append((t, (float(m.group('x')), float(m.group('y')), float(m.group('z')))))
+    return points
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Uso: python compressao.py <mes.txt> <timestamp> [timestamp ...]")
+        sys.exit(1)
+    interp = TrajectoryInterpolator(load_mes_log(sys.argv[1]))
+    for value in sys.argv[2:]:
+        try:
+            t = float(value)
+        except ValueError:
+            t = datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f' if '.' in value
+                                  else '%Y-%m-%d %H:%M:%S').timestamp()
+        x, y, z = interp.at(t)
+        print(f"[{value}] X={x}, Y={y}, Z={z}")
+
+
+if __name__ == "__main__":
+    main()
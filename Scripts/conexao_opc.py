@@ -0,0 +1,396 @@
+"""
+Conexão OPC UA com cache de NodeIds em disco e reconexão automática.
+
+Os nós são endereçados por caminhos a partir da pasta Objects, no mesmo
+formato do get_child ("3:Drone/3:TargetX"; "{gw}:DroneMirror" usa o
+índice do namespace registrado como 'gw'). O NodeResolver resolve todos
+os caminhos com um único TranslateBrowsePathsToNodeIds e guarda os
+NodeIds em NODE_CACHE_FILE. Na partida seguinte, um único Read (o
+NamespaceArray e o BrowseName de cada nó do cache) confirma que o cache
+ainda vale; só os caminhos que falharem são traduzidos de novo.
+
+A OpcSession reconecta com backoff exponencial e mede o tempo da partida
+a frio e o tempo de recuperação após cada queda (log e métricas
+sda_opc_connect_seconds / sda_reconnects_total). Os nós e as
+subscriptions pertencem ao cliente: quem usa a sessão deve refazê-los a
+cada conexão, o que é barato com o cache.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl                # trava do arquivo de cache entre processos (POSIX)
+except ImportError:
+    fcntl = None
+    import msvcrt               # Windows
+
+from opcua import Client, ua
+
+from metricas import REGISTRY
+
+NODE_CACHE_FILE = "opc_nodes.json"
+RECONNECT_MIN_DELAY = 0.2       # primeira espera após uma falha (s)
+RECONNECT_MAX_DELAY = 5.0       # teto do backoff exponencial (s)
+HEALTH_CHECK_PERIOD = 1.0       # intervalo entre verificações da conexão ociosa (s)
+SESSION_TIMEOUT_MS = 2000
+
+# Status que indicam conexão ou sessão perdida (e não erro da operação)
+CONNECTION_LOST_CODES = {
+    ua.StatusCodes.BadSessionIdInvalid,
+    ua.StatusCodes.BadSessionClosed,
+    ua.StatusCodes.BadSessionNotActivated,
+    ua.StatusCodes.BadSecureChannelIdInvalid,
+    ua.StatusCodes.BadSecureChannelClosed,
+    ua.StatusCodes.BadConnectionClosed,
+    ua.StatusCodes.BadServerNotConnected,
+    ua.StatusCodes.BadCommunicationError,
+    ua.StatusCodes.BadNoCommunication,
+    ua.StatusCodes.BadTimeout,
+    ua.StatusCodes.BadShutdown,
+}
+
+
+def is_connection_error(error: Exception) -> bool:
+    """True se o erro indica que a conexão com o servidor caiu."""
+    if isinstance(error, (OSError, EOFError)):     # inclui TimeoutError e BrokenPipeError
+        return True
+    if isinstance(error, ua.UaStatusCodeError):
+        return error.code in CONNECTION_LOST_CODES
+    return False
+
+
+@contextmanager
+def _exclusive_lock(path: str):
+    """Trava exclusiva entre processos, no arquivo path (criado se preciso)."""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class NodeCache:
+    """
+    Arquivo JSON com os NodeIds resolvidos, por URL do servidor:
+    {url: {"namespaces": [...], "nodes": {caminho: nodeid}}}.
+
+    O arquivo é compartilhado pelos processos que falam com o mesmo servidor
+    (bridge, CLP, gateway, MES), cada um com os seus caminhos: update() relê
+    o arquivo e mescla os nós sob uma trava exclusiva (<arquivo>.lock) e
+    grava por um temporário próprio do processo, trocado com os.replace.
+    """
+    def __init__(self, filename: str = NODE_CACHE_FILE):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.filename, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def entry(self, url: str) -> dict:
+        """Entrada do servidor, relida do arquivo (inclui os nós de outros processos)."""
+        with self.lock:
+            data = self._load()
+            if data:
+                self.data = data
+            return self.data.get(url, {'namespaces': [], 'nodes': {}})
+
+    def update(self, url: str, namespaces: list, nodes: dict):
+        """Mescla os NodeIds do servidor aos do arquivo (escrita atômica)."""
+        with self.lock:
+            tmp = f"{self.filename}.{os.getpid()}.tmp"
+            try:
+                with _exclusive_lock(self.filename + ".lock"):
+                    data = self._load()
+                    current = data.get(url)
+                    if current is not None and current.get('namespaces') == namespaces:
+                        # Mesmo servidor: mantém os caminhos dos outros processos
+                        nodes = {**current.get('nodes', {}), **nodes}
+                    data[url] = {'namespaces': namespaces, 'nodes': nodes}
+                    with open(tmp, 'w', encoding='utf-8') as f:
+                        json.dump(data, f, indent=1)
+                    os.replace(tmp, self.filename)
+                self.data = data
+            except OSError as e:
+                print(f"[OPC] Não foi possível gravar o cache de nós: {e}")
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(filename: str = NODE_CACHE_FILE) -> NodeCache:
+    """Cache compartilhado do processo (um por arquivo)."""
+    with _caches_lock:
+        cache = _caches.get(filename)
+        if cache is None:
+            cache = _caches[filename] = NodeCache(filename)
+        return cache
+
+
+def _format_paths(paths: list, namespaces: dict, namespace_array: list) -> dict:
+    """
+    {caminho: caminho com os índices de namespace}; caminhos com um apelido
+    cujo URI não está no namespace_array ficam de fora.
+    """
+    if not namespaces:
+        return {p: p for p in paths}
+    index = {alias: namespace_array.index(uri)
+             for alias, uri in namespaces.items() if uri in namespace_array}
+    result = {}
+    for p in paths:
+        try:
+            result[p] = p.format(**index)
+        except KeyError:
+            pass
+    return result
+
+
+class NodeResolver:
+    """
+    Resolve caminhos de nós com no máximo dois round trips: um Read para
+    validar o cache (e obter o NamespaceArray) e um Translate para o que
+    faltar. `stats` descreve a última resolução.
+    """
+    def __init__(self, client, url: str, cache: NodeCache = None):
+        self.client = client
+        self.url = url
+        self.cache = cache
+        self.stats = {}
+
+    def resolve(self, paths: list, namespaces: dict = None) -> dict:
+        """
+        Args:
+            paths: caminhos a partir de Objects ("3:Drone/3:TargetX").
+            namespaces: {apelido: URI} usados como "{apelido}:" nos caminhos.
+
+        Returns:
+            {caminho original: Node}, sem os caminhos que não existem.
+        """
+        entry = self.cache.entry(self.url) if self.cache is not None else {'namespaces': [], 'nodes': {}}
+        cached = entry['nodes']
+
+        # Um único Read: NamespaceArray + BrowseName de cada nó do cache
+        # (os caminhos são formatados com os índices da época do cache)
+        expected = _format_paths(paths, namespaces, entry['namespaces'])
+        candidates = [p for p in paths if expected.get(p) in cached]
+        server_ns, browse_names = self._read_validation(
+            [ua.NodeId.from_string(cached[expected[p]]) for p in candidates])
+        round_trips = 1
+
+        resolved = {}
+        cache_valid = server_ns == entry['namespaces']
+        if cache_valid:
+            for p, name in zip(candidates, browse_names):
+                if name is not None and name == expected[p].rsplit('/', 1)[-1]:
+                    resolved[p] = cached[expected[p]]
+        from_cache = len(resolved)
+
+        actual = expected if cache_valid else _format_paths(paths, namespaces, server_ns)
+        missing = [p for p in paths if p not in resolved and p in actual]
+        if missing:
+            for p, nodeid in zip(missing, self._translate([actual[p] for p in missing])):
+                if nodeid is not None:
+                    resolved[p] = nodeid
+            round_trips += 1
+
+        if self.cache is not None and (len(resolved) > from_cache or not cache_valid):
+            nodes = dict(cached) if cache_valid else {}
+            nodes.update({actual[p]: nodeid for p, nodeid in resolved.items()})
+            self.cache.update(self.url, server_ns, nodes)
+
+        self.stats = {'paths': len(paths), 'cached': from_cache,
+                      'translated': len(resolved) - from_cache,
+                      'missing': len(paths) - len(resolved), 'round_trips': round_trips}
+        return {p: self.client.get_node(nodeid) for p, nodeid in resolved.items()}
+
+    def _read_validation(self, nodeids: list):
+        params = ua.ReadParameters()
+        rv = ua.ReadValueId()
+        rv.NodeId = ua.NodeId(ua.ObjectIds.Server_NamespaceArray)
+        rv.AttributeId = ua.AttributeIds.Value
+        params.NodesToRead.append(rv)
+        for nodeid in nodeids:
+            rv = ua.ReadValueId()
+            rv.NodeId = nodeid
+            rv.AttributeId = ua.AttributeIds.BrowseName
+            params.NodesToRead.append(rv)
+        results = self.client.uaclient.read(params)
+        results[0].StatusCode.check()
+        names = []
+        for dv in results[1:]:
+            if dv.StatusCode.is_good():
+                qn = dv.Value.Value
+                names.append(f"{qn.NamespaceIndex}:{qn.Name}")
+            else:
+                names.append(None)
+        return list(results[0].Value.Value), names
+
+    def _translate(self, paths: list) -> list:
+        """NodeIds (texto) dos caminhos, em um único Translate; None se não existir."""
+        browse_paths = []
+        for path in paths:
+            bp = ua.BrowsePath()
+            bp.StartingNode = ua.NodeId(ua.ObjectIds.ObjectsFolder)
+            for element in path.split('/'):
+                el = ua.RelativePathElement()
+                el.ReferenceTypeId = ua.TwoByteNodeId(ua.ObjectIds.HierarchicalReferences)
+                el.IsInverse = False
+                el.IncludeSubtypes = True
+                el.TargetName = ua.QualifiedName.from_string(element)
+                bp.RelativePath.Elements.append(el)
+            browse_paths.append(bp)
+        results = self.client.uaclient.translate_browsepaths_to_nodeids(browse_paths)
+        nodeids = []
+        for result in results:
+            if result.StatusCode.is_good() and result.Targets:
+                nodeids.append(result.Targets[0].TargetId.to_string())
+            else:
+                nodeids.append(None)
+        return nodeids
+
+
+class OpcSession:
+    """
+    Cliente OPC UA que se reconecta sozinho.
+
+    connect() tenta até conseguir (ou até o stop_event), com espera
+    crescente entre as tentativas; a cada conexão os caminhos são
+    resolvidos de novo em `nodes`. Quem usa a sessão chama lost(erro)
+    quando uma operação falha por conexão perdida e check() nos períodos
+    sem I/O, para perceber a queda mesmo só com subscriptions.
+    """
+    def __init__(self, url: str, paths: list, name: str = "OPC", required: list = None,
+                 namespaces: dict = None, session_timeout: int = SESSION_TIMEOUT_MS,
+                 cache_file: str = NODE_CACHE_FILE):
+        self.url = url
+        self.paths = list(paths)
+        self.name = name
+        self.required = list(paths) if required is None else list(required)
+        self.namespaces = namespaces
+        self.session_timeout = session_timeout
+        self.cache = get_cache(cache_file) if cache_file else None
+        self.client = None
+        self.nodes = {}
+        self.connected = False
+        self.started = time.monotonic()
+        self.lost_at = None
+        self.next_check = 0.0
+
+        self._connections = REGISTRY.counter('sda_connections_total', "Conexões estabelecidas",
+                                             {'link': 'opc'})
+        self._reconnects = REGISTRY.counter('sda_reconnects_total', "Reconexões após queda",
+                                            {'link': 'opc'})
+        self._connect_time = {phase: REGISTRY.histogram('sda_opc_connect_seconds',
+                                                        "Tempo até a sessão ficar pronta",
+                                                        {'phase': phase})
+                              for phase in ('cold', 'recover')}
+
+    def connect(self, stop_event: threading.Event = None) -> bool:
+        """Conecta e resolve os nós; False se o stop_event for acionado antes."""
+        delay = RECONNECT_MIN_DELAY
+        while stop_event is None or not stop_event.is_set():
+            if self.try_connect(f"nova tentativa em {delay:.1f} s"):
+                return True
+            if stop_event is not None:
+                stop_event.wait(delay)
+            else:
+                time.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+        return False
+
+    def try_connect(self, retry_note: str = "") -> bool:
+        """
+        Uma única tentativa de connect(), para quem agenda as novas
+        tentativas (ex.: um worker com várias sessões); False se falhou.
+        """
+        try:
+            self._open()
+            return True
+        except Exception as e:
+            self._close()
+            print(f"[{self.name}] Falha ao conectar em {self.url}: {e}"
+                  + (f"; {retry_note}" if retry_note else ""))
+            return False
+
+    def _open(self):
+        t0 = time.monotonic()
+        client = Client(self.url)
+        client.session_timeout = self.session_timeout
+        client.connect()
+        self.client = client
+
+        resolver = NodeResolver(client, self.url, self.cache)
+        self.nodes = resolver.resolve(self.paths, self.namespaces)
+        missing = [p for p in self.required if p not in self.nodes]
+        if missing:
+            raise RuntimeError(f"nós não encontrados: {', '.join(missing)}")
+
+        now = time.monotonic()
+        self.connected = True
+        self.next_check = now + HEALTH_CHECK_PERIOD
+        self._connections.inc()
+        s = resolver.stats
+        detail = (f"{s['cached']} nó(s) do cache, {s['translated']} traduzido(s), "
+                  f"{s['round_trips']} round trip(s); conexão {(now - t0) * 1000:.0f} ms")
+        if self.lost_at is None:
+            elapsed = now - self.started
+            self._connect_time['cold'].observe(elapsed)
+            print(f"[{self.name}] Conectado a {self.url} em {elapsed * 1000:.0f} ms ({detail})")
+        else:
+            elapsed = now - self.lost_at
+            self._connect_time['recover'].observe(elapsed)
+            self._reconnects.inc()
+            print(f"[{self.name}] Reconectado em {elapsed * 1000:.0f} ms após a queda ({detail})")
+            self.lost_at = None
+
+    def lost(self, error: Exception):
+        """Registra a queda da conexão e descarta o cliente."""
+        if self.connected:
+            print(f"[{self.name}] Conexão perdida: {error!r}")
+            self.lost_at = time.monotonic()
+        self.connected = False
+        self._close()
+
+    def reconnect(self, error: Exception, stop_event: threading.Event = None) -> bool:
+        """lost(error) seguido de connect()."""
+        self.lost(error)
+        return self.connect(stop_event)
+
+    def check(self):
+        """Lê o estado do servidor a cada HEALTH_CHECK_PERIOD; propaga o erro se a conexão caiu."""
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        self.next_check = now + HEALTH_CHECK_PERIOD
+        self.client.get_node(ua.NodeId(ua.ObjectIds.Server_ServerStatus_State)).get_value()
+
+    def close(self):
+        self.connected = False
+        self._close()
+
+    def _close(self):
+        client, self.client = self.client, None
+        if client is None:
+            return
+        try:
+            client.disconnect()
+        except Exception:
+            # Conexão já caída: o disconnect falha, mas encerra as threads do cliente
+            pass
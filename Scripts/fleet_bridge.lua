@@ -0,0 +1,29 @@
+-- Script de customização do objeto /FleetBridge (um dummy na cena drone.ttt)
+-- usado pelo brigde.py no modo frota: cada ciclo do bridge vira uma única
+-- chamada ZMQ (sim.callScriptFunction) em vez de uma por drone.
+--
+-- Para instalar: adicione um dummy chamado "FleetBridge" à cena, anexe a ele
+-- um script de customização (Lua) e cole este arquivo. Sem o script, o
+-- bridge volta às chamadas getObjectPosition / setObjectPosition por objeto.
+
+-- Move os targets e retorna as poses de todos os drones.
+--   targets   : handles dos targets a mover (k)
+--   positions : posições novas, achatadas {x1, y1, z1, x2, ...} (3k)
+--   drones    : handles de todos os drones da frota (N)
+-- Retorna as poses achatadas {x1, y1, z1, ...} (3N), em coordenadas do mundo.
+function bridgeFleetStep(targets, positions, drones)
+    for i = 1, #targets do
+        local j = 3 * (i - 1)
+        sim.setObjectPosition(targets[i], sim.handle_world,
+                              {positions[j + 1], positions[j + 2], positions[j + 3]})
+    end
+    local poses = {}
+    for i = 1, #drones do
+        local p = sim.getObjectPosition(drones[i], sim.handle_world)
+        local j = 3 * (i - 1)
+        poses[j + 1] = p[1]
+        poses[j + 2] = p[2]
+        poses[j + 3] = p[3]
+    end
+    return poses
+end
@@ -1,98 +1,403 @@
+import json
+import sys
+import threading
 import time
-from opcua import Client, Server
+from datetime import datetime
 
+from opcua import Server, ua
 
-def main():
-    # --- CONFIGURAÇÃO DO SERVIDOR LOCAL (CHAINED) ---
+from conexao_opc import (HEALTH_CHECK_PERIOD, RECONNECT_MAX_DELAY, RECONNECT_MIN_DELAY,
+                         OpcSession, is_connection_error)
+from historico_opc import enable_history
+from kpis_missao import KPI_OBJECT, KPI_VARS
+from metricas import REGISTRY, start_http_server
+from opc_helpers import BatchIO, subscribe_nodes
+
+############################
+# CONFIG
+############################
+SOURCE_URL = "opc.tcp://localhost:53530/OPCUA/SimulationServer"
+GATEWAY_ENDPOINT = "opc.tcp://0.0.0.0:4841/freeopcua/server/"
+GATEWAY_URI = "http://meu.gateway.com"
+
+# Fontes espelhadas: cada pasta de drone de cada fonte vira
+# Cells/<cell>/<pasta> no gateway (variáveis de MIRROR_VARS), e cada fonte
+# tem seu objeto de saúde Cells/<cell>/Status. A primeira pasta da
+# primeira fonte aparece também como DroneMirror (caminho lido pelo
+# mes.py). "Drone{k}" com "count": N expande para Drone1..DroneN.
+# A lista pode vir de um arquivo JSON: python gateway.py fontes.json
+SOURCES = [
+    {"cell": "Cell1", "url": SOURCE_URL, "drones": ["Drone"]},
+]
+MIRROR_VARS = ["DroneX", "DroneY", "DroneZ", "TargetX", "TargetY", "TargetZ"]
+GATEWAY_WORKERS = 4             # threads entre as quais as fontes são divididas
+CONNECT_CHECK_PERIOD = 0.1      # intervalo com que o worker vê o fim de uma conexão em andamento (s)
+
+# Modo de espelhamento:
+#   "subscription" -> monitored items nas variáveis de origem (padrão)
+#   "polling"      -> leitura periódica a cada POLL_PERIOD segundos (fallback)
+MIRROR_MODE = "subscription"
+PUBLISHING_INTERVAL_MS = 50     # intervalo de publicação da subscription
+SAMPLING_INTERVAL_MS = 25       # intervalo de amostragem no servidor de origem
+POLL_PERIOD = 0.5               # período do modo polling (s)
+LAG_SMOOTHING = 0.05            # peso de cada amostra na média do atraso (status LagMs)
+METRICS_PORT = 9103             # endpoint Prometheus (metricas.py); 0 desliga
+
+# Histórico em memória das variáveis espelho, servido por HistoryRead
+# (raw e processado: Minimum/Maximum/Average); cada amostra ocupa 20 bytes,
+# logo o limite de memória é (nº de variáveis) * HISTORY_POINTS * 20 bytes
+HISTORY_POINTS = 100000         # amostras por variável (~83 min a 20 Hz); 0 desliga
+
+
+class MirrorHandler:
+    """
+    Handler da subscription: copia cada mudança de uma variável de origem
+    para a variável espelho correspondente, preservando o timestamp de
+    origem e o status code, e a guarda no histórico (se houver).
+    """
+    def __init__(self, pairs, history=None, source: str = "Cell1"):
+        self.mirror_by_source = {src.nodeid: mirror for src, mirror in pairs}
+        self.history = history
+        self.updates = 0
+        self.lag = 0.0              # média móvel do atraso origem -> espelho (s)
+        self.last_update = None
+        # valores anteriores a este instante (os iniciais de cada
+        # subscription) não entram na medida do atraso
+        self.lag_since = datetime.utcnow()
+        self.updates_total = REGISTRY.counter('sda_gateway_mirror_updates_total',
+                                              "Escritas nas variáveis espelho", {'source': source})
+        self.lag_seconds = REGISTRY.histogram('sda_gateway_mirror_lag_seconds',
+                                              "Atraso entre o timestamp de origem e a escrita no espelho")
+
+    def datachange_notification(self, node, val, data):
+        mirror = self.mirror_by_source.get(node.nodeid)
+        if mirror is None:
+            return
+        src = data.monitored_item.Value
+        dv = ua.DataValue(src.Value)
+        dv.StatusCode = src.StatusCode
+        dv.SourceTimestamp = src.SourceTimestamp
+        dv.SourcePicoseconds = src.SourcePicoseconds
+        self.apply(mirror, dv)
+
+    def apply(self, mirror, dv):
+        """Escreve o valor no espelho e no histórico e mede o atraso."""
+        mirror.set_value(dv)
+        if self.history is not None:
+            self.history.save_node_value(mirror.nodeid, dv)
+        now = datetime.utcnow()
+        if dv.SourceTimestamp is not None and dv.SourceTimestamp >= self.lag_since:
+            lag = (now - dv.SourceTimestamp).total_seconds()
+            self.lag_seconds.observe(lag)
+            self.lag += LAG_SMOOTHING * (lag - self.lag)
+        self.last_update = now
+        self.updates += 1
+        self.updates_total.inc()
+
+    def status_change_notification(self, status):
+        print("[OPC] Status da subscription alterado:", status)
+
+
+class SourceMirror:
+    """
+    Espelho de uma fonte: sessão OPC UA, subscription (ou polling) das
+    pastas de drone e variáveis de status da célula.
+
+    step() é chamado pela thread do worker dono da fonte e não se conecta:
+    cada tentativa (connect + bind) roda numa thread de conexão da fonte,
+    de modo que uma fonte fora do ar não atrasa as outras do worker. As
+    novas tentativas seguem o backoff exponencial da OpcSession.
+    """
+    def __init__(self, cell: str, url: str, mirrors: dict, status: dict, history=None):
+        self.cell = cell
+        self.mirrors = mirrors          # caminho na fonte -> variável espelho
+        self.status = status            # nome -> variável de status
+        self.history = history
+        self.session = OpcSession(url, list(mirrors), f"OPC {cell}", required=[])
+        self.handler = MirrorHandler([], history, cell)
+        self.subscription = None
+        self.poller = None
+        self.retry_at = 0.0
+        self.delay = RECONNECT_MIN_DELAY
+        self.connector = None           # thread da tentativa de conexão em andamento
+        self.reconnects = 0
+        self.ever_bound = False
+        self.last_error = ""
+
+    def step(self, now: float) -> float:
+        """Verifica/lê a fonte ou agenda a reconexão; retorna quando chamar de novo."""
+        if self.connector is not None:
+            if self.connector.is_alive():
+                return now + CONNECT_CHECK_PERIOD
+            self.connector = None
+        if self.session.connected:
+            try:
+                if self.poller is not None:
+                    self.poll()
+                else:
+                    self.session.check()
+            except Exception as e:
+                self.drop(e)
+        if not self.session.connected and now >= self.retry_at:
+            self.connector = threading.Thread(target=self.connect, name=f"gateway-connect-{self.cell}",
+                                              daemon=True)
+            self.connector.start()
+            self.publish_status()
+            return now + CONNECT_CHECK_PERIOD
+        self.publish_status()
+        if not self.session.connected:
+            return self.retry_at
+        return now + (POLL_PERIOD if self.poller is not None else HEALTH_CHECK_PERIOD)
+
+    def connect(self):
+        """Uma tentativa de conexão, na thread de conexão; agenda a próxima se falhar."""
+        if self.session.try_connect(f"nova tentativa em {self.delay:.1f} s") and self.bind():
+            self.delay = RECONNECT_MIN_DELAY
+        else:
+            self.retry_at = time.monotonic() + self.delay
+            self.delay = min(self.delay * 2, RECONNECT_MAX_DELAY)
+
+    def bind(self) -> bool:
+        """Liga os nós resolvidos aos espelhos e assina (ou prepara o polling)."""
+        pairs = [(self.session.nodes[path], mirror) for path, mirror in self.mirrors.items()
+                 if path in self.session.nodes]
+        missing = len(self.mirrors) - len(pairs)
+        if missing:
+            print(f"[GATEWAY] {self.cell}: {missing} variável(is) não encontrada(s) na fonte")
+        self.handler.mirror_by_source = {src.nodeid: mirror for src, mirror in pairs}
+        self.handler.lag_since = datetime.utcnow()
+        self.subscription = self.poller = None
+        try:
+            if MIRROR_MODE == "subscription":
+                try:
+                    self.subscription = subscribe_nodes(
+                        self.session.client, [src for src, _ in pairs], self.handler,
+                        PUBLISHING_INTERVAL_MS, SAMPLING_INTERVAL_MS)
+                    print(f"[GATEWAY] {self.cell}: espelhando {len(pairs)} variável(is) por subscription "
+                          f"(publicação {PUBLISHING_INTERVAL_MS} ms, amostragem {SAMPLING_INTERVAL_MS} ms)")
+                except Exception as e:
+                    if is_connection_error(e):
+                        raise
+                    print(f"[GATEWAY] {self.cell}: erro ao criar a subscription, usando polling:", e)
+            if self.subscription is None:
+                self.poller = (BatchIO(self.session.client, f"GATEWAY {self.cell}"), pairs, {})
+                print(f"[GATEWAY] {self.cell}: espelhando {len(pairs)} variável(is) por polling "
+                      f"a cada {POLL_PERIOD} s")
+        except Exception as e:
+            self.drop(e)
+            return False
+        if self.ever_bound:
+            self.reconnects += 1
+        self.ever_bound = True
+        self.last_error = ""
+        return True
+
+    def poll(self):
+        """
+        Lê as variáveis de origem com um único Read e escreve apenas as que
+        mudaram (as escritas no servidor local não passam pela rede).
+        """
+        opc_io, pairs, last = self.poller
+        for (_, mirror), dv in zip(pairs, opc_io.read_data_values([src for src, _ in pairs])):
+            key = (dv.Value.Value, dv.StatusCode.value)
+            if last.get(mirror.nodeid) != key:
+                self.handler.apply(mirror, dv)
+                last[mirror.nodeid] = key
+        opc_io.end_cycle()
+
+    def drop(self, error: Exception):
+        """Descarta a conexão (caída ou com erro) e agenda a reconexão imediata."""
+        if not is_connection_error(error):
+            print(f"[GATEWAY] {self.cell}: erro ao espelhar: {error!r}")
+        self.last_error = repr(error)
+        self.session.lost(error)
+        self.subscription = self.poller = None
+        self.retry_at = 0.0
+        self.delay = RECONNECT_MIN_DELAY
+
+    def publish_status(self):
+        """Escreve a saúde da fonte nas variáveis Cells/<cell>/Status."""
+        h = self.handler
+        values = {
+            'Connected': ua.Variant(self.session.connected, ua.VariantType.Boolean),
+            'Updates': ua.Variant(h.updates, ua.VariantType.UInt64),
+            'Reconnects': ua.Variant(self.reconnects, ua.VariantType.UInt32),
+            'LagMs': ua.Variant(h.lag * 1000.0, ua.VariantType.Double),
+            'LastError': ua.Variant(self.last_error, ua.VariantType.String),
+        }
+        if h.last_update is not None:
+            values['LastUpdate'] = ua.Variant(h.last_update, ua.VariantType.DateTime)
+        for name, variant in values.items():
+            self.status[name].set_value(variant)
+
+    def close(self):
+        if self.connector is not None:
+            self.connector.join(timeout=RECONNECT_MAX_DELAY)
+        self.session.close()
+
+
+def expand_drones(source: dict) -> list:
+    """Pastas de drone de uma fonte ("Drone{k}" com "count" vira Drone1..DroneN)."""
+    drones = []
+    for name in source.get("drones", ["Drone"]):
+        if "{k}" in name:
+            drones.extend(name.format(k=k) for k in range(1, source.get("count", 1) + 1))
+        else:
+            drones.append(name)
+    return drones
+
+
+def load_sources(filename: str) -> list:
+    """Lista de fontes de um arquivo JSON (lista, ou {"sources": [...]})."""
+    with open(filename, encoding='utf-8') as f:
+        data = json.load(f)
+    sources = data["sources"] if isinstance(data, dict) else data
+    cells = [source["cell"] for source in sources]
+    if len(set(cells)) != len(cells):
+        raise ValueError(f"Nomes de célula repetidos em {filename}")
+    for source in sources:
+        if "url" not in source:
+            raise ValueError(f"Fonte {source['cell']} sem url em {filename}")
+    return sources
+
+
+def build_gateway(sources: list, endpoint: str = GATEWAY_ENDPOINT,
+                  history_points: int = HISTORY_POINTS):
+    """
+    Monta (sem iniciar) o servidor do gateway com o namespace das fontes.
+
+    Returns:
+        (server, mirrors, history): um SourceMirror por fonte e o
+        histórico (None se desligado).
+    """
     server = Server()
-    server.set_endpoint("opc.tcp://0.0.0.0:4841/freeopcua/server/")
+    server.set_endpoint(endpoint)
 
     # Configura o namespace do nosso servidor
-    uri = "http://meu.gateway.com"
-    idx = server.register_namespace(uri)
-
-    # Cria a estrutura de objetos e variáveis do nosso servidor
+    idx = server.register_namespace(GATEWAY_URI)
     objects = server.get_objects_node()
-    drone_obj = objects.add_object(idx, "DroneMirror")
-
-    # Cria variáveis que serão 'espelhos' das originais
-    my_drone_x = drone_obj.add_variable(idx, "DroneX", 0.0)
-    my_drone_y = drone_obj.add_variable(idx, "DroneY", 0.0)
-    my_drone_z = drone_obj.add_variable(idx, "DroneZ", 0.0)
-    my_target_x = drone_obj.add_variable(idx, "TargetX", 0.0)
-    my_target_y = drone_obj.add_variable(idx, "TargetY", 0.0)
-    my_target_z = drone_obj.add_variable(idx, "TargetZ", 0.0)
-
-    my_drone_x.set_writable()
-    my_drone_y.set_writable()
-    my_drone_z.set_writable()
-    my_target_x.set_writable()
-    my_target_y.set_writable()
-    my_target_z.set_writable()
+    cells = objects.add_folder(ua.NodeId("Cells", idx), ua.QualifiedName("Cells", idx))
 
-    server.start()
-    print("[SERVER] Gateway MES rodando em opc.tcp//0.0.0.0:4841")
+    history = None
+    if history_points:
+        history = enable_history(server, history_points)
 
-    # --- CONFIGURAÇÃO DO CLIENTE ---
-    cliente = Client("opc.tcp://localhost:53530/OPCUA/SimulationServer")
+    def add_object(parent, nodeid: str, name: str):
+        return parent.add_object(ua.NodeId(nodeid, idx), ua.QualifiedName(name, idx))
 
-    # Define tempo de timeout da sessão
-    cliente.session_timeout = 2000
+    def add_variable(parent, nodeid: str, name: str, variant: ua.Variant):
+        return parent.add_variable(ua.NodeId(nodeid, idx), ua.QualifiedName(name, idx), variant)
 
-    # Tentar conectar ao servidor OPC UA
-    try:
-        cliente.connect()
-    except Exception as e:
-        print("[OPC] Erro ao conectar ao servidor OPC UA:", e)
-        return
-    print("[OPC] Conectado ao servidor OPC UA")
+    mirrors = []
+    for source in sources:
+        cell = source["cell"]
+        cell_obj = add_object(cells, cell, cell)
 
-    # Tentar acessar o nó "Drone"
-    try:
-        root = cliente.get_objects_node()
-        drone_node = root.get_child(["3:Drone"])
-    except Exception as e:
-        print("[OPC] Erro ao acessar o nó 'Drone':", e)
-        cliente.disconnect()
-        return
-    print("[OPC] Nó 'Drone' acessado com sucesso")
-
-    # Mapeamento dos nós esperados
+        # Variáveis espelho, com NodeIds estáveis ("Cell1.Drone.DroneX")
+        # para que os clientes reaproveitem o cache entre reinícios
+        paths = {}
+        for drone in expand_drones(source):
+            drone_obj = add_object(cell_obj, f"{cell}.{drone}", drone)
+            for name in MIRROR_VARS:
+                var = add_variable(drone_obj, f"{cell}.{drone}.{name}", name,
+                                   ua.Variant(0.0, ua.VariantType.Double))
+                var.set_writable()
+                if history is not None:
+                    history.historize(var)
+                paths[f"3:{drone}/3:{name}"] = var
+
+        status_obj = add_object(cell_obj, f"{cell}.Status", "Status")
+        status = {name: add_variable(status_obj, f"{cell}.Status.{name}", name, variant)
+                  for name, variant in (
+                      ('Url', ua.Variant(source["url"], ua.VariantType.String)),
+                      ('Connected', ua.Variant(False, ua.VariantType.Boolean)),
+                      ('Updates', ua.Variant(0, ua.VariantType.UInt64)),
+                      ('Reconnects', ua.Variant(0, ua.VariantType.UInt32)),
+                      ('LagMs', ua.Variant(0.0, ua.VariantType.Double)),
+                      ('LastUpdate', ua.Variant(ua.get_win_epoch(), ua.VariantType.DateTime)),
+                      ('LastError', ua.Variant("", ua.VariantType.String)))}
+        mirrors.append(SourceMirror(cell, source["url"], paths, status, history))
+
+    # KPIs escritos pelo MES
+    kpi_obj = add_object(objects, KPI_OBJECT, KPI_OBJECT)
+    for name, variant_type in KPI_VARS.items():
+        initial = "" if variant_type == ua.VariantType.String else 0.0
+        add_variable(kpi_obj, f"{KPI_OBJECT}.{name}", name, ua.Variant(initial, variant_type)).set_writable()
+
+    # DroneMirror: as variáveis da primeira pasta da primeira fonte
+    if mirrors:
+        drone_obj = objects.add_object(ua.NodeId("DroneMirror", idx), ua.QualifiedName("DroneMirror", idx))
+        first = list(mirrors[0].mirrors.values())[:len(MIRROR_VARS)]
+        for var in first:
+            drone_obj.add_reference(var.nodeid, ua.ObjectIds.HasComponent, bidirectional=False)
+    return server, mirrors, history
+
+
+def run_worker(mirrors: list, stop_event: threading.Event):
+    """Loop de um worker: atende cada fonte do seu grupo quando ela pede."""
+    loop_timer = REGISTRY.timer('sda_loop_work_seconds', "Tempo gasto no corpo do loop",
+                                {'loop': 'gateway.worker'}, every=1)
+    due = [0.0] * len(mirrors)
     try:
-        tX = drone_node.get_child(["3:TargetX"])
-        tY = drone_node.get_child(["3:TargetY"])
-        tZ = drone_node.get_child(["3:TargetZ"])
-        dX = drone_node.get_child(["3:DroneX"])
-        dY = drone_node.get_child(["3:DroneY"])
-        dZ = drone_node.get_child(["3:DroneZ"])
-    except Exception as e:
-        print("[OPC] Erro ao mapear os nós esperados:", e)
-        cliente.disconnect()
-        return
-    print("[OPC] Nós mapeados com sucesso")
+        while not stop_event.is_set():
+            now = time.monotonic()
+            t0 = loop_timer.start()
+            for k, mirror in enumerate(mirrors):
+                if now >= due[k]:
+                    due[k] = mirror.step(now)
+            loop_timer.stop(t0)
+            stop_event.wait(max(0.0, min(due) - time.monotonic()))
+    finally:
+        for mirror in mirrors:
+            mirror.close()
+
+
+def start_workers(mirrors: list, workers: int, stop_event: threading.Event) -> list:
+    """Divide as fontes entre até `workers` threads (round-robin)."""
+    shards = [mirrors[k::workers] for k in range(min(workers, len(mirrors)))]
+    threads = []
+    for k, shard in enumerate(shards):
+        thread = threading.Thread(target=run_worker, args=(shard, stop_event),
+                                  name=f"gateway-worker-{k}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def main():
+    sources = load_sources(sys.argv[1]) if len(sys.argv) > 1 else SOURCES
+
+    # --- CONFIGURAÇÃO DO SERVIDOR LOCAL (CHAINED) ---
+    server, mirrors, history = build_gateway(sources)
+    server.start()
+    drones = sum(len(expand_drones(source)) for source in sources)
+    print(f"[SERVER] Gateway MES rodando em {GATEWAY_ENDPOINT} "
+          f"({len(sources)} fonte(s), {drones} pasta(s) de drone)")
+    if history is not None:
+        n_vars = drones * len(MIRROR_VARS)
+        print(f"[SERVER] Histórico de {HISTORY_POINTS} amostras por variável "
+              f"(até {n_vars * HISTORY_POINTS * 20 / 1e6:.1f} MB)")
+        REGISTRY.callback('sda_gateway_history_samples', "Amostras no histórico em memória",
+                          history.samples)
+        REGISTRY.callback('sda_gateway_history_bytes', "Memória ocupada pelo histórico (bytes)",
+                          history.nbytes)
+    REGISTRY.callback('sda_gateway_sources_connected', "Fontes conectadas",
+                      lambda: sum(m.session.connected for m in mirrors))
+    start_http_server(METRICS_PORT)
 
+    # --- CLIENTES: uma sessão por fonte, divididas entre os workers ---
+    # Cada fonte reconecta sozinha; o servidor local segue no ar
+    stop_event = threading.Event()
+    threads = start_workers(mirrors, GATEWAY_WORKERS, stop_event)
     try:
         while True:
-            # 1. Ler do Prosys (Original)
-            drone_x = dX.get_value()
-            drone_y = dY.get_value()
-            drone_z = dZ.get_value()
-            target_x = tX.get_value()
-            target_y = tY.get_value()
-            target_z = tZ.get_value()
-
-            # 2. Escreve no Servidor Local (Espelho)
-            my_drone_x.set_value(drone_x)
-            my_drone_y.set_value(drone_y)
-            my_drone_z.set_value(drone_z)
-            my_target_x.set_value(target_x)
-            my_target_y.set_value(target_y)
-            my_target_z.set_value(target_z)
-
-            # print(f"[GATEWAY] Replicando: {drone_x:.2f}, {drone_y:.2f}, {drone_z:.2f}")
-            time.sleep(0.5)  # Atualiza a cada 500ms
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
     finally:
-        cliente.disconnect()
+        stop_event.set()
+        for thread in threads:
+            thread.join(timeout=5.0)
         server.stop()
         print("[SISTEMA] Encerrado.")
 
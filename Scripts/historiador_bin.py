@@ -0,0 +1,294 @@
+"""
+Armazenamento binário compacto para o historiador (sinotico.py) e o MES.
+
+Cada evento vira um registro de tamanho fixo (timestamp, x, y, z, código
+do evento) gravado em arquivos de segmento que podem ser mapeados em
+memória. A cada INDEX_STRIDE registros, um índice esparso guarda o
+timestamp e a posição do registro, de modo que uma consulta por intervalo
+de tempo lê apenas os blocos que podem conter o intervalo.
+
+    diretorio/seg_000000.dat   registros '<ddddH6x' (40 bytes)
+    diretorio/seg_000000.idx   entradas  '<dQ' (timestamp, nº do registro)
+
+Os registros devem chegar em ordem (aproximadamente) crescente de tempo.
+
+Uso pela linha de comando:
+    python historiador_bin.py historiador_bin "2025-11-24 21:02" "2025-11-24 21:04"
+"""
+import math
+import os
+import struct
+import sys
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:     # a escrita funciona sem NumPy; as consultas não
+    np = None
+
+RECORD = struct.Struct('<ddddH6x')
+INDEX_ENTRY = struct.Struct('<dQ')
+INDEX_STRIDE = 256                  # registros por entrada do índice esparso
+SEGMENT_RECORDS = 1_000_000         # registros por segmento (~40 MB)
+
+EVENT_CODES = {
+    'POSICAO RECEBIDA': 1,
+    'POSICAO LIDA': 2,
+    'TARGET ENVIADO': 3,
+    'TARGET DETECTADO': 4,
+    'SISTEMA': 5,
+    'CHEGADA ESTACAO': 6,
+    'SAIDA ESTACAO': 7,
+}
+EVENT_NAMES = {code: name for name, code in EVENT_CODES.items()}
+
+if np is not None:
+    RECORD_DTYPE = np.dtype([('timestamp', '<f8'), ('x', '<f8'), ('y', '<f8'),
+                             ('z', '<f8'), ('event', '<u2'), ('_pad', 'V6')])
+    assert RECORD_DTYPE.itemsize == RECORD.size
+
+
+def event_code(event_type: str) -> int:
+    """Código numérico de um tipo de evento (0 se desconhecido)."""
+    return EVENT_CODES.get(event_type.upper(), 0)
+
+
+def parse_time(value) -> float:
+    """Converte epoch ou '%Y-%m-%d %H:%M[:%S[.%f]]' (hora local) em epoch."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M'):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"Timestamp invalido: {value}")
+
+
+class BinaryHistorian:
+    """
+    Escritor e leitor dos segmentos binários de um diretório.
+
+    append() acumula registros em memória; flush() os grava no segmento
+    corrente junto com as entradas de índice. Um único escritor por
+    diretório, e a instância não é compartilhada entre threads: quem
+    consulta em outra thread abre a sua, com readonly=True. query() e
+    tail() veem só o que o escritor já gravou com flush().
+    """
+    def __init__(self, directory: str, segment_records: int = SEGMENT_RECORDS,
+                 index_stride: int = INDEX_STRIDE, readonly: bool = False):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.index_stride = index_stride
+        self.readonly = readonly
+        if not readonly:
+            os.makedirs(directory, exist_ok=True)
+
+        self.pending = []
+        self.segment = None         # número do segmento corrente
+        self.count = 0              # registros no segmento corrente
+        self._data_file = None
+        self._index_file = None
+
+    # ------------------------------------------------------------------
+    # Escrita
+    # ------------------------------------------------------------------
+    def append(self, timestamp: float, x: float = math.nan, y: float = math.nan,
+               z: float = math.nan, event: int = 0):
+        if self.readonly:
+            raise ValueError("BinaryHistorian aberto somente para leitura")
+        self.pending.append((timestamp, x, y, z, event))
+
+    def flush(self):
+        """Grava os registros pendentes no disco."""
+        if not self.pending:
+            return
+        if self._data_file is None:
+            self._open_segment()
+
+        data, index = [], []
+        for rec in self.pending:
+            if self.count >= self.segment_records:
+                self._write(data, index)
+                data, index = [], []
+                self._open_segment(self.segment + 1)
+            if self.count % self.index_stride == 0:
+                index.append(INDEX_ENTRY.pack(rec[0], self.count))
+            data.append(RECORD.pack(*rec))
+            self.count += 1
+        self._write(data, index)
+        self.pending.clear()
+
+    def close(self):
+        self.flush()
+        for f in (self._data_file, self._index_file):
+            if f is not None:
+                f.close()
+        self._data_file = self._index_file = None
+
+    def _write(self, data: list, index: list):
+        self._data_file.write(b''.join(data))
+        self._data_file.flush()
+        if index:
+            self._index_file.write(b''.join(index))
+            self._index_file.flush()
+
+    def _open_segment(self, number: int = None):
+        if self._data_file is not None:
+            self._data_file.close()
+            self._index_file.close()
+
+        if number is None:
+            # Continua após o último segmento existente
+            segments = self.segments()
+            number = segments[-1] + 1 if segments else 0
+        self.segment = number
+        self.count = 0
+        self._data_file = open(self._path(number, 'dat'), 'ab')
+        self._index_file = open(self._path(number, 'idx'), 'ab')
+
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+    def _path(self, number: int, ext: str) -> str:
+        return os.path.join(self.directory, f"seg_{number:06d}.{ext}")
+
+    def segments(self) -> list:
+        numbers = []
+        if not os.path.isdir(self.directory):
+            return numbers
+        for name in os.listdir(self.directory):
+            if name.startswith('seg_') and name.endswith('.dat'):
+                numbers.append(int(name[4:-4]))
+        return sorted(numbers)
+
+    def _read_index(self, number: int, n_records: int):
+        """Índice do segmento, sem as entradas além dos n_records já lidos do .dat."""
+        with open(self._path(number, 'idx'), 'rb') as f:
+            raw = f.read()
+        raw = raw[:len(raw) - len(raw) % INDEX_ENTRY.size]
+        entries = [e for e in INDEX_ENTRY.iter_unpack(raw) if e[1] < n_records]
+        return [e[0] for e in entries], [e[1] for e in entries]
+
+    def _records(self, number: int, start: int, stop: int):
+        return np.memmap(self._path(number, 'dat'), dtype=RECORD_DTYPE, mode='r',
+                         offset=start * RECORD.size, shape=(stop - start,))
+
+    @staticmethod
+    def _codes(events):
+        if events is None:
+            return None
+        return [e if isinstance(e, int) else event_code(e) for e in events]
+
+    @staticmethod
+    def _columns(parts: list) -> dict:
+        records = np.concatenate(parts) if parts else np.empty(0, dtype=RECORD_DTYPE)
+        return {name: records[name] for name in ('timestamp', 'x', 'y', 'z', 'event')}
+
+    def _last_timestamp(self, number: int, n_records: int) -> float:
+        with open(self._path(number, 'dat'), 'rb') as f:
+            f.seek((n_records - 1) * RECORD.size)
+            return RECORD.unpack(f.read(RECORD.size))[0]
+
+    def query(self, t0: float, t1: float, events=None) -> dict:
+        """
+        Retorna os registros com t0 <= timestamp <= t1 como arrays NumPy.
+
+        Args:
+            t0, t1 (float): intervalo em epoch (segundos).
+            events: códigos ou nomes de eventos a incluir (None = todos).
+
+        Returns:
+            dict com 'timestamp', 'x', 'y', 'z' e 'event'.
+        """
+        if np is None:
+            raise ImportError("A consulta ao historiador binario requer NumPy")
+        codes = self._codes(events)
+
+        parts = []
+        for number in self.segments():
+            n_records = os.path.getsize(self._path(number, 'dat')) // RECORD.size
+            if n_records == 0:
+                continue
+            times, offsets = self._read_index(number, n_records)
+            if not times or times[0] > t1 or self._last_timestamp(number, n_records) < t0:
+                continue
+
+            # Blocos que podem conter o intervalo (com um bloco de folga)
+            first = max(bisect_left(times, t0) - 1, 0)
+            last = bisect_right(times, t1)
+            start = offsets[first]
+            stop = offsets[last] if last < len(offsets) else n_records
+
+            block = self._records(number, start, stop)
+            mask = (block['timestamp'] >= t0) & (block['timestamp'] <= t1)
+            if codes is not None:
+                mask &= np.isin(block['event'], codes)
+            parts.append(np.array(block[mask]))
+            del block
+        return self._columns(parts)
+
+    def tail(self, t1: float, n: int, events=None) -> dict:
+        """
+        Os últimos n registros com timestamp <= t1, no formato de query().
+
+        Percorre o índice esparso de trás para frente, um bloco de
+        INDEX_STRIDE registros por vez, e para assim que tem n registros:
+        o custo depende de n, não do tamanho do histórico antes de t1.
+        """
+        if np is None:
+            raise ImportError("A consulta ao historiador binario requer NumPy")
+        codes = self._codes(events)
+
+        parts = []          # do mais recente para o mais antigo
+        found = 0
+        for number in reversed(self.segments()):
+            n_records = os.path.getsize(self._path(number, 'dat')) // RECORD.size
+            if n_records == 0:
+                continue
+            times, offsets = self._read_index(number, n_records)
+            if not times or times[0] > t1:
+                continue
+            last = bisect_right(times, t1)
+            stop = offsets[last] if last < len(offsets) else n_records
+            for k in range(last - 1, -1, -1):
+                block = self._records(number, offsets[k], stop)
+                mask = block['timestamp'] <= t1
+                if codes is not None:
+                    mask &= np.isin(block['event'], codes)
+                selected = np.array(block[mask])
+                del block
+                if len(selected):
+                    parts.append(selected[-(n - found):])
+                    found += len(parts[-1])
+                if found >= n:
+                    return self._columns(parts[::-1])
+                stop = offsets[k]
+        return self._columns(parts[::-1])
+
+
+def main():
+    if len(sys.argv) < 4:
+        print("Uso: python historiador_bin.py <diretorio> <inicio> <fim> [evento ...]")
+        sys.exit(1)
+    store = BinaryHistorian(sys.argv[1], readonly=True)
+    t0, t1 = parse_time(sys.argv[2]), parse_time(sys.argv[3])
+    events = sys.argv[4:] or None
+
+    start = time.perf_counter()
+    result = store.query(t0, t1, events)
+    elapsed = (time.perf_counter() - start) * 1000.0
+
+    for ts, x, y, z, ev in zip(result['timestamp'], result['x'], result['y'],
+                               result['z'], result['event']):
+        when = datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        print(f"[{when}] [{EVENT_NAMES.get(int(ev), ev)}] - X={x}, Y={y}, Z={z}")
+    print(f"--- {len(result['timestamp'])} registro(s) em {elapsed:.1f} ms ---")
+
+
+if __name__ == "__main__":
+    main()
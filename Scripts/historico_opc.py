@@ -0,0 +1,403 @@
+"""
+Histórico em memória de variáveis de um servidor OPC UA (python-opcua) e
+leitura desse histórico pelos clientes com o serviço HistoryRead.
+
+Servidor (gateway.py):
+
+    history = enable_history(server, points)
+    history.historize(node)                     # Historizing + HistoryRead
+    history.save_node_value(node.nodeid, dv)    # a cada valor novo
+
+Cada variável guarda até `points` amostras em três array (instante, valor
+e status; 20 bytes por amostra), descartando as mais antigas. O servidor
+atende leituras raw (ReadRawModifiedDetails, com continuation point e
+ReturnBounds) e processadas (ReadProcessedDetails com os agregados
+Minimum, Maximum e Average por intervalo). Só variáveis numéricas.
+
+Cliente (mes.py):
+
+    read_raw(client, nodes, start, end)                  -> [[DataValue]] por nó
+    read_processed(client, nodes, start, end, interval)  -> [[DataValue]] por nó
+    HistoryFollower(start).fetch(client, nodes)          -> [(t, valores)] novos
+    ChangeMerger(n, start).feed([(t, k, valor), ...])    -> [(t, valores)] agrupados
+
+Cada chamada pede todos os nós em um único HistoryRead (mais um por página
+quando há continuation points).
+"""
+import math
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+from opcua import ua
+from opcua.common import utils
+from opcua.server.history import HistoryManager, HistoryStorageInterface
+
+HISTORY_POINTS = 100000         # amostras por variável (padrão)
+MAX_PROCESSED_INTERVALS = 10000 # intervalos por nó em uma leitura processada
+PAGE_VALUES = 10000             # valores por nó em cada página da leitura raw
+MERGE_WINDOW = 0.005            # mudanças mais próximas que isto formam uma amostra (s)
+
+EPOCH = datetime(1970, 1, 1)    # os timestamps do python-opcua são UTC sem fuso
+WIN_EPOCH = ua.get_win_epoch()  # instante "não especificado" do protocolo
+
+AGGREGATES = {
+    'Minimum': ua.ObjectIds.AggregateFunction_Minimum,
+    'Maximum': ua.ObjectIds.AggregateFunction_Maximum,
+    'Average': ua.ObjectIds.AggregateFunction_Average,
+}
+
+
+def to_epoch(dt: datetime) -> float:
+    """Timestamp OPC UA (UTC sem fuso) -> segundos desde 1970."""
+    return (dt - EPOCH).total_seconds()
+
+
+def from_epoch(t: float) -> datetime:
+    """Segundos desde 1970 -> timestamp OPC UA (UTC sem fuso)."""
+    return EPOCH + timedelta(seconds=t)
+
+
+def _bound(dt, default):
+    """Limite de uma leitura em segundos; None ou WIN_EPOCH não limitam."""
+    if dt is None or dt <= WIN_EPOCH:
+        return default
+    return to_epoch(dt)
+
+
+############################
+# Servidor
+############################
+class NodeHistory:
+    """Amostras de uma variável em ordem de tempo (array contíguos)."""
+    __slots__ = ('times', 'values', 'status', 'limit')
+
+    def __init__(self, limit: int):
+        self.times = array('d')
+        self.values = array('d')
+        self.status = array('I')
+        self.limit = limit
+
+    def append(self, t: float, value: float, status: int) -> bool:
+        """Acrescenta uma amostra; False se for repetida ou fora de ordem."""
+        if self.times:
+            last = self.times[-1]
+            if t < last or (t == last and value == self.values[-1] and status == self.status[-1]):
+                return False
+        self.times.append(t)
+        self.values.append(value)
+        self.status.append(status)
+        # Descarta as mais antigas em blocos (1/8 do limite) para que o
+        # custo de mover os array fique amortizado
+        excess = len(self.times) - self.limit
+        if excess > self.limit // 8:
+            del self.times[:excess]
+            del self.values[:excess]
+            del self.status[:excess]
+        return True
+
+    def span(self, start: float, end: float):
+        """Índices [i, j) das amostras com start <= t <= end."""
+        return bisect_left(self.times, start), bisect_right(self.times, end)
+
+    def datavalue(self, i: int) -> ua.DataValue:
+        dv = ua.DataValue(ua.Variant(self.values[i], ua.VariantType.Double))
+        dv.StatusCode = ua.StatusCode(self.status[i])
+        dv.SourceTimestamp = dv.ServerTimestamp = from_epoch(self.times[i])
+        return dv
+
+
+class RingHistory(HistoryStorageInterface):
+    """
+    Armazenamento do HistoryManager com até `points` amostras por variável
+    (o argumento count de new_historized_node, se dado, prevalece; period
+    é ignorado: o limite é só de memória).
+    """
+    def __init__(self, points: int = HISTORY_POINTS):
+        self.points = points
+        self.lock = threading.Lock()
+        self.nodes = {}
+
+    def historize(self, node):
+        """Marca a variável como historizada e passa a guardar seus valores."""
+        for attr in (ua.AttributeIds.AccessLevel, ua.AttributeIds.UserAccessLevel):
+            level = node.get_attribute(attr).Value.Value
+            node.set_attribute(attr, ua.DataValue(ua.Variant(
+                level | ua.AccessLevel.HistoryRead.mask, ua.VariantType.Byte)))
+        node.set_attribute(ua.AttributeIds.Historizing, ua.DataValue(True))
+        self.new_historized_node(node.nodeid, None)
+
+    def new_historized_node(self, node_id, period, count=0):
+        with self.lock:
+            self.nodes.setdefault(node_id, NodeHistory(count or self.points))
+
+    def save_node_value(self, node_id, datavalue):
+        history = self.nodes.get(node_id)
+        if history is None:
+            return
+        dt = datavalue.SourceTimestamp or datavalue.ServerTimestamp or datetime.utcnow()
+        status = datavalue.StatusCode.value if datavalue.StatusCode is not None else 0
+        with self.lock:
+            history.append(to_epoch(dt), float(datavalue.Value.Value), status)
+
+    def read_node_history(self, node_id, start, end, nb_values, bounds=False):
+        """
+        DataValues entre start e end (inclusive) e o instante em que a
+        próxima página começa (None se não há mais). Com bounds, inclui a
+        amostra anterior a start e a posterior a end.
+        """
+        history = self.nodes.get(node_id)
+        if history is None:
+            return [], None
+        t0, t1 = _bound(start, float('-inf')), _bound(end, float('inf'))
+        with self.lock:
+            times = history.times
+            i, j = history.span(t0, t1)
+            if bounds:
+                if i > 0 and (i == len(times) or times[i] != t0):
+                    i -= 1
+                if j < len(times) and (j == 0 or times[j - 1] != t1):
+                    j += 1
+            cont = None
+            if nb_values and j - i > nb_values:
+                cont = from_epoch(history.times[i + nb_values])
+                j = i + nb_values
+            return [history.datavalue(k) for k in range(i, j)], cont
+
+    def read_processed(self, node_id, start, end, interval_ms, aggregate):
+        """
+        Um DataValue por intervalo de interval_ms a partir de start, com o
+        agregado (nó de AGGREGATES) das amostras boas do intervalo; sem
+        amostras, o status é BadNoData.
+        """
+        history = self.nodes.get(node_id)
+        if history is None:
+            raise ua.UaStatusCodeError(ua.StatusCodes.BadHistoryOperationUnsupported)
+        functions = {AGGREGATES['Minimum']: min, AGGREGATES['Maximum']: max,
+                     AGGREGATES['Average']: lambda v: sum(v) / len(v)}
+        function = functions.get(aggregate.Identifier if aggregate.NamespaceIndex == 0 else None)
+        if function is None:
+            raise ua.UaStatusCodeError(ua.StatusCodes.BadAggregateNotSupported)
+
+        with self.lock:
+            times = history.times
+            if not times:
+                return []
+            # intervalos [a, a + step); sem EndTime, o último inclui a amostra mais recente
+            t0, t1 = _bound(start, times[0]), _bound(end, None)
+            open_end = t1 is None
+            if open_end:
+                t1 = times[-1]
+            step = interval_ms / 1000.0 if interval_ms > 0 else max(t1 - t0, 1e-6)
+            count = max(1, math.ceil((t1 - t0) / step))
+            if count > MAX_PROCESSED_INTERVALS:
+                raise ua.UaStatusCodeError(ua.StatusCodes.BadTooManyOperations)
+            results = []
+            j = bisect_left(times, t0)
+            for k in range(count):
+                a = t0 + k * step
+                i = j
+                if k < count - 1:
+                    j = bisect_left(times, a + step)
+                else:
+                    j = bisect_right(times, t1) if open_end else bisect_left(times, t1)
+                good = [history.values[n] for n in range(i, j) if history.status[n] == 0]
+                if good:
+                    dv = ua.DataValue(ua.Variant(function(good), ua.VariantType.Double))
+                else:
+                    dv = ua.DataValue()
+                    dv.StatusCode = ua.StatusCode(ua.StatusCodes.BadNoData)
+                dv.SourceTimestamp = dv.ServerTimestamp = from_epoch(a)
+                results.append(dv)
+            return results
+
+    def samples(self) -> int:
+        with self.lock:
+            return sum(len(h.times) for h in self.nodes.values())
+
+    def nbytes(self) -> int:
+        with self.lock:
+            return sum(len(h.times) * (h.times.itemsize + h.values.itemsize + h.status.itemsize)
+                       for h in self.nodes.values())
+
+    def read_event_history(self, source_id, start, end, nb_values, evfilter):
+        return [], None
+
+    def stop(self):
+        pass
+
+
+class AggregatingHistoryManager(HistoryManager):
+    """
+    HistoryManager do python-opcua com leituras processadas e ReturnBounds
+    (o original só atende leituras raw, sem limites).
+    """
+    def read_history(self, params):
+        details = params.HistoryReadDetails
+        if not isinstance(details, ua.ReadProcessedDetails):
+            return super().read_history(params)
+        aggregates = details.AggregateType
+        results = []
+        for k, rv in enumerate(params.NodesToRead):
+            result = ua.HistoryReadResult()
+            result.HistoryData = ua.HistoryData()
+            if len(aggregates) not in (1, len(params.NodesToRead)):
+                result.StatusCode = ua.StatusCode(ua.StatusCodes.BadAggregateListMismatch)
+            else:
+                aggregate = aggregates[0] if len(aggregates) == 1 else aggregates[k]
+                try:
+                    result.HistoryData.DataValues = self.storage.read_processed(
+                        rv.NodeId, details.StartTime, details.EndTime,
+                        details.ProcessingInterval, aggregate)
+                except ua.UaStatusCodeError as e:
+                    result.StatusCode = ua.StatusCode(e.code)
+            results.append(result)
+        return results
+
+    def _read_datavalue_history(self, rv, details):
+        starttime = details.StartTime
+        if rv.ContinuationPoint:
+            starttime = ua.ua_binary.Primitives.DateTime.unpack(utils.Buffer(rv.ContinuationPoint))
+        dv, cont = self.storage.read_node_history(rv.NodeId, starttime, details.EndTime,
+                                                  details.NumValuesPerNode,
+                                                  details.ReturnBounds and not rv.ContinuationPoint)
+        if cont:
+            cont = ua.ua_binary.Primitives.DateTime.pack(cont)
+        return dv, cont
+
+
+def enable_history(server, points: int = HISTORY_POINTS) -> RingHistory:
+    """Instala o RingHistory e as leituras processadas no servidor (antes do start())."""
+    storage = RingHistory(points)
+    manager = AggregatingHistoryManager(server.iserver)
+    manager.set_storage(storage)
+    server.iserver.history_manager = manager
+    return storage
+
+
+############################
+# Cliente
+############################
+def _history_read(client, nodes, details) -> list:
+    """Um HistoryRead para todos os nós, seguindo os continuation points."""
+    values = [[] for _ in nodes]
+    pending = {k: b'' for k in range(len(nodes))}
+    while pending:
+        params = ua.HistoryReadParameters()
+        params.HistoryReadDetails = details
+        params.TimestampsToReturn = ua.TimestampsToReturn.Source
+        order = list(pending)
+        for k in order:
+            rv = ua.HistoryReadValueId()
+            rv.NodeId = nodes[k].nodeid
+            rv.ContinuationPoint = pending[k] or None
+            params.NodesToRead.append(rv)
+        results = client.uaclient.history_read(params)
+        pending = {}
+        for k, result in zip(order, results):
+            result.StatusCode.check()
+            values[k].extend(result.HistoryData.DataValues or [])
+            if result.ContinuationPoint:
+                pending[k] = result.ContinuationPoint
+    return values
+
+
+def read_raw(client, nodes, start: datetime = None, end: datetime = None,
+             bounds: bool = False, page: int = PAGE_VALUES) -> list:
+    """Valores brutos de cada nó entre start e end (None: sem limite)."""
+    details = ua.ReadRawModifiedDetails()
+    details.IsReadModified = False
+    details.StartTime = start or WIN_EPOCH
+    details.EndTime = end or WIN_EPOCH
+    details.NumValuesPerNode = page
+    details.ReturnBounds = bounds
+    return _history_read(client, nodes, details)
+
+
+def read_processed(client, nodes, start: datetime, end: datetime,
+                   interval: float, aggregate: str = 'Average') -> list:
+    """Um agregado de AGGREGATES por intervalo de `interval` segundos, por nó."""
+    details = ua.ReadProcessedDetails()
+    details.StartTime = start
+    details.EndTime = end
+    details.ProcessingInterval = interval * 1000.0
+    details.AggregateType = [ua.NodeId(AGGREGATES[aggregate])]
+    return _history_read(client, nodes, details)
+
+
+class ChangeMerger:
+    """
+    Junta mudanças (t, índice da variável, valor) de um grupo de variáveis
+    em amostras (t, [valor de cada variável]): uma por grupo de mudanças a
+    menos de MERGE_WINDOW s entre si, com o último valor conhecido das que
+    não mudaram. Amostras só saem depois que todas as variáveis têm valor.
+
+    Mudanças que não são mais novas que o último valor da variável (já
+    entregues, ex.: o histórico e a subscription cobrindo o mesmo
+    intervalo) são descartadas. As anteriores à última amostra entregue
+    (`last_t`) só definem o valor inicial, ou com prime=True o limite
+    lido do histórico; depois disso, uma mudança que chega atrasada (com
+    mudanças mais novas de outras variáveis já entregues) sai em uma
+    amostra no instante last_t.
+    """
+    def __init__(self, size: int, start: float, merge_window: float = MERGE_WINDOW):
+        self.last_t = start
+        self.merge_window = merge_window
+        self.current = [None] * size
+        self.times = [-math.inf] * size
+
+    def feed(self, changes: list, prime: bool = False) -> list:
+        samples = []
+        group_t = None
+        for t, k, value in sorted(changes, key=lambda c: c[0]):
+            if t <= self.times[k]:
+                continue
+            self.times[k] = t
+            if t <= self.last_t:
+                if prime or None in self.current:
+                    self.current[k] = value
+                    continue
+                t = self.last_t
+            if group_t is not None and t - group_t > self.merge_window:
+                self._emit(samples, group_t)
+                group_t = None
+            if group_t is None:
+                group_t = t
+            self.current[k] = value
+            self.last_t = t
+        if group_t is not None:
+            self._emit(samples, group_t)
+        return samples
+
+    def _emit(self, samples, t):
+        if None not in self.current:
+            samples.append((t, list(self.current)))
+
+
+class HistoryFollower:
+    """
+    Lê incrementalmente o histórico de um grupo de variáveis e o devolve
+    como amostras (t, [valor de cada nó]), agrupadas por um ChangeMerger.
+    A primeira leitura (a partir de `start`) pede os limites, de modo que
+    todas as variáveis tenham valor desde o início.
+    """
+    def __init__(self, start: float, merge_window: float = MERGE_WINDOW):
+        self.start = start
+        self.merge_window = merge_window
+        self.merger = None
+
+    @property
+    def last_t(self) -> float:
+        return self.start if self.merger is None else self.merger.last_t
+
+    def fetch(self, client, nodes) -> list:
+        first = self.merger is None
+        series = read_raw(client, nodes, from_epoch(self.last_t), bounds=first)
+        if first:
+            self.merger = ChangeMerger(len(nodes), self.start, self.merge_window)
+        changes = [(to_epoch(dv.SourceTimestamp), k, dv.Value.Value)
+                   for k, values in enumerate(series) for dv in values
+                   if dv.StatusCode.is_good()]
+        # limite inicial: o último valor até `start` vale como valor inicial
+        return self.merger.feed(changes, prime=first)
@@ -0,0 +1,22 @@
+"""
+Variáveis dos KPIs da missão, compartilhadas pelo gateway.py (que as cria
+em MesKPIs/<nome>, graváveis) e pelo mes.py (que as calcula em
+MissionKPIs e as escreve de volta no gateway).
+"""
+from opcua import ua
+
+KPI_OBJECT = "MesKPIs"
+
+# nome -> tipo da variável
+KPI_VARS = {
+    "DistanceM": ua.VariantType.Double,         # distância percorrida (m)
+    "MovingS": ua.VariantType.Double,           # tempo em movimento (s)
+    "IdleS": ua.VariantType.Double,             # tempo parado (s)
+    "Visits": ua.VariantType.Double,            # chegadas em estações
+    "VisitsPerHour": ua.VariantType.Double,     # chegadas por hora (janela móvel)
+    "LastTravelPair": ua.VariantType.String,    # "Estacao 1 -> Estacao 2"
+    "LastTravelS": ua.VariantType.Double,       # duração do último trajeto (s)
+    "MeanTravelS": ua.VariantType.Double,       # média do último par de estações (s)
+    "LastSettleS": ua.VariantType.Double,       # acomodação na última chegada (s)
+    "LastOvershootM": ua.VariantType.Double,    # sobressinal na última chegada (m)
+}
@@ -1,6 +1,50 @@
+import math
+import queue
 import time
+from collections import deque
 from datetime import datetime
-from opcua import Client
+
+from opcua import ua
+
+from canais import TelemetryBuffer
+from compressao import SwingingDoorCompressor
+from conexao_opc import OpcSession, is_connection_error
+from historiador_bin import BinaryHistorian, event_code
+from historico_opc import ChangeMerger, HistoryFollower, to_epoch
+from kpis_missao import KPI_OBJECT, KPI_VARS
+from mes_store import MES_DB_FILE, MesStore, export_text, format_event, format_position
+from metricas import REGISTRY, start_http_server
+from opc_helpers import BatchIO, subscribe_nodes
+
+# Armazenamento do log:
+#   "sqlite" -> banco mes.db com gravação em lote (mes_store.py, padrão)
+#   "text"   -> mes.txt
+#   "binary" -> historiador_bin.py
+#   "both"   -> mes.txt e historiador_bin.py
+MES_BACKEND = "sqlite"
+MES_LOG_FILE = "mes.txt"
+MES_STORE_DIR = "mes_bin"
+MES_TEXT_EXPORT = False     # com "sqlite", exporta o banco para MES_LOG_FILE ao encerrar
+
+# Compressão das posições (banda morta + swinging door, ver compressao.py)
+MES_COMPRESSION = True
+MES_DEVIATION = 0.005       # erro máximo de reconstrução por eixo (m)
+MES_DEADBAND = 0.001        # variações menores que isto são ignoradas (m)
+MES_HEARTBEAT = 60.0        # intervalo máximo entre posições gravadas (s)
+MES_POLL_PERIOD = 1.0       # intervalo entre leituras do gateway ("history"/"polling") (s)
+
+# Fonte das amostras:
+#   "subscription" -> mudanças do DroneMirror por subscription, enfileiradas
+#                     em memória; a cada (re)conexão, o intervalo sem
+#                     subscription é recuperado do histórico do gateway (padrão)
+#   "history"      -> histórico do gateway (HistoryRead) a cada MES_POLL_PERIOD:
+#                     cada leitura traz todas as mudanças desde a anterior
+#   "polling"      -> valores atuais a cada MES_POLL_PERIOD (gateway sem histórico)
+MES_SOURCE = "subscription"
+MES_BACKFILL = 60.0         # histórico recuperado na partida (s)
+MES_PUBLISHING_INTERVAL_MS = 100    # intervalo de publicação da subscription
+MES_QUEUE_SIZE = 100000     # mudanças em memória; cheia, descarta as mais antigas
+METRICS_PORT = 9104         # endpoint Prometheus (metricas.py); 0 desliga
 
 # Mesma configuração do sinotico.py para identificar os locais
 STATIONS = {
@@ -9,90 +53,529 @@ STATIONS = {
     "Estacao 3": {"x": -2.0, "y": 0.0, "z": 1.0},
     "Estacao 4": {"x": 0.0, "y": -2.0, "z": 1.0},
 }
+STATION_ARRIVAL_RADIUS = 0.15   # distância para registrar a chegada em uma estação (m)
+STATION_DEPARTURE_RADIUS = 0.30 # distância para registrar a saída (m); histerese
+
+# KPIs da missão (MissionKPIs), publicados no gateway em MesKPIs/
+KPI_MOVING_SPEED = 0.05     # acima desta velocidade o drone está em movimento (m/s)
+KPI_MIN_STEP = 0.001        # deslocamentos menores não somam na distância (ruído) (m)
+KPI_SETTLE_BAND = 0.02      # acomodado: a menos disto do target... (m)
+KPI_SETTLE_HOLD = 0.5       # ...por pelo menos este tempo (s)
+KPI_THROUGHPUT_WINDOW = 3600.0  # janela das chegadas por hora (s)
+KPI_PUBLISH_PERIOD = 1.0    # intervalo mínimo entre escritas dos KPIs no gateway (s)
+KPI_SUMMARY_PERIOD = 60.0   # intervalo entre os resumos impressos (s)
 
 
-def identify_location(tx, ty, tz):
-    """Tenta identificar se o drone está indo para uma estação conhecida."""
-    # Pequena tolerância para comparação de float
-    tol = 0.1
+def find_station(x, y, z, tol: float = 0.1):
+    """Nome da estação a menos de `tol` por eixo do ponto, ou None."""
     for name, coords in STATIONS.items():
         if (
-            abs(tx - coords["x"]) < tol
-            and abs(ty - coords["y"]) < tol
-            and abs(tz - coords["z"]) < tol
+            abs(x - coords["x"]) < tol
+            and abs(y - coords["y"]) < tol
+            and abs(z - coords["z"]) < tol
         ):
-            return f"({name})"
-    return "(Manual)"
+            return name
+    return None
 
 
-def main():
-    # Conecta no Gateway (Chained Server)
-    url = "opc.tcp://localhost:4841/freeopcua/server/"
-    client = Client(url)
+class StationTracker:
+    """
+    Chegadas e saídas das estações a partir das posições do drone: chega
+    a menos de STATION_ARRIVAL_RADIUS de uma estação e sai a mais de
+    STATION_DEPARTURE_RADIUS dela (a faixa entre os dois evita eventos
+    repetidos com o drone oscilando na borda).
+    """
+    def __init__(self, stations: dict = STATIONS, arrival: float = STATION_ARRIVAL_RADIUS,
+                 departure: float = STATION_DEPARTURE_RADIUS):
+        self.stations = {name: (c["x"], c["y"], c["z"]) for name, c in stations.items()}
+        self.arrival = arrival
+        self.departure = departure
+        self.current = None
 
-    try:
-        client.connect()
-        print(f"[MES] Conectado ao Gateway em {url}")
+    def update(self, point) -> list:
+        """Eventos (tipo, estação) causados pela nova posição."""
+        events = []
+        if self.current is not None:
+            if math.dist(point, self.stations[self.current]) <= self.departure:
+                return events
+            events.append(("SAIDA ESTACAO", self.current))
+            self.current = None
+        for name, coords in self.stations.items():
+            if math.dist(point, coords) < self.arrival:
+                events.append(("CHEGADA ESTACAO", name))
+                self.current = name
+                break
+        return events
+
+
+class MissionKPIs:
+    """
+    KPIs da missão atualizados a cada amostra, com trabalho O(1) por
+    amostra (a janela das chegadas é amortizada) e sem reler o log:
+
+    * distância percorrida e tempo em movimento / parado (velocidade
+      acima ou abaixo de KPI_MOVING_SPEED);
+    * duração dos trajetos por par de estações (da saída de uma até a
+      chegada na outra): contagem, média, mínimo e máximo;
+    * acomodação e sobressinal a cada target: a acomodação é o tempo
+      entre a chegada (a menos de STATION_ARRIVAL_RADIUS do target) e a
+      entrada definitiva na faixa de KPI_SETTLE_BAND (onde o drone fica
+      por KPI_SETTLE_HOLD s); o sobressinal é o quanto o drone passou do
+      target na direção em que se aproximou;
+    * chegadas em estações por hora, na janela móvel KPI_THROUGHPUT_WINDOW.
+    """
+    def __init__(self, arrival: float = STATION_ARRIVAL_RADIUS):
+        self.arrival = arrival
+        self.distance = 0.0
+        self.moving = 0.0
+        self.idle = 0.0
+        self.visits = 0
+        self.recent = deque()       # instantes das chegadas na janela
+        self.travel = {}            # (de, para) -> [n, soma, mínimo, máximo]
+        self.last_travel = None     # ((de, para), duração)
+        self.last_settle = None
+        self.last_overshoot = None
+        self.first_t = self.last_t = None
+        self.last_point = None
+        self.departure = None       # (estação, instante) da última saída
+        self.goal = None            # target em acomodação
+        self.direction = None       # direção de aproximação do target (unitária)
+        self.arrived_at = None
+        self.in_band_since = None
+        self.overshoot = 0.0
+        self.version = 0            # muda a cada atualização (para publicar só o novo)
 
-        # Setup de namespace e nós
-        uri = "http://meu.gateway.com"
-        idx = client.get_namespace_index(uri)
-        objects = client.get_objects_node()
-        drone_mirror = objects.get_child([f"{idx}:DroneMirror"])
+    def target(self, t: float, point):
+        """Novo target: começa a medir a acomodação e o sobressinal."""
+        self.goal = point
+        self.direction = None
+        if self.last_point is not None:
+            d = math.dist(point, self.last_point)
+            if d > 0:
+                self.direction = tuple((g - p) / d for g, p in zip(point, self.last_point))
+        self.arrived_at = None
+        self.in_band_since = None
+        self.overshoot = 0.0
 
-        # Variáveis
-        var_dx = drone_mirror.get_child([f"{idx}:DroneX"])
-        var_dy = drone_mirror.get_child([f"{idx}:DroneY"])
-        var_dz = drone_mirror.get_child([f"{idx}:DroneZ"])
-        var_tx = drone_mirror.get_child([f"{idx}:TargetX"])
-        var_ty = drone_mirror.get_child([f"{idx}:TargetY"])
-        var_tz = drone_mirror.get_child([f"{idx}:TargetZ"])
+    def station_event(self, t: float, kind: str, station: str):
+        if kind == "SAIDA ESTACAO":
+            self.departure = (station, t)
+            return
+        self.visits += 1
+        self.recent.append(t)
+        if self.departure is not None and self.departure[0] != station:
+            pair = (self.departure[0], station)
+            duration = t - self.departure[1]
+            stats = self.travel.get(pair)
+            if stats is None:
+                self.travel[pair] = [1, duration, duration, duration]
+            else:
+                stats[0] += 1
+                stats[1] += duration
+                stats[2] = min(stats[2], duration)
+                stats[3] = max(stats[3], duration)
+            self.last_travel = (pair, duration)
+        self.departure = None
+        self.version += 1
 
-        print("[MES] Monitorando processo...")
+    def update(self, t: float, point):
+        """Posição nova (amostras em ordem de tempo)."""
+        if self.last_point is not None:
+            dt = t - self.last_t
+            step = math.dist(point, self.last_point)
+            if step >= KPI_MIN_STEP:
+                self.distance += step
+            if dt > 0:
+                if step / dt > KPI_MOVING_SPEED:
+                    self.moving += dt
+                else:
+                    self.idle += dt
+        else:
+            self.first_t = t
+        self.last_t = t
+        self.last_point = point
+        if self.goal is not None:
+            self._settle(t, point)
+        while self.recent and self.recent[0] < t - KPI_THROUGHPUT_WINDOW:
+            self.recent.popleft()
+        self.version += 1
 
-        with open("mes.txt", "w", encoding="utf-8") as f:
+    def _settle(self, t: float, point):
+        d = math.dist(point, self.goal)
+        if self.arrived_at is None:
+            if d >= self.arrival:
+                return
+            self.arrived_at = t
+        if self.direction is not None:
+            past = sum((p - g) * u for p, g, u in zip(point, self.goal, self.direction))
+            self.overshoot = max(self.overshoot, past)
+        if d > KPI_SETTLE_BAND:
+            self.in_band_since = None
+        elif self.in_band_since is None:
+            self.in_band_since = t
+        elif t - self.in_band_since >= KPI_SETTLE_HOLD:
+            self.last_settle = self.in_band_since - self.arrived_at
+            self.last_overshoot = self.overshoot
+            self.goal = None
+
+    def visits_per_hour(self) -> float:
+        if self.last_t is None:
+            return 0.0
+        span = min(KPI_THROUGHPUT_WINDOW, max(self.last_t - self.first_t, KPI_SUMMARY_PERIOD))
+        return len(self.recent) * 3600.0 / span
+
+    def values(self) -> dict:
+        """Valores das variáveis de kpis_missao.KPI_VARS."""
+        pair, duration = self.last_travel or (None, 0.0)
+        stats = self.travel.get(pair)
+        return {
+            "DistanceM": self.distance,
+            "MovingS": self.moving,
+            "IdleS": self.idle,
+            "Visits": float(self.visits),
+            "VisitsPerHour": self.visits_per_hour(),
+            "LastTravelPair": " -> ".join(pair) if pair else "",
+            "LastTravelS": duration,
+            "MeanTravelS": stats[1] / stats[0] if stats else 0.0,
+            "LastSettleS": self.last_settle or 0.0,
+            "LastOvershootM": self.last_overshoot or 0.0,
+        }
+
+    def summary(self) -> list:
+        """Linhas do resumo impresso."""
+        total = self.moving + self.idle
+        lines = [f"[KPI] Distância {self.distance:.2f} m; em movimento {self.moving:.0f} s "
+                 f"({100.0 * self.moving / total if total else 0.0:.0f}%), parado {self.idle:.0f} s; "
+                 f"{self.visits} chegada(s), {self.visits_per_hour():.1f}/h"]
+        if self.last_settle is not None:
+            lines.append(f"[KPI] Última chegada: acomodação {self.last_settle:.2f} s, "
+                         f"sobressinal {self.last_overshoot * 100:.1f} cm")
+        for (a, b), (n, total_s, low, high) in sorted(self.travel.items()):
+            lines.append(f"[KPI] {a} -> {b}: {n} trajeto(s), média {total_s / n:.1f} s "
+                         f"(mín {low:.1f} s, máx {high:.1f} s)")
+        return lines
+
+
+class KpiPublisher:
+    """Escreve os KPIs em MesKPIs/ no gateway, no máximo a cada KPI_PUBLISH_PERIOD."""
+    def __init__(self, kpis: MissionKPIs, paths: dict):
+        self.kpis = kpis
+        self.paths = paths          # nome -> caminho
+        self.next_publish = 0.0
+        self.published = -1
+        self.sent = {}
+
+    def bind(self, session):
+        """Nós da sessão atual; sem eles (gateway antigo) os KPIs não são publicados."""
+        self.nodes = {name: session.nodes[p] for name, p in self.paths.items() if p in session.nodes}
+        self.opc_io = BatchIO(session.client, "MES.KPI", report_period=60.0)
+        self.sent = {}
+        if len(self.nodes) < len(self.paths):
+            print(f"[MES] Gateway sem {KPI_OBJECT}; KPIs só no resumo")
+            self.nodes = {}
+
+    def publish(self):
+        now = time.monotonic()
+        if not self.nodes or now < self.next_publish or self.kpis.version == self.published:
+            return
+        self.next_publish = now + KPI_PUBLISH_PERIOD
+        self.published = self.kpis.version
+        values = self.kpis.values()
+        # Um Write para os Double e outro para o texto, só quando mudou
+        for variant_type in (ua.VariantType.Double, ua.VariantType.String):
+            names = [n for n, vt in KPI_VARS.items()
+                     if vt == variant_type and self.sent.get(n) != values[n]]
+            if not names:
+                continue
+            try:
+                self.opc_io.write([self.nodes[n] for n in names], [values[n] for n in names],
+                                  variant_type)
+            except Exception as e:
+                if is_connection_error(e):
+                    raise
+                print(f"[MES] Erro ao publicar os KPIs ({e}); KPIs só no resumo")
+                self.nodes = {}
+                return
+            self.sent.update((n, values[n]) for n in names)
+
+
+class MesLog:
+    """Destinos do log do MES (banco SQLite, mes.txt e/ou historiador binário)."""
+    def __init__(self, backend: str = MES_BACKEND):
+        self.f = None       # log em texto
+        self.store = None   # log binário
+        self.db = None      # banco SQLite
+        if backend == "sqlite":
+            self.db = MesStore(MES_DB_FILE)
+        if backend in ("binary", "both"):
+            self.store = BinaryHistorian(MES_STORE_DIR)
+        if backend in ("text", "both"):
+            self.f = open(MES_LOG_FILE, "w", encoding="utf-8")
             # Cabeçalho
             start_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            f.write(f"--- Inicio do Log MES: {start_time} ---\n\n")
+            self.f.write(f"--- Inicio do Log MES: {start_time} ---\n\n")
+
+    def position(self, t: float, point):
+        dx, dy, dz = point
+        if self.f is not None:
+            self.f.write(format_position(t, dx, dy, dz) + "\n")
+        if self.store is not None:
+            self.store.append(t, dx, dy, dz, event_code("POSICAO LIDA"))
+        if self.db is not None:
+            self.db.position(t, dx, dy, dz)
+
+    def event(self, t: float, kind: str, station, point):
+        x, y, z = point
+        line = format_event(t, kind, station, x, y, z)
+        if self.f is not None:
+            self.f.write(line + "\n")
+        if self.store is not None:
+            self.store.append(t, x, y, z, event_code(kind))
+        if self.db is not None:
+            self.db.event(t, kind, station, x, y, z)
+        print(line)
+
+    def flush(self):
+        # O banco grava em lote na própria thread
+        if self.f is not None:
+            self.f.flush()
+        if self.store is not None:
+            self.store.flush()
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+        if self.store is not None:
+            self.store.close()
+        if self.db is not None:
+            self.db.close()
+            print(f"[MES] {self.db.written} linha(s) em {MES_DB_FILE} ({self.db.commits} transação(ões))")
+            if MES_TEXT_EXPORT:
+                n = export_text(MES_DB_FILE, MES_LOG_FILE)
+                print(f"[MES] {n} linha(s) exportada(s) para {MES_LOG_FILE}")
 
-            last_target_sig = None  # Para detectar mudança de target
 
-            while True:
-                # Leitura dos valores
-                dx = var_dx.get_value()
-                dy = var_dy.get_value()
-                dz = var_dz.get_value()
-                tx = var_tx.get_value()
-                ty = var_ty.get_value()
-                tz = var_tz.get_value()
+class PollingSource:
+    """Valores atuais do DroneMirror, um Read a cada MES_POLL_PERIOD."""
+    def __init__(self):
+        self.next_read = 0.0
+
+    def bind(self, session, nodes) -> list:
+        self.nodes = nodes
+        self.opc_io = BatchIO(session.client, "MES", report_period=60.0)
+        return []
+
+    def wait(self):
+        time.sleep(max(0.0, self.next_read - time.monotonic()))
+        self.next_read = time.monotonic() + MES_POLL_PERIOD
+
+    def read(self) -> list:
+        self.wait()
+        samples = [(time.time(), self.opc_io.read(self.nodes))]
+        self.opc_io.end_cycle()
+        return samples
+
+
+class HistorySource(PollingSource):
+    """Todas as mudanças desde a leitura anterior, um HistoryRead a cada MES_POLL_PERIOD."""
+    def __init__(self, start: float):
+        super().__init__()
+        self.follower = HistoryFollower(start)
+
+    def bind(self, session, nodes) -> list:
+        self.session = session
+        self.nodes = nodes
+        return []
+
+    def read(self) -> list:
+        self.wait()
+        return self.follower.fetch(self.session.client, self.nodes)
+
+
+class SubscriptionSource:
+    """
+    Mudanças do DroneMirror por subscription. O handler só enfileira
+    (instante, variável, valor) em memória; read() espera a primeira
+    mudança e junta as disponíveis em amostras com o ChangeMerger. Antes
+    de cada subscription nova, o intervalo desde a última mudança entregue
+    é lido do histórico do gateway, de modo que uma queda do MES ou do
+    gateway não deixa buraco no log.
+    """
+    def __init__(self, start: float):
+        self.changes = TelemetryBuffer("ring", MES_QUEUE_SIZE)
+        self.follower = HistoryFollower(start)
+        self.merger = None
+        self.index = {}
+        REGISTRY.callback('sda_mes_queue_depth', "Mudanças aguardando processamento",
+                          self.changes.qsize)
+        REGISTRY.callback('sda_mes_queue_dropped_total', "Mudanças descartadas com a fila cheia",
+                          lambda: self.changes.dropped, kind='counter')
+
+    def bind(self, session, nodes) -> list:
+        """Cria a subscription e devolve as amostras perdidas desde a última entregue."""
+        self.session = session
+        self.index = {node.nodeid: k for k, node in enumerate(nodes)}
+        # A subscription vem antes da leitura do histórico: o que mudar
+        # entre as duas fica na fila e o ChangeMerger descarta o repetido
+        subscribe_nodes(session.client, nodes, self, MES_PUBLISHING_INTERVAL_MS)
+        backlog = []
+        if self.follower is not None:
+            try:
+                backlog = self.follower.fetch(session.client, nodes)
+                self.merger = self.follower.merger
+            except Exception as e:
+                if is_connection_error(e):
+                    raise
+                print(f"[MES] Gateway sem histórico ({e}); seguindo só com a subscription")
+                self.follower = None
+        if self.merger is None:
+            self.merger = ChangeMerger(len(nodes), 0.0)
+        return backlog
+
+    def datachange_notification(self, node, val, data):
+        k = self.index.get(node.nodeid)
+        if k is None:
+            return
+        dv = data.monitored_item.Value
+        ts = dv.SourceTimestamp or dv.ServerTimestamp
+        self.changes.put((to_epoch(ts) if ts else time.time(), k, val))
+
+    def status_change_notification(self, status):
+        print("[MES] Status da subscription alterado:", status)
+
+    def read(self) -> list:
+        try:
+            first = self.changes.get(timeout=MES_POLL_PERIOD)
+        except queue.Empty:
+            # Sem mudanças: confirma que o gateway continua lá
+            self.session.check()
+            return []
+        return self.merger.feed([first] + self.changes.drain())
+
+
+def make_source(kind: str):
+    if kind == "subscription":
+        return SubscriptionSource(time.time() - MES_BACKFILL)
+    if kind == "history":
+        return HistorySource(time.time() - MES_BACKFILL)
+    return PollingSource()
+
+
+def rebind(session, source, paths, error: Exception) -> list:
+    """Reconecta e refaz a fonte (tentando de novo se a conexão cair no meio)."""
+    while True:
+        session.reconnect(error)
+        try:
+            return source.bind(session, [session.nodes[p] for p in paths])
+        except Exception as e:
+            if not is_connection_error(e):
+                raise
+            error = e
+
+
+def main():
+    # Conecta no Gateway (Chained Server); o índice do namespace do
+    # gateway é resolvido pela sessão a cada conexão
+    url = "opc.tcp://localhost:4841/freeopcua/server/"
+    names = ["DroneX", "DroneY", "DroneZ", "TargetX", "TargetY", "TargetZ"]
+    paths = [f"{{gw}}:DroneMirror/{{gw}}:{name}" for name in names]
+    kpi_paths = {name: f"{{gw}}:{KPI_OBJECT}/{{gw}}:{name}" for name in KPI_VARS}
+    session = OpcSession(url, paths + list(kpi_paths.values()), "MES", required=paths,
+                         namespaces={'gw': "http://meu.gateway.com"})
+    log = None
+    compressor = None
+    if MES_COMPRESSION:
+        compressor = SwingingDoorCompressor(MES_DEVIATION, MES_DEADBAND, MES_HEARTBEAT)
+        for name, help_text in (('received', "Posições recebidas pelo compressor"),
+                                ('stored', "Posições mantidas pelo compressor")):
+            REGISTRY.callback(f'sda_mes_positions_{name}_total', help_text,
+                              lambda name=name: getattr(compressor, name), kind='counter')
+    start_http_server(METRICS_PORT)
+    loop_timer = REGISTRY.timer('sda_loop_work_seconds', "Tempo gasto no corpo do loop",
+                                {'loop': 'mes'}, every=1)
+    stations = StationTracker()
+    kpis = MissionKPIs()
+    publisher = KpiPublisher(kpis, kpi_paths)
+    for name, help_text, attr in (('distance_meters', "Distância percorrida", 'distance'),
+                                  ('moving_seconds', "Tempo em movimento", 'moving'),
+                                  ('idle_seconds', "Tempo parado", 'idle')):
+        REGISTRY.callback(f'sda_mes_{name}', help_text, lambda attr=attr: getattr(kpis, attr))
+    REGISTRY.callback('sda_mes_visits_per_hour', "Chegadas em estações por hora",
+                      kpis.visits_per_hour)
+    next_summary = time.monotonic() + KPI_SUMMARY_PERIOD
+
+    try:
+        session.connect()
+        print(f"[MES] Conectado ao Gateway em {url}")
+        log = MesLog(MES_BACKEND)
+        source = make_source(MES_SOURCE)
+        samples = source.bind(session, [session.nodes[p] for p in paths])
+        publisher.bind(session)
+
+        print(f"[MES] Monitorando processo ({MES_SOURCE})...")
 
-                # Timestamp legível
-                ts_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        last_target_sig = None  # Para detectar mudança de target
 
-                # Registrar Mudança de Target
+        while True:
+            t0 = loop_timer.start()
+            for t_sample, (dx, dy, dz, tx, ty, tz) in samples:
+                # Registrar Mudança de Target (formato idêntico ao historiador)
                 current_target_sig = (tx, ty, tz)
                 if current_target_sig != last_target_sig:
-                    local_name = identify_location(tx, ty, tz)
-                    # Formato idêntico ao historiador
-                    log_evt = f"[{ts_now}] [TARGET DETECTADO] - {local_name} X={tx}, Y={ty}, Z={tz}\n"
-                    f.write(log_evt)
-                    print(log_evt.strip())
+                    log.event(t_sample, "TARGET DETECTADO", find_station(tx, ty, tz), (tx, ty, tz))
+                    kpis.target(t_sample, current_target_sig)
                     last_target_sig = current_target_sig
 
-                # Registrar Posição
+                # Chegadas e saídas das estações e KPIs (posições sem compressão)
+                for kind, station in stations.update((dx, dy, dz)):
+                    log.event(t_sample, kind, station, (dx, dy, dz))
+                    kpis.station_event(t_sample, kind, station)
+                kpis.update(t_sample, (dx, dy, dz))
 
-                log_pos = f"[{ts_now}] [POSICAO LIDA] - X={dx}, Y={dy}, Z={dz}\n"
+                # Registrar Posição (apenas os pontos que o compressor mantém)
+                if compressor is not None:
+                    points = compressor.add(t_sample, (dx, dy, dz))
+                else:
+                    points = [(t_sample, (dx, dy, dz))]
+                for t, point in points:
+                    log.position(t, point)
 
-                f.write(log_pos)
-                f.flush()
+            log.flush()
+            if time.monotonic() >= next_summary:
+                next_summary += KPI_SUMMARY_PERIOD
+                for line in kpis.summary():
+                    print(line)
+            loop_timer.stop(t0)
 
-                # Sleep para controlar o tamanho do arquivo
-                time.sleep(1.0)
+            # Amostras novas (mudanças da subscription, do histórico ou os
+            # valores atuais); se o gateway cair, reconecta, refaz os nós e
+            # recupera o intervalo perdido antes de seguir
+            try:
+                publisher.publish()
+                samples = source.read()
+            except Exception as e:
+                if is_connection_error(e):
+                    samples = rebind(session, source, paths, e)
+                    publisher.bind(session)
+                    continue
+                if not isinstance(source, HistorySource):
+                    raise
+                print(f"[MES] Gateway sem histórico ({e}); lendo valores atuais")
+                source = PollingSource()
+                samples = source.bind(session, [session.nodes[p] for p in paths])
 
     except Exception as e:
         print(f"[ERRO MES] {e}")
     finally:
-        client.disconnect()
+        if compressor is not None and log is not None:
+            for t, point in compressor.flush():
+                log.position(t, point)
+            print(f"[MES] Compressão: {compressor.received} amostras -> {compressor.stored} pontos")
+        if log is not None:
+            log.close()
+        for line in kpis.summary():
+            print(line)
+        session.close()
 
 
 if __name__ == "__main__":
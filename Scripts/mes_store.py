@@ -0,0 +1,235 @@
+"""
+Armazenamento do MES em SQLite, com gravação em lote.
+
+Os eventos entram em uma fila em memória (position() / event() nunca
+bloqueiam nem tocam no disco) e uma thread própria os grava em
+transações: uma a cada MES_COMMIT_PERIOD s ou a cada MES_BATCH_SIZE
+linhas, o que vier primeiro, com um executemany por tabela (comandos
+preparados, reaproveitados pelo cache de statements do sqlite3). O banco
+usa WAL com synchronous=NORMAL: cada commit é um append no -wal, sem
+fsync, e os leitores (ex.: export_text) não bloqueiam o escritor.
+
+    positions(t, x, y, z)                       posições mantidas pelo compressor
+    events(t, kind, station, x, y, z)           TARGET DETECTADO, CHEGADA ESTACAO, ...
+
+Os instantes são segundos desde 1970; há índices por t nas duas tabelas e
+por (kind, t) e (station, t) nos eventos.
+
+Uso pela linha de comando (log de texto no formato do mes.txt):
+    python mes_store.py exportar [mes.db] [mes.txt]
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from canais import TelemetryBuffer
+from metricas import REGISTRY
+
+MES_DB_FILE = "mes.db"
+MES_BATCH_SIZE = 5000           # linhas por transação (máximo)
+MES_COMMIT_PERIOD = 1.0         # intervalo máximo entre commits (s)
+MES_QUEUE_SIZE = 1_000_000      # linhas em memória; cheia, descarta as mais antigas
+MES_JOURNAL_MODE = "WAL"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    t REAL NOT NULL, x REAL, y REAL, z REAL
+);
+CREATE TABLE IF NOT EXISTS events (
+    t REAL NOT NULL, kind TEXT NOT NULL, station TEXT, x REAL, y REAL, z REAL
+);
+CREATE INDEX IF NOT EXISTS positions_t ON positions (t);
+CREATE INDEX IF NOT EXISTS events_t ON events (t);
+CREATE INDEX IF NOT EXISTS events_kind_t ON events (kind, t);
+CREATE INDEX IF NOT EXISTS events_station_t ON events (station, t);
+"""
+INSERT_POSITION = "INSERT INTO positions (t, x, y, z) VALUES (?, ?, ?, ?)"
+INSERT_EVENT = "INSERT INTO events (t, kind, station, x, y, z) VALUES (?, ?, ?, ?, ?, ?)"
+
+
+def connect(path: str, journal_mode: str = MES_JOURNAL_MODE) -> sqlite3.Connection:
+    """Abre (ou cria) o banco com o esquema do MES."""
+    db = sqlite3.connect(path)
+    db.execute(f"PRAGMA journal_mode={journal_mode}")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+class MesStore:
+    """
+    Fila em memória + thread de gravação em lote no SQLite.
+
+        store = MesStore("mes.db")
+        store.position(t, x, y, z)
+        store.event(t, "TARGET DETECTADO", "Estacao 1", x, y, z)
+        store.flush()       # espera o commit de tudo que já foi enfileirado
+        store.close()
+
+    batch_size=1 grava uma transação por linha (referência do bench_mes.py).
+    """
+    def __init__(self, path: str = MES_DB_FILE, batch_size: int = MES_BATCH_SIZE,
+                 commit_period: float = MES_COMMIT_PERIOD, queue_size: int = MES_QUEUE_SIZE,
+                 journal_mode: str = MES_JOURNAL_MODE):
+        self.path = path
+        self.batch_size = batch_size
+        self.commit_period = commit_period
+        self.journal_mode = journal_mode
+        self.queue = TelemetryBuffer("ring", queue_size)
+        self.enqueued = 0
+        self.written = 0
+        self.commits = 0
+        self.error = None
+        self._stop = threading.Event()
+        self._flush_now = threading.Event()
+        self._flushed = threading.Condition()
+
+        self._rows = REGISTRY.counter('sda_mes_store_rows_total', "Linhas gravadas no SQLite")
+        self._commit_time = REGISTRY.histogram('sda_mes_store_commit_seconds',
+                                               "Duração de cada transação no SQLite")
+        REGISTRY.callback('sda_mes_store_queue_depth', "Linhas aguardando gravação",
+                          self.queue.qsize)
+        REGISTRY.callback('sda_mes_store_dropped_total', "Linhas descartadas com a fila cheia",
+                          lambda: self.queue.dropped, kind='counter')
+
+        # O esquema é criado aqui para que erros de abertura apareçam na partida
+        connect(path, journal_mode).close()
+        self._thread = threading.Thread(target=self._run, name="mes-store", daemon=True)
+        self._thread.start()
+
+    def position(self, t: float, x: float, y: float, z: float):
+        self.queue.put((t, x, y, z))
+        self.enqueued += 1
+
+    def event(self, t: float, kind: str, station, x: float, y: float, z: float):
+        self.queue.put((t, kind, station, x, y, z))
+        self.enqueued += 1
+
+    def flush(self, timeout: float = None) -> bool:
+        """Grava já as linhas enfileiradas e espera o commit; False se o tempo acabar."""
+        target = self.enqueued - self.queue.dropped
+        self._wake(self._flush_now)
+        with self._flushed:
+            return self._flushed.wait_for(
+                lambda: self.written >= target or self.error is not None or not self._thread.is_alive(),
+                timeout)
+
+    def close(self):
+        """Grava o que falta na fila e fecha o banco."""
+        self._wake(self._stop)
+        self._thread.join()
+        if self.error is not None:
+            print(f"[MES] Erro na gravação do SQLite: {self.error}")
+
+    def _wake(self, event: threading.Event):
+        event.set()
+        with self.queue.cond:
+            self.queue.cond.notify_all()
+
+    def _run(self):
+        db = connect(self.path, self.journal_mode)
+        pending = []
+        deadline = 0.0
+        try:
+            while True:
+                stopping = self._stop.is_set()
+                urgent = stopping or self._flush_now.is_set()
+                rows = self.queue.drain()
+                now = time.monotonic()
+                if rows:
+                    if not pending:
+                        deadline = now + self.commit_period
+                    pending.extend(rows)
+                while len(pending) >= self.batch_size:
+                    self._commit(db, pending[:self.batch_size])
+                    del pending[:self.batch_size]
+                if pending and (now >= deadline or urgent):
+                    self._commit(db, pending)
+                    pending = []
+                if urgent and not rows:
+                    self._flush_now.clear()
+                if rows:
+                    continue
+                if stopping and not pending:
+                    break
+                with self.queue.cond:
+                    if not (self.queue.samples or self._stop.is_set() or self._flush_now.is_set()):
+                        self.queue.cond.wait(deadline - now if pending else self.commit_period)
+        except Exception as e:
+            self.error = e
+        finally:
+            db.close()
+            with self._flushed:
+                self._flushed.notify_all()
+
+    def _commit(self, db, rows: list):
+        t0 = time.perf_counter()
+        positions = [r for r in rows if len(r) == 4]
+        events = [r for r in rows if len(r) != 4]
+        with db:
+            if positions:
+                db.executemany(INSERT_POSITION, positions)
+            if events:
+                db.executemany(INSERT_EVENT, events)
+        self._commit_time.observe(time.perf_counter() - t0)
+        self._rows.inc(len(rows))
+        self.commits += 1
+        with self._flushed:
+            self.written += len(rows)
+            self._flushed.notify_all()
+
+
+def _timestamp(t: float) -> str:
+    return datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def format_position(t: float, x, y, z) -> str:
+    """Linha de posição no formato do mes.txt (lida por compressao.load_mes_log)."""
+    return f"[{_timestamp(t)}] [POSICAO LIDA] - X={x}, Y={y}, Z={z}"
+
+
+def format_event(t: float, kind: str, station, x, y, z) -> str:
+    """Linha de evento no formato do mes.txt; station None vira (Manual)."""
+    return f"[{_timestamp(t)}] [{kind}] - ({station or 'Manual'}) X={x}, Y={y}, Z={z}"
+
+
+def export_text(db_path: str = MES_DB_FILE, txt_path: str = "mes.txt") -> int:
+    """Exporta o banco como log de texto, em ordem de tempo; retorna o nº de linhas."""
+    db = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    count = 0
+    try:
+        rows = db.execute(
+            "SELECT t, NULL, NULL, x, y, z FROM positions "
+            "UNION ALL SELECT t, kind, station, x, y, z FROM events ORDER BY t")
+        with open(txt_path, "w", encoding="utf-8") as f:
+            f.write(f"--- Inicio do Log MES: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ---\n\n")
+            for t, kind, station, x, y, z in rows:
+                if kind is None:
+                    f.write(format_position(t, x, y, z) + "\n")
+                else:
+                    f.write(format_event(t, kind, station, x, y, z) + "\n")
+                count += 1
+    finally:
+        db.close()
+    return count
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] != "exportar":
+        print("Uso: python mes_store.py exportar [mes.db] [mes.txt]")
+        sys.exit(1)
+    db_path = args[1] if len(args) > 1 else MES_DB_FILE
+    txt_path = args[2] if len(args) > 2 else "mes.txt"
+    if not os.path.exists(db_path):
+        print(f"Banco não encontrado: {db_path}")
+        sys.exit(1)
+    n = export_text(db_path, txt_path)
+    print(f"[MES] {n} linha(s) exportada(s) de {db_path} para {txt_path}")
+
+
+if __name__ == "__main__":
+    main()
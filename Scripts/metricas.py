@@ -0,0 +1,289 @@
+"""
+Métricas dos processos no formato texto do Prometheus, servidas por HTTP.
+
+Cada módulo registra suas métricas no REGISTRY do processo e chama
+start_http_server(METRICS_PORT) no main(); o endpoint é
+http://127.0.0.1:<porta>/metrics.
+
+O custo nos caminhos críticos é mínimo:
+
+* Counter e Histogram guardam os valores em células por thread (cada
+  thread só escreve na sua), sem locks; a soma é feita na leitura. A
+  célula de uma thread que terminou é somada a uma base e descartada.
+* SampledTimer mede apenas 1 a cada `every` execuções.
+* Profundidade de filas e contadores já existentes (ex.: descartes do
+  TelemetryBuffer) são lidos por callback só quando o endpoint é acessado.
+"""
+import itertools
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SAMPLE_EVERY = 16       # padrão do SampledTimer: mede 1 a cada 16 execuções
+
+
+def _format_labels(labels: tuple, extra: str = '') -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Holder:
+    """Dono da célula de uma thread (no threading.local); some com a thread."""
+    __slots__ = ('cell', '__weakref__')
+
+
+class _PerThread:
+    """
+    Células por thread; cada thread cria a sua no primeiro uso. Quando a
+    thread termina, a célula é somada à célula base e descartada, de modo
+    que threads de vida curta (ex.: as de conexão do gateway) não deixam
+    células para trás.
+    """
+    def __init__(self, factory):
+        self._factory = factory
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._base = factory()
+        self._cells = {}                    # id -> célula das threads vivas
+
+    def cell(self):
+        try:
+            return self._local.holder.cell
+        except AttributeError:
+            holder = self._local.holder = _Holder()
+            cell = holder.cell = self._factory()
+            with self._lock:
+                self._cells[id(cell)] = cell
+            weakref.finalize(holder, self._retire, cell)
+            return cell
+
+    def _retire(self, cell):
+        with self._lock:
+            for i, value in enumerate(cell):
+                self._base[i] += value
+            del self._cells[id(cell)]
+
+    def cells(self) -> list:
+        with self._lock:
+            return [list(self._base)] + list(self._cells.values())
+
+
+class Counter:
+    """Contador monotônico."""
+    kind = 'counter'
+
+    def __init__(self):
+        self._cells = _PerThread(lambda: [0])
+
+    def inc(self, n=1):
+        self._cells.cell()[0] += n
+
+    def value(self):
+        return sum(c[0] for c in self._cells.cells())
+
+    def samples(self, name: str, labels: tuple) -> list:
+        return [f"{name}{_format_labels(labels)} {_format_value(self.value())}"]
+
+
+class Gauge:
+    """Valor instantâneo definido com set()."""
+    kind = 'gauge'
+
+    def __init__(self):
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    def value(self):
+        return self._value
+
+    def samples(self, name: str, labels: tuple) -> list:
+        return [f"{name}{_format_labels(labels)} {_format_value(self._value)}"]
+
+
+class Callback:
+    """Gauge ou counter cujo valor é lido de uma função na hora da coleta."""
+    def __init__(self, fn, kind: str = 'gauge'):
+        self.fn = fn
+        self.kind = kind
+
+    def value(self):
+        return self.fn()
+
+    def samples(self, name: str, labels: tuple) -> list:
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        return [f"{name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Histogram:
+    """Histograma com faixas fixas (limites superiores em segundos)."""
+    kind = 'histogram'
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        n = len(self.buckets) + 1
+        # célula: [contagem por faixa..., soma, total]
+        self._cells = _PerThread(lambda: [0] * n + [0.0, 0])
+
+    def observe(self, value: float):
+        cell = self._cells.cell()
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def snapshot(self):
+        n = len(self.buckets) + 1
+        counts = [0] * n
+        total_sum, total = 0.0, 0
+        for cell in self._cells.cells():
+            for i in range(n):
+                counts[i] += cell[i]
+            total_sum += cell[-2]
+            total += cell[-1]
+        return counts, total_sum, total
+
+    def samples(self, name: str, labels: tuple) -> list:
+        counts, total_sum, total = self.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{name}_bucket{_format_labels(labels, le)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total_sum)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {total}")
+        return lines
+
+
+class SampledTimer:
+    """
+    Cronômetro amostrado para loops e chamadas frequentes:
+
+        t0 = timer.start()      # None nas execuções não amostradas
+        ...
+        timer.stop(t0)
+
+    O _count do histograma conta só as execuções medidas.
+    """
+    def __init__(self, histogram: Histogram, every: int = SAMPLE_EVERY):
+        self.histogram = histogram
+        self.every = every
+        self._ticks = itertools.count()     # next() é atômico no CPython
+
+    def start(self):
+        if next(self._ticks) % self.every:
+            return None
+        return time.perf_counter()
+
+    def stop(self, t0):
+        if t0 is not None:
+            self.histogram.observe(time.perf_counter() - t0)
+
+
+class Registry:
+    """Conjunto de métricas do processo, agrupadas por nome."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.families = {}      # nome -> [tipo, ajuda, {labels: métrica}]
+
+    def _get(self, name: str, help_text: str, labels: dict, factory):
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            family = self.families.get(name)
+            if family is None:
+                metric = factory()
+                self.families[name] = [metric.kind, help_text, {key: metric}]
+                return metric
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: dict = None) -> Counter:
+        return self._get(name, help_text, labels, Counter)
+
+    def gauge(self, name: str, help_text: str, labels: dict = None) -> Gauge:
+        return self._get(name, help_text, labels, Gauge)
+
+    def histogram(self, name: str, help_text: str, labels: dict = None,
+                  buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(name, help_text, labels, lambda: Histogram(buckets))
+
+    def callback(self, name: str, help_text: str, fn, labels: dict = None,
+                 kind: str = 'gauge') -> Callback:
+        """Registra (ou substitui) uma métrica lida de fn() na coleta."""
+        key = tuple(sorted((labels or {}).items()))
+        metric = Callback(fn, kind)
+        with self.lock:
+            family = self.families.setdefault(name, [kind, help_text, {}])
+            family[2][key] = metric
+        return metric
+
+    def timer(self, name: str, help_text: str, labels: dict = None,
+              every: int = SAMPLE_EVERY, buckets=DEFAULT_BUCKETS) -> SampledTimer:
+        return SampledTimer(self.histogram(name, help_text, labels, buckets), every)
+
+    def render(self) -> str:
+        """Todas as métricas no formato texto do Prometheus (versão 0.0.4)."""
+        with self.lock:
+            families = [(name, f[0], f[1], list(f[2].items()))
+                        for name, f in sorted(self.families.items())]
+        lines = []
+        for name, kind, help_text, children in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in children:
+                lines.extend(metric.samples(name, labels))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def start_http_server(port: int, registry: Registry = REGISTRY, host: str = '127.0.0.1'):
+    """
+    Serve /metrics em uma thread daemon. Retorna o servidor, ou None se a
+    porta for 0/None ou não puder ser aberta (o processo segue sem métricas).
+    """
+    if not port:
+        return None
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        print(f"[METRICS] Não foi possível abrir a porta {port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"[METRICS] Métricas em http://{host}:{port}/metrics")
+    return server
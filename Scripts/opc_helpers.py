@@ -0,0 +1,228 @@
+"""
+Funções auxiliares de OPC UA compartilhadas pelos scripts do projeto.
+"""
+import itertools
+import threading
+import time
+
+from opcua import ua
+
+from metricas import REGISTRY
+
+# Fim de uma resposta de Publish: silêncio de BATCH_IDLE s (limitado à metade
+# do intervalo de publicação) depois da última notificação recebida
+BATCH_IDLE = 0.01
+# A thread que detecta o fim das respostas termina após BATCH_LINGER s sem
+# notificações e é recriada na próxima
+BATCH_LINGER = 1.0
+
+
+class BatchBoundary:
+    """
+    Envolve um handler de subscription e chama o seu datachange_batch_end()
+    no fim de cada rajada de notificações.
+
+    O python-opcua entrega os itens de uma resposta de Publish um a um, sem
+    avisar o fim da resposta; como eles chegam em sequência e as respostas
+    são separadas pelo intervalo de publicação, a rajada termina quando a
+    subscription fica `idle` s sem notificações novas. Respostas processadas
+    em atraso, uma colada na outra, podem cair no mesmo lote. As
+    notificações e o fim do lote são serializados, de modo que o handler não
+    precisa de lock próprio para o lote em curso.
+
+    Os demais atributos (status_change_notification etc.) são os do handler.
+    """
+    def __init__(self, handler, idle: float = BATCH_IDLE):
+        self.handler = handler
+        self.idle = idle
+        self.cond = threading.Condition()
+        self.last = None            # instante da última notificação do lote em curso
+        self.running = False
+
+    def __getattr__(self, name):
+        return getattr(self.handler, name)
+
+    def datachange_notification(self, node, val, data):
+        with self.cond:
+            self.handler.datachange_notification(node, val, data)
+            if self.last is None:
+                self.cond.notify()
+            self.last = time.monotonic()
+            if not self.running:
+                self.running = True
+                threading.Thread(target=self._run, name="opc-batch", daemon=True).start()
+
+    def _run(self):
+        with self.cond:
+            idle_since = time.monotonic()
+            while True:
+                now = time.monotonic()
+                if self.last is not None:
+                    if now - self.last < self.idle:
+                        self.cond.wait(self.last + self.idle - now)
+                        continue
+                    self.last = None
+                    idle_since = now
+                    try:
+                        self.handler.datachange_batch_end()
+                    except Exception as e:
+                        print("[OPC] Erro no fim do lote de notificações:", e)
+                elif now - idle_since < BATCH_LINGER:
+                    self.cond.wait(idle_since + BATCH_LINGER - now)
+                else:
+                    self.running = False
+                    return
+
+
+def subscribe_nodes(client, nodes, handler, publishing_interval_ms, sampling_interval_ms=None, queuesize=0):
+    """
+    Cria uma subscription e um monitored item por nó.
+
+    O python-opcua usa o intervalo de publicação também como intervalo de
+    amostragem; aqui o pedido de cada item é montado com a API pública
+    (create_monitored_items) para que os dois possam ser configurados
+    separadamente.
+
+    Args:
+        client: cliente OPC UA já conectado.
+        nodes: lista de nós a monitorar.
+        handler: objeto com o método datachange_notification(node, val, data)
+            e, opcionalmente, datachange_batch_end(), chamado depois de
+            todos os itens de uma mesma resposta de Publish (as mudanças de
+            um Write com vários nós chegam juntas, mas uma a uma); veja
+            BatchBoundary.
+        publishing_interval_ms (float): intervalo de publicação da subscription.
+        sampling_interval_ms (float): intervalo de amostragem no servidor
+            (None usa o intervalo de publicação).
+        queuesize (int): tamanho da fila de cada monitored item no servidor.
+
+    Returns:
+        A subscription criada (use sub.delete() para removê-la).
+    """
+    if sampling_interval_ms is None:
+        sampling_interval_ms = publishing_interval_ms
+
+    if hasattr(handler, "datachange_batch_end"):
+        handler = BatchBoundary(handler, min(BATCH_IDLE, publishing_interval_ms / 2000.0))
+    sub = client.create_subscription(publishing_interval_ms, handler)
+    handles = itertools.count(1)
+    requests = []
+    for node in nodes:
+        item = ua.ReadValueId()
+        item.NodeId = node.nodeid
+        item.AttributeId = ua.AttributeIds.Value
+        params = ua.MonitoringParameters()
+        params.ClientHandle = next(handles)
+        params.SamplingInterval = sampling_interval_ms
+        params.QueueSize = queuesize
+        params.DiscardOldest = True
+        mir = ua.MonitoredItemCreateRequest()
+        mir.ItemToMonitor = item
+        mir.MonitoringMode = ua.MonitoringMode.Reporting
+        mir.RequestedParameters = params
+        requests.append(mir)
+
+    results = sub.create_monitored_items(requests)
+    for result in results:
+        if isinstance(result, ua.StatusCode):
+            sub.delete()
+            result.check()
+    return sub
+
+
+class BatchIO:
+    """
+    Leitura e escrita de vários nós com um único serviço Read/Write.
+
+    Cada chamada de read()/write() é um round trip ao servidor; a classe
+    conta os round trips e, chamando end_cycle() ao fim de cada ciclo do
+    loop, informa periodicamente a média de round trips por ciclo.
+
+    As chamadas também alimentam as métricas sda_opc_* do processo
+    (contagem, valores, erros e duração amostrada).
+    """
+    def __init__(self, client, name: str = "OPC", report_period: float = 10.0):
+        self.client = client
+        self.name = name
+        self.report_period = report_period
+        self.round_trips = 0
+        self.cycles = 0
+        self._calls, self._values, self._errors, self._timers = {}, {}, {}, {}
+        for op in ('read', 'write'):
+            labels = {'op': op}
+            self._calls[op] = REGISTRY.counter('sda_opc_calls_total', "Chamadas Read/Write OPC UA", labels)
+            self._values[op] = REGISTRY.counter('sda_opc_values_total', "Valores lidos/escritos", labels)
+            self._errors[op] = REGISTRY.counter('sda_opc_errors_total', "Chamadas OPC UA com erro", labels)
+            self._timers[op] = REGISTRY.timer('sda_opc_call_seconds',
+                                              "Duração das chamadas OPC UA (amostrada)", labels)
+        self._window_trips = 0
+        self._window_cycles = 0
+        self._next_report = time.monotonic() + report_period
+
+    def read_data_values(self, nodes) -> list:
+        """Lê o atributo Value de todos os nós em um único Read."""
+        params = ua.ReadParameters()
+        for node in nodes:
+            rv = ua.ReadValueId()
+            rv.NodeId = node.nodeid
+            rv.AttributeId = ua.AttributeIds.Value
+            params.NodesToRead.append(rv)
+        t0 = self._timers['read'].start()
+        try:
+            results = self.client.uaclient.read(params)
+        except Exception:
+            self._errors['read'].inc()
+            raise
+        self._timers['read'].stop(t0)
+        self._calls['read'].inc()
+        self._values['read'].inc(len(params.NodesToRead))
+        self.round_trips += 1
+        self._window_trips += 1
+        return results
+
+    def read(self, nodes) -> list:
+        """Lê os valores de todos os nós em um único Read."""
+        values = []
+        for dv in self.read_data_values(nodes):
+            dv.StatusCode.check()
+            values.append(dv.Value.Value)
+        return values
+
+    def write(self, nodes, values, variant_type=ua.VariantType.Double):
+        """Escreve os valores em todos os nós em um único Write."""
+        params = ua.WriteParameters()
+        for node, value in zip(nodes, values):
+            wv = ua.WriteValue()
+            wv.NodeId = node.nodeid
+            wv.AttributeId = ua.AttributeIds.Value
+            wv.Value = ua.DataValue(ua.Variant(value, variant_type))
+            params.NodesToWrite.append(wv)
+        t0 = self._timers['write'].start()
+        try:
+            results = self.client.uaclient.write(params)
+        except Exception:
+            self._errors['write'].inc()
+            raise
+        self._timers['write'].stop(t0)
+        self._calls['write'].inc()
+        self._values['write'].inc(len(params.NodesToWrite))
+        self.round_trips += 1
+        self._window_trips += 1
+        for result in results:
+            if not result.is_good():
+                self._errors['write'].inc()
+            result.check()
+
+    def end_cycle(self):
+        """Marca o fim de um ciclo e imprime o relatório quando for a hora."""
+        self.cycles += 1
+        self._window_cycles += 1
+        now = time.monotonic()
+        if self.report_period and now >= self._next_report:
+            if self._window_cycles:
+                print(f"[{self.name}] Round trips OPC UA por ciclo: "
+                      f"{self._window_trips / self._window_cycles:.2f} "
+                      f"({self._window_cycles} ciclos, total {self.round_trips})")
+            self._window_trips = 0
+            self._window_cycles = 0
+            self._next_report = now + self.report_period
@@ -0,0 +1,239 @@
+"""
+Protocolo do link TCP entre o CLP e o sinótico.
+
+Dois formatos convivem no mesmo socket:
+
+* CSV (legado): uma mensagem por linha, "x,y,z,timestamp\\n" do CLP para a
+  IHM e "x,y,z\\n" da IHM para o CLP.
+* Binário: quadros com prefixo de tamanho, negociados por HELLO/HELLO_ACK.
+
+    cabeçalho  !2sBBI  -> magic b'SD', versão, tipo, tamanho do payload
+    TELEMETRY  !H + n * SAMPLE (lote de amostras)
+    SAMPLE     !HIddddd -> drone, seq, monotônico, timestamp, x, y, z
+    TARGET     !HIdddd  -> drone, seq, monotônico, x, y, z
+    HELLO      vazio ou !B -> recursos do cliente (FEATURE_*)
+    TRACE      !HII     -> drone, id do comando, seq da amostra
+
+A IHM envia HELLO ao conectar; o CLP responde HELLO_ACK e passa a enviar
+quadros binários para aquele cliente. O seq do TARGET é o ID do comando
+(tracer.py); quem anuncia FEATURE_TRACE no HELLO recebe, logo após o
+quadro TELEMETRY, um quadro TRACE para cada amostra que primeiro reflete
+um comando. Clientes e servidores antigos
+continuam falando CSV. Como nenhuma linha CSV começa com o magic, o
+decodificador identifica o formato de cada mensagem pelo seu início.
+"""
+import struct
+import time
+
+MAGIC = b'SD'
+VERSION = 1
+
+MSG_HELLO = 1
+MSG_HELLO_ACK = 2
+MSG_TELEMETRY = 3
+MSG_TARGET = 4
+MSG_TRACE = 5
+
+FEATURE_TRACE = 0x01
+
+HEADER = struct.Struct('!2sBBI')
+COUNT = struct.Struct('!H')
+SAMPLE = struct.Struct('!HIddddd')
+TARGET = struct.Struct('!HIdddd')
+FEATURES = struct.Struct('!B')
+TRACE = struct.Struct('!HII')
+
+MAX_BATCH = 0xFFFF
+MAX_PAYLOAD = 1 << 20
+# Tempo sem dados após o qual um trecho CSV incompleto de um cliente antigo
+# (sem '\n') é entregue como está
+LEGACY_CHUNK_TIMEOUT = 0.2
+
+
+class ProtocolError(Exception):
+    """Quadro binário malformado."""
+
+
+def _frame(msg_type: int, payload: bytes = b'') -> bytes:
+    return HEADER.pack(MAGIC, VERSION, msg_type, len(payload)) + payload
+
+
+def encode_hello(features: int = 0) -> bytes:
+    # Sem recursos o HELLO continua vazio, como na primeira versão
+    return _frame(MSG_HELLO, FEATURES.pack(features) if features else b'')
+
+
+def encode_hello_ack() -> bytes:
+    return _frame(MSG_HELLO_ACK)
+
+
+def encode_telemetry(samples: list) -> bytes:
+    """Codifica uma lista de amostras em um ou mais quadros TELEMETRY."""
+    frames = []
+    for start in range(0, len(samples), MAX_BATCH):
+        batch = samples[start:start + MAX_BATCH]
+        payload = [COUNT.pack(len(batch))]
+        for s in batch:
+            payload.append(SAMPLE.pack(s.get('drone', 0), s.get('seq', 0) & 0xFFFFFFFF,
+                                       s.get('mono', 0.0), s['timestamp'],
+                                       s['x'], s['y'], s['z']))
+        frames.append(_frame(MSG_TELEMETRY, b''.join(payload)))
+    return b''.join(frames)
+
+
+def encode_target(target: dict, seq: int = 0, drone: int = 0) -> bytes:
+    payload = TARGET.pack(drone, seq & 0xFFFFFFFF, time.monotonic(),
+                          target['x'], target['y'], target['z'])
+    return _frame(MSG_TARGET, payload)
+
+
+def encode_trace(cmd_id: int, seq: int, drone: int = 0) -> bytes:
+    return _frame(MSG_TRACE, TRACE.pack(drone, cmd_id & 0xFFFFFFFF, seq & 0xFFFFFFFF))
+
+
+def encode_csv_telemetry(samples: list) -> bytes:
+    return ''.join(f"{s['x']},{s['y']},{s['z']},{s['timestamp']}\n" for s in samples).encode('utf-8')
+
+
+def encode_csv_target(target: dict) -> bytes:
+    return f"{target['x']},{target['y']},{target['z']}\n".encode('utf-8')
+
+
+def _is_command(chunk: bytes) -> bool:
+    fields = chunk.split(b',')
+    if len(fields) != 3:
+        return False
+    try:
+        for field in fields:
+            float(field)
+    except ValueError:
+        return False
+    return True
+
+
+def _decode_telemetry(payload: bytes) -> list:
+    if len(payload) < COUNT.size:
+        raise ProtocolError("Quadro TELEMETRY sem contagem")
+    (count,) = COUNT.unpack_from(payload, 0)
+    if len(payload) != COUNT.size + count * SAMPLE.size:
+        raise ProtocolError("Tamanho do quadro TELEMETRY inconsistente")
+    samples = []
+    for drone, seq, mono, ts, x, y, z in SAMPLE.iter_unpack(payload[COUNT.size:]):
+        samples.append({'drone': drone, 'seq': seq, 'mono': mono, 'timestamp': ts,
+                        'x': x, 'y': y, 'z': z})
+    return samples
+
+
+def _decode_target(payload: bytes) -> dict:
+    if len(payload) != TARGET.size:
+        raise ProtocolError("Tamanho do quadro TARGET inconsistente")
+    drone, seq, mono, x, y, z = TARGET.unpack(payload)
+    return {'drone': drone, 'seq': seq, 'mono': mono, 'x': x, 'y': y, 'z': z}
+
+
+def _decode_trace(payload: bytes) -> dict:
+    if len(payload) != TRACE.size:
+        raise ProtocolError("Tamanho do quadro TRACE inconsistente")
+    drone, cmd_id, seq = TRACE.unpack(payload)
+    return {'drone': drone, 'cmd_id': cmd_id, 'seq': seq}
+
+
+class StreamDecoder:
+    """
+    Decodificador de fluxo TCP com buffer.
+
+    Acumula os bytes recebidos e só entrega mensagens completas, mesmo que
+    um recv() traga várias mensagens ou apenas parte de uma. Cada mensagem
+    é uma tupla (tipo, conteúdo):
+
+        ('hello', recursos), ('hello_ack', None)
+        ('telemetry', [amostra, ...])
+        ('target', {...})
+        ('trace', {...})
+        ('csv', [campo, ...])
+
+    Com legacy_chunks=True, enquanto o par nunca tiver enviado uma quebra de
+    linha (os clientes antigos enviavam "x,y,z" sem terminador), um trecho
+    CSV sem '\\n' que já forma um comando x,y,z completo é tratado como
+    mensagem. Um trecho incompleto (o comando veio partido em dois segmentos
+    TCP) continua no buffer até chegar o resto ou passar LEGACY_CHUNK_TIMEOUT
+    s sem dados; nesse caso chunk_timeout() deixa de ser None e take_chunk()
+    entrega o trecho.
+    """
+    def __init__(self, legacy_chunks: bool = False):
+        self.buffer = bytearray()
+        self.legacy_chunks = legacy_chunks
+        self.saw_newline = False
+        self.chunk_since = None     # instante do último dado de um trecho pendente
+
+    def feed(self, data: bytes) -> list:
+        self.buffer += data
+        self.chunk_since = None
+        messages = []
+        while self.buffer:
+            if self.buffer[0] == MAGIC[0]:
+                if len(self.buffer) < len(MAGIC):
+                    break
+                if self.buffer[:len(MAGIC)] == MAGIC:
+                    msg = self._take_frame()
+                    if msg is None:
+                        break
+                    messages.append(msg)
+                    continue
+
+            end = self.buffer.find(b'\n')
+            if end < 0:
+                if self.legacy_chunks and not self.saw_newline:
+                    if _is_command(self.buffer):
+                        messages.extend(self.take_chunk())
+                    else:
+                        self.chunk_since = time.monotonic()
+                break
+            self.saw_newline = True
+            line = bytes(self.buffer[:end])
+            del self.buffer[:end + 1]
+            if line.strip():
+                messages.append(self._csv(line))
+        return messages
+
+    def chunk_timeout(self):
+        """Segundos até o trecho CSV pendente expirar; None sem trecho pendente."""
+        if self.chunk_since is None:
+            return None
+        return max(0.0, self.chunk_since + LEGACY_CHUNK_TIMEOUT - time.monotonic())
+
+    def take_chunk(self) -> list:
+        """Entrega o trecho CSV sem terminador guardado no buffer, se houver."""
+        self.chunk_since = None
+        line = bytes(self.buffer)
+        del self.buffer[:]
+        return [self._csv(line)] if line.strip() else []
+
+    def _csv(self, line: bytes):
+        return ('csv', line.decode('utf-8', errors='replace').strip().split(','))
+
+    def _take_frame(self):
+        if len(self.buffer) < HEADER.size:
+            return None
+        _, version, msg_type, length = HEADER.unpack_from(self.buffer, 0)
+        if length > MAX_PAYLOAD:
+            del self.buffer[:]
+            raise ProtocolError(f"Quadro grande demais: {length} bytes")
+        if len(self.buffer) < HEADER.size + length:
+            return None
+        payload = bytes(self.buffer[HEADER.size:HEADER.size + length])
+        del self.buffer[:HEADER.size + length]
+
+        if version != VERSION:
+            raise ProtocolError(f"Versão de protocolo não suportada: {version}")
+        if msg_type == MSG_HELLO:
+            return ('hello', FEATURES.unpack_from(payload)[0] if payload else 0)
+        if msg_type == MSG_HELLO_ACK:
+            return ('hello_ack', None)
+        if msg_type == MSG_TELEMETRY:
+            return ('telemetry', _decode_telemetry(payload))
+        if msg_type == MSG_TARGET:
+            return ('target', _decode_target(payload))
+        if msg_type == MSG_TRACE:
+            return ('trace', _decode_trace(payload))
+        raise ProtocolError(f"Tipo de quadro desconhecido: {msg_type}")
@@ -4,13 +4,52 @@ import socket
 import threading
 import queue
 import time
+import math
 from datetime import datetime
 import unicodedata
+import itertools
+from array import array
+from collections import deque
+
+import protocolo
+from historiador_bin import EVENT_NAMES, BinaryHistorian, event_code, parse_time
+from metricas import REGISTRY, start_http_server
+from tracer import get_tracer
 
 # --- Configurações Globais ---
 HOST = 'localhost'
 PORT = 65432
 HISTORIAN_FILE = 'historiador.txt'
+PROTOCOL = 'binary'     # 'binary' (negociado com o CLP) ou 'csv' (legado)
+TRACE_COMMANDS = True   # carimbos de latência dos comandos (tracer.py)
+METRICS_PORT = 9105     # endpoint Prometheus (metricas.py); 0 desliga
+
+# Escrita do historiador em segundo plano
+HISTORIAN_QUEUE_SIZE = 10000        # linhas pendentes antes de descartar
+HISTORIAN_BATCH_SIZE = 256          # linhas por escrita em lote
+HISTORIAN_FLUSH_INTERVAL = 1.0      # intervalo máximo entre flushes (s)
+HISTORIAN_BACKEND = 'text'          # 'text', 'binary' (historiador_bin.py) ou 'both'
+HISTORIAN_STORE_DIR = 'historiador_bin'
+
+# Atualização da GUI a partir da fila de comunicação
+GUI_POLL_MS = 50            # intervalo entre quadros com a fila vazia (ms)
+GUI_CATCHUP_MS = 1          # intervalo quando sobrou fila no quadro anterior (ms)
+GUI_MAX_BATCH = 1000        # mensagens processadas por quadro, no máximo
+GUI_FRAME_BUDGET = 0.010    # tempo máximo gasto por quadro (s)
+
+# Log de eventos da aba Histórico
+LOG_VIEW_LINES = 2000       # linhas recentes mantidas em memória e no widget
+LOG_PAGE_LINES = 500        # linhas lidas do historiador por página ao rolar para trás
+LOG_PAGE_POLL_MS = 50       # intervalo de verificação da leitura de uma página (ms)
+LOG_EVENT_TYPES = ('SISTEMA', 'POSICAO RECEBIDA', 'TARGET ENVIADO')     # opções do filtro
+
+# Gráficos da aba Trajetória
+PLOT_BUFFER_POINTS = 20000  # amostras (t, x, y, z) guardadas para redesenhar após redimensionar
+PLOT_TRAIL_POINTS = 2000    # pontos (pixels distintos) do rastro XY
+PLOT_XY_LIMIT = 3.0         # meia largura da vista de cima (m)
+PLOT_Z_RANGE = (0.0, 2.0)   # faixa do gráfico de Z (m)
+PLOT_Z_WINDOW = 60.0        # janela de tempo do gráfico de Z (s)
+PLOT_REFRESH_MS = 100       # intervalo mínimo entre redesenhos (ms)
 
 STATIONS = {
     "Estação 1": {'x': 2.0, 'y': 0.0, 'z': 1.0},
@@ -25,49 +64,204 @@ STATIONS = {
 class Historian:
     """
     Gerencia o logging de eventos em um arquivo de texto (historiador).
+
+    As linhas são escritas por uma thread dedicada, em lotes, a partir de
+    uma fila limitada: log() nunca faz I/O e pode ser chamado da thread da
+    GUI. Se a fila encher, as linhas excedentes são descartadas e contadas
+    em `dropped`.
+
+    Com o backend 'binary' ou 'both', cada evento também é gravado como
+    registro de tamanho fixo no armazenamento de historiador_bin.py.
     """
-    def __init__(self, filename: str):
+    _STOP = object()
+
+    def __init__(self, filename: str, queue_size: int = HISTORIAN_QUEUE_SIZE,
+                 batch_size: int = HISTORIAN_BATCH_SIZE,
+                 flush_interval: float = HISTORIAN_FLUSH_INTERVAL,
+                 backend: str = HISTORIAN_BACKEND, store_dir: str = HISTORIAN_STORE_DIR):
         """
         Inicializa o historiador.
 
         Args:
             filename (str): O nome do arquivo de log.
+            queue_size (int): Linhas pendentes aceitas antes de descartar.
+            batch_size (int): Linhas acumuladas que disparam uma escrita.
+            flush_interval (float): Tempo máximo (s) entre escritas.
+            backend (str): 'text', 'binary' ou 'both'.
+            store_dir (str): Diretório dos segmentos binários.
         """
         self.filename = filename
-        try:
-            with open(self.filename, 'w', encoding='utf-8') as f:
-                f.write(f"--- Inicio do Log: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ---\n\n")
-        except IOError as e:
-            print(f"Erro de Arquivo: Nao foi possivel iniciar o {self.filename}: {e}")
+        self.write_text = backend in ('text', 'both')
+        self.store = BinaryHistorian(store_dir) if backend in ('binary', 'both') else None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self.text_logged = 0        # linhas de texto enfileiradas (numeração do log)
+        self.text_written = 0       # linhas de texto já gravadas no arquivo
+        self.file_lock = threading.Lock()   # escrita do arquivo x read_text_before()
+        self._event_type_cache = {}
+        if self.write_text:
+            try:
+                with open(self.filename, 'w', encoding='utf-8') as f:
+                    f.write(f"--- Inicio do Log: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ---\n\n")
+            except IOError as e:
+                print(f"Erro de Arquivo: Nao foi possivel iniciar o {self.filename}: {e}")
+
+        REGISTRY.callback('sda_queue_depth', "Itens pendentes na fila",
+                          self.queue.qsize, {'queue': 'historian'})
+        REGISTRY.callback('sda_historian_dropped_total', "Linhas descartadas com a fila cheia",
+                          lambda: self.dropped, kind='counter')
+
+        self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer_thread.start()
 
     def _remove_accents(self, text: str) -> str:
         """Remove acentos de uma string para padronização do log."""
         try:
+            if text.isascii():
+                return text
             nfkd_form = unicodedata.normalize('NFKD', text)
             return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
-        except TypeError:
+        except (TypeError, AttributeError):
             return text
 
-    def log(self, event_type: str, content: str, timestamp: str = None) -> str:
+    def _clean_event_type(self, event_type: str) -> str:
+        """Normaliza o tipo de evento, com cache por tipo."""
+        clean = self._event_type_cache.get(event_type)
+        if clean is None:
+            clean = self._remove_accents(event_type.upper())
+            self._event_type_cache[event_type] = clean
+        return clean
+
+    def log(self, event_type: str, content: str, timestamp: str = None, values: tuple = None) -> str:
         """
-        Cria uma mensagem de log formatada, a escreve no arquivo e a retorna.
+        Cria uma mensagem de log formatada, a enfileira para escrita e a retorna.
+
+        `values` (x, y, z) é usado apenas pelo backend binário.
         """
+        epoch = None
         if timestamp is None:
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+            now = datetime.now()
+            timestamp = now.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+            epoch = now.timestamp()
         
-        clean_event_type = self._remove_accents(event_type.upper())
+        clean_event_type = self._clean_event_type(event_type)
         clean_content = self._remove_accents(content)
         
         log_message = f"[{timestamp}] [{clean_event_type}] - {clean_content}\n"
         
-        try:
-            with open(self.filename, 'a', encoding='utf-8') as f:
-                f.write(log_message)
-        except IOError as e:
-            print(f"Erro ao escrever no historiador: {e}")
+        if self.write_text and self._enqueue(log_message):
+            self.text_logged += 1
+        if self.store is not None:
+            if epoch is None:
+                try:
+                    epoch = float(timestamp)
+                except ValueError:
+                    epoch = time.time()
+            x, y, z = values if values is not None else (math.nan, math.nan, math.nan)
+            self._enqueue((epoch, float(x), float(y), float(z), event_code(clean_event_type)))
             
         return log_message
 
+    def _enqueue(self, item) -> bool:
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Aguarda a escrita de todas as linhas enfileiradas até agora."""
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def read_text_before(self, index: int, count: int) -> list:
+        """
+        Até `count` linhas do arquivo anteriores à linha de número `index`
+        (contada em text_logged); pode ser chamado de qualquer thread.
+        """
+        with self.file_lock:
+            return _tail_lines(self.filename, max(0, self.text_written - index), count)
+
+    def close(self, timeout: float = 5.0):
+        """Escreve as linhas pendentes e encerra a thread de escrita."""
+        if not self.writer_thread.is_alive():
+            return
+        try:
+            self.queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self.writer_thread.join(timeout)
+        if self.dropped:
+            print(f"[Historiador] {self.dropped} linha(s) descartada(s) por fila cheia")
+
+    def _writer_loop(self):
+        """Thread de escrita: acumula linhas e grava em lotes."""
+        batch = []
+        waiting = []
+        pending = 0
+        last_flush = time.monotonic()
+        f = None
+        if self.write_text:
+            try:
+                f = open(self.filename, 'a', encoding='utf-8')
+            except IOError as e:
+                print(f"Erro ao escrever no historiador: {e}")
+                return
+
+        try:
+            while True:
+                timeout = max(0.0, last_flush + self.flush_interval - time.monotonic())
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                stop = item is self._STOP
+                if isinstance(item, threading.Event):
+                    waiting.append(item)
+                elif isinstance(item, str):
+                    batch.append(item)
+                    pending += 1
+                elif isinstance(item, tuple):
+                    self.store.append(*item)
+                    pending += 1
+
+                now = time.monotonic()
+                if (stop or waiting or pending >= self.batch_size
+                        or now - last_flush >= self.flush_interval):
+                    try:
+                        if f is not None:
+                            with self.file_lock:
+                                if batch:
+                                    f.write("".join(batch))
+                                f.flush()
+                                self.text_written += len(batch)
+                        if self.store is not None:
+                            self.store.flush()
+                    except IOError as e:
+                        print(f"Erro ao escrever no historiador: {e}")
+                    batch.clear()
+                    pending = 0
+                    for event in waiting:
+                        event.set()
+                    waiting.clear()
+                    last_flush = now
+
+                if stop:
+                    break
+        finally:
+            if f is not None:
+                f.close()
+            if self.store is not None:
+                self.store.close()
+
 #==============================================================================
 # 2. CLASSE DE COMUNICAÇÃO TCP
 #==============================================================================
@@ -87,12 +281,35 @@ class TCPClient:
         self.target_data_shared = None
         self.data_lock = threading.Lock()
 
+        self.binary = False         # True após o HELLO_ACK do servidor
+        # IDs dos comandos (seq do TARGET); o início pelo relógio evita
+        # repetir IDs entre execuções e entre IHMs
+        self.cmd_ids = itertools.count(int(time.time() * 1000) & 0x7FFFFFFF)
+        self.decoder = protocolo.StreamDecoder()
+        self.tracer = get_tracer("ihm", enabled=TRACE_COMMANDS)
+
+        REGISTRY.callback('sda_queue_depth', "Itens pendentes na fila",
+                          receive_queue.qsize, {'queue': 'receive_queue'})
+        self.bytes_sent = REGISTRY.counter('sda_tcp_bytes_total', "Bytes trafegados no TCP",
+                                           {'direction': 'sent'})
+        self.bytes_received = REGISTRY.counter('sda_tcp_bytes_total', "Bytes trafegados no TCP",
+                                               {'direction': 'received'})
+        self.connections = REGISTRY.counter('sda_connections_total', "Conexões estabelecidas",
+                                            {'link': 'tcp'})
+        self.disconnects = REGISTRY.counter('sda_disconnects_total', "Conexões perdidas",
+                                            {'link': 'tcp'})
+
     def connect(self) -> bool:
         """Tenta se conectar ao servidor TCP."""
         try:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.sock.connect((self.host, self.port))
             self.sock.settimeout(1.0)
+            if PROTOCOL == 'binary':
+                # Servidores antigos ignoram o HELLO e seguem enviando CSV
+                features = protocolo.FEATURE_TRACE if TRACE_COMMANDS else 0
+                self.sock.sendall(protocolo.encode_hello(features))
+            self.connections.inc()
             self.receive_queue.put({'type': 'status', 'payload': 'Conectado'})
             return True
         except Exception as e:
@@ -111,23 +328,38 @@ class TCPClient:
         print("[TCP] Thread receptora iniciada.")
         while not self.stop_event.is_set():
             try:
-                data = self.sock.recv(1024)
+                data = self.sock.recv(4096)
                 if data:
-                    decoded_data = data.decode('utf-8').strip()
-                    parts = decoded_data.split(',')
-                    if len(parts) == 4:
-                        position = {'x': parts[0], 'y': parts[1], 'z': parts[2], 'timestamp': parts[3]}
-                        self.receive_queue.put({'type': 'position_update', 'payload': position})
+                    self.bytes_received.inc(len(data))
+                    for kind, content in self.decoder.feed(data):
+                        self._handle_message(kind, content)
                 else:
+                    self.disconnects.inc()
                     self.receive_queue.put({'type': 'status', 'payload': 'Desconectado'})
                     break
             except socket.timeout:
                 continue
-            except (ConnectionResetError, OSError):
+            except (ConnectionResetError, OSError, protocolo.ProtocolError):
+                if not self.stop_event.is_set():
+                    self.disconnects.inc()
                 self.receive_queue.put({'type': 'status', 'payload': 'Desconectado'})
                 break
         print("[TCP] Thread receptora encerrada.")
 
+    def _handle_message(self, kind: str, content):
+        """Converte uma mensagem decodificada em eventos para a GUI."""
+        if kind == 'hello_ack':
+            self.binary = True
+            print("[TCP] Protocolo binário negociado.")
+        elif kind == 'telemetry':
+            for position in content:
+                self.receive_queue.put({'type': 'position_update', 'payload': position})
+        elif kind == 'trace':
+            self.tracer.stamp(content['cmd_id'], 'ihm.amostra', seq=content['seq'])
+        elif kind == 'csv' and len(content) == 4:
+            position = {'x': content[0], 'y': content[1], 'z': content[2], 'timestamp': content[3]}
+            self.receive_queue.put({'type': 'position_update', 'payload': position})
+
     def _send_loop(self):
         """Loop que aguarda um evento para enviar dados ao servidor."""
         print("[TCP] Thread transmissora iniciada.")
@@ -137,12 +369,19 @@ class TCPClient:
                     target = self.target_data_shared
                 
                 if target:
-                    message = f"{target['x']},{target['y']},{target['z']}"
+                    if self.binary:
+                        message = protocolo.encode_target(target, target['cmd_id'])
+                    else:
+                        message = protocolo.encode_csv_target(target)
                     try:
-                        self.sock.sendall(message.encode('utf-8'))
+                        t_send = time.time()
+                        self.sock.sendall(message)
+                        self.bytes_sent.inc(len(message))
+                        self.tracer.stamp(target['cmd_id'], 'ihm.enviado', t_send)
                         station_name = target.get('station', 'Manual')
                         log_content = f"({station_name}) X={target['x']}, Y={target['y']}, Z={target['z']}"
-                        self.receive_queue.put({'type': 'log', 'event_type': 'Target Enviado', 'content': log_content})
+                        self.receive_queue.put({'type': 'log', 'event_type': 'Target Enviado', 'content': log_content,
+                                                'values': (target['x'], target['y'], target['z'])})
                     except (ConnectionResetError, BrokenPipeError):
                         self.receive_queue.put({'type': 'status', 'payload': 'Desconectado'})
                         break
@@ -153,6 +392,8 @@ class TCPClient:
         """
         Prepara os dados de target e sinaliza para a thread de envio.
         """
+        target_coords = dict(target_coords, cmd_id=next(self.cmd_ids))
+        self.tracer.stamp(target_coords['cmd_id'], 'ihm.comando')
         with self.data_lock:
             self.target_data_shared = target_coords
         self.send_event.set()
@@ -168,6 +409,425 @@ class TCPClient:
 #==============================================================================
 # 3. CLASSE DA APLICAÇÃO PRINCIPAL (GUI)
 #==============================================================================
+def _tail_lines(filename: str, skip: int, count: int, block_size: int = 65536) -> list:
+    """
+    Lê um arquivo de trás para frente e retorna até `count` linhas de log
+    que terminam `skip` linhas antes do fim (em ordem cronológica).
+    Linhas que não começam com '[' (cabeçalho) são ignoradas.
+    """
+    needed = skip + count
+    with open(filename, 'rb') as f:
+        f.seek(0, 2)
+        pos = f.tell()
+        data = b''
+        while pos > 0 and data.count(b'\n') <= needed:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.decode('utf-8', errors='replace').splitlines(keepends=True)
+    if pos > 0:
+        lines = lines[1:]       # a primeira linha do bloco pode estar cortada
+    lines = [l for l in lines if l.startswith('[')]
+    end = len(lines) - skip
+    return lines[max(0, end - count):max(0, end)]
+
+
+class LogView:
+    """
+    Log de eventos da aba Histórico com memória limitada.
+
+    Guarda apenas as `max_lines` linhas mais recentes (o widget de texto
+    espelha esse anel, sem crescer indefinidamente). Ao rolar até o topo
+    ou clicar em "Anteriores", uma página de linhas mais antigas é lida do
+    arquivo do historiador (ou do armazenamento binário, se o backend for
+    só 'binary', com uma instância própria só de leitura) por uma thread
+    de leitura, e entregue à thread do Tk; a leitura é descartada se a
+    linha mais antiga da visão mudou nesse meio tempo. As páginas
+    carregadas são descartadas quando a visão
+    volta a acompanhar o fim do log. Enquanto há páginas carregadas, as
+    linhas que saem do anel passam para elas; as páginas também ficam
+    limitadas a `max_lines` linhas.
+
+    O filtro por tipo de evento reconstrói o texto a partir da memória,
+    sem reler o historiador.
+    """
+    ALL = 'Todos'
+
+    def __init__(self, parent, historian: Historian, max_lines: int = LOG_VIEW_LINES,
+                 page_lines: int = LOG_PAGE_LINES):
+        self.historian = historian
+        self.page_lines = page_lines
+        self.lines = deque(maxlen=max_lines)    # (tipo, linha), mais recentes
+        self.older = []                         # páginas antigas, mais antiga primeiro
+        self.from_end = 0       # linhas do historiador a partir da mais antiga em memória
+        self.exhausted = False  # não há mais linhas antigas para carregar
+        self.event_filter = None
+        self._older_visible = 0
+        self.store = None
+        if historian.store is not None and not historian.write_text:
+            self.store = BinaryHistorian(historian.store.directory, readonly=True)
+        self._loading = False
+        self._pages = queue.Queue()     # (linha mais antiga na leitura, página)
+
+        toolbar = ttk.Frame(parent)
+        toolbar.pack(fill="x", pady=(0, 5))
+        ttk.Label(toolbar, text="Filtro:").pack(side=tk.LEFT)
+        self.filter_var = tk.StringVar(value=self.ALL)
+        filter_box = ttk.Combobox(toolbar, textvariable=self.filter_var, state="readonly", width=20,
+                                  values=[self.ALL] + list(LOG_EVENT_TYPES))
+        filter_box.pack(side=tk.LEFT, padx=5)
+        filter_box.bind("<<ComboboxSelected>>", lambda event: self.set_filter(self.filter_var.get()))
+        ttk.Button(toolbar, text="Anteriores", command=self.load_older).pack(side=tk.RIGHT)
+
+        self.text = scrolledtext.ScrolledText(parent, wrap=tk.WORD, state=tk.DISABLED, height=15)
+        self.text.pack(fill="both", expand=True)
+        for sequence in ("<MouseWheel>", "<Button-4>"):
+            self.text.bind(sequence, self._on_scroll, add="+")
+
+    @staticmethod
+    def event_type(line: str) -> str:
+        """Tipo de evento de uma linha '[timestamp] [TIPO] - conteúdo'."""
+        try:
+            return line.split('] [', 1)[1].split(']', 1)[0]
+        except IndexError:
+            return ''
+
+    def _match(self, event_type: str) -> bool:
+        return self.event_filter is None or event_type == self.event_filter
+
+    def append(self, lines: list):
+        """Acrescenta linhas novas (já formatadas pelo historiador)."""
+        at_end = self.text.yview()[1] >= 1.0
+        if at_end and self.older:
+            # Voltou a acompanhar o fim: descarta as páginas antigas
+            self._delete_lines(0, self._older_visible)
+            self.older, self._older_visible = [], 0
+            self.from_end = len(self.lines)
+            self.exhausted = False
+
+        entries = [(self.event_type(line), line) for line in lines]
+        n_evicted = max(0, len(self.lines) + len(entries) - self.lines.maxlen)
+        evicted = [self.lines[i] for i in range(min(n_evicted, len(self.lines)))]
+        evicted_visible = sum(1 for event_type, _ in evicted if self._match(event_type))
+        self.lines.extend(entries)
+        self.from_end += len(entries)
+
+        if self.older or self._loading:
+            # Navegando no passado (ou lendo uma página): o que sai do anel
+            # continua na visão, como parte das páginas antigas
+            self.older.extend(evicted)
+            self._older_visible += evicted_visible
+            self._trim_older()
+        else:
+            # O widget espelha o anel: remove do topo o que saiu dele
+            self._delete_lines(0, evicted_visible)
+            self.from_end = len(self.lines)
+        shown = ''.join(line for event_type, line in entries[-self.lines.maxlen:]
+                        if self._match(event_type))
+        if shown:
+            self.text.config(state=tk.NORMAL)
+            self.text.insert(tk.END, shown)
+            self.text.config(state=tk.DISABLED)
+        if at_end:
+            self.text.see(tk.END)
+
+    def set_filter(self, event_type: str):
+        """Mostra só um tipo de evento (ALL ou None mostra todos)."""
+        self.event_filter = None if event_type in (None, self.ALL) else event_type
+        self._render()
+        self.text.see(tk.END)
+
+    def _oldest(self):
+        """Linha mais antiga da visão (tipo, linha), ou None."""
+        if self.older:
+            return self.older[0]
+        return self.lines[0] if self.lines else None
+
+    def load_older(self):
+        """Pede uma página de linhas anteriores às que estão na visão."""
+        if self.exhausted or self._loading:
+            return
+        if len(self.older) >= self.lines.maxlen:
+            print(f"[GUI] Limite de {self.lines.maxlen} linhas antigas na visão; "
+                  f"consulte o historiador ({self.historian.filename})")
+            return
+        if not self.historian.write_text and self.store is None:
+            return
+        self._loading = True
+        # Número (no arquivo) da linha mais antiga da visão
+        index = self.historian.text_logged - self.from_end
+        threading.Thread(target=self._read_older_page, args=(self._oldest(), index),
+                         name="log-page", daemon=True).start()
+        self.text.after(LOG_PAGE_POLL_MS, self._poll_older_page)
+
+    def _poll_older_page(self):
+        try:
+            oldest, page = self._pages.get_nowait()
+        except queue.Empty:
+            self.text.after(LOG_PAGE_POLL_MS, self._poll_older_page)
+            return
+        self._loading = False
+        if oldest is not self._oldest():
+            return      # a visão mudou durante a leitura; a próxima rolagem relê
+        self._show_older_page(page)
+
+    def _show_older_page(self, page: list):
+        if len(page) < self.page_lines:
+            self.exhausted = True
+        if not page:
+            return
+        entries = [(self.event_type(line), line) for line in page]
+        self.older[:0] = entries
+        self.from_end += len(entries)
+        added = sum(1 for event_type, _ in entries if self._match(event_type))
+        self._render()
+        # Mantém no topo a linha que estava lá antes da página nova
+        self.text.yview(f"{added + 1}.0")
+
+    def _read_older_page(self, oldest, index: int):
+        """Thread de leitura: lê a página anterior a `oldest` e a entrega em _pages."""
+        page = []
+        try:
+            # Garante no disco tudo o que já está na visão (fora da thread do Tk)
+            self.historian.flush(timeout=1.0)
+            if self.historian.write_text:
+                page = self.historian.read_text_before(index, self.page_lines)
+            else:
+                if oldest is None:
+                    t1 = time.time()
+                else:
+                    t1 = parse_time(oldest[1][1:].split(']', 1)[0]) - 1e-6
+                result = self.store.tail(t1, self.page_lines)
+                for ts, x, y, z, ev in zip(*(result[k] for k in ('timestamp', 'x', 'y', 'z', 'event'))):
+                    when = datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+                    page.append(f"[{when}] [{EVENT_NAMES.get(int(ev), ev)}] - X={x}, Y={y}, Z={z}\n")
+        except (OSError, ImportError, ValueError) as e:
+            print(f"[GUI] Não foi possível carregar o histórico anterior: {e}")
+            page = []
+        self._pages.put((oldest, page))
+
+    def _trim_older(self):
+        """Mantém as páginas antigas em até max_lines linhas, descartando as mais antigas."""
+        excess = len(self.older) - self.lines.maxlen
+        if excess <= 0:
+            return
+        dropped = self.older[:excess]
+        del self.older[:excess]
+        dropped_visible = sum(1 for event_type, _ in dropped if self._match(event_type))
+        self._delete_lines(0, dropped_visible)
+        self._older_visible -= dropped_visible
+        self.from_end -= excess
+        self.exhausted = False
+
+    def _render(self):
+        older = [line for event_type, line in self.older if self._match(event_type)]
+        recent = [line for event_type, line in self.lines if self._match(event_type)]
+        self._older_visible = len(older)
+        self.text.config(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        self.text.insert(tk.END, ''.join(older) + ''.join(recent))
+        self.text.config(state=tk.DISABLED)
+
+    def _delete_lines(self, first: int, count: int):
+        """Remove `count` linhas do widget a partir da linha `first` (base 0)."""
+        if count <= 0:
+            return
+        self.text.config(state=tk.NORMAL)
+        self.text.delete(f"{first + 1}.0", f"{first + count + 1}.0")
+        self.text.config(state=tk.DISABLED)
+
+    def _on_scroll(self, event):
+        # Rolagem para cima com o topo já visível: busca a página anterior
+        if self.text.yview()[0] <= 0.0 and (event.num == 4 or getattr(event, 'delta', 0) > 0):
+            self.load_older()
+
+
+class PointBuffer:
+    """
+    Buffer circular de capacidade fixa com as amostras (t, x, y, z), em
+    arrays de double pré-alocados: append() é O(1) e não aloca memória.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.columns = [array('d', bytes(8 * capacity)) for _ in range(4)]
+        self.head = 0       # próxima posição de escrita
+        self.size = 0
+
+    def append(self, t: float, x: float, y: float, z: float):
+        i = self.head
+        ct, cx, cy, cz = self.columns
+        ct[i], cx[i], cy[i], cz[i] = t, x, y, z
+        self.head = (i + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        """Amostras em ordem cronológica."""
+        start = (self.head - self.size) % self.capacity
+        ct, cx, cy, cz = self.columns
+        for k in range(self.size):
+            i = (start + k) % self.capacity
+            yield ct[i], cx[i], cy[i], cz[i]
+
+
+class TrajectoryPlot:
+    """
+    Gráficos ao vivo da aba Trajetória: vista de cima (XY) com as estações,
+    o rastro e o último target, e Z no tempo.
+
+    Cada amostra é reduzida à resolução da tela na chegada: o rastro XY só
+    ganha um ponto quando muda de pixel e o gráfico de Z guarda o mínimo e
+    o máximo de cada coluna de pixel. Assim o redesenho, feito no máximo a
+    cada PLOT_REFRESH_MS reaproveitando os mesmos itens do Canvas (coords),
+    custa proporcional à largura em pixels e não ao histórico. O
+    PointBuffer só é percorrido quando o tamanho dos Canvas muda.
+    """
+    MARGIN = 10         # borda interna (px)
+
+    def __init__(self, parent, stations: dict, capacity: int = PLOT_BUFFER_POINTS):
+        self.stations = stations
+        self.buffer = PointBuffer(capacity)
+        self.trail = deque(maxlen=PLOT_TRAIL_POINTS)    # pontos XY distintos, em pixels
+        self.z_columns = deque()                        # [coluna absoluta, z mínimo, z máximo]
+        self.position = None
+        self.target = None
+        self.dirty = False
+        self.next_redraw = 0.0
+        self.xy_scale = self.z_scale = 1.0
+        self.xy_center = (0.0, 0.0)
+        self.z_size = (1, 1)
+        self.seconds_per_px = 1.0
+
+        self.xy = tk.Canvas(parent, background="white", height=300, highlightthickness=0)
+        self.xy.pack(fill="both", expand=True)
+        self.z = tk.Canvas(parent, background="white", height=120, highlightthickness=0)
+        self.z.pack(fill="x", pady=(5, 0))
+        self.xy.bind("<Configure>", lambda event: self._layout())
+        self.z.bind("<Configure>", lambda event: self._layout())
+
+        # Itens dinâmicos, criados uma única vez e movidos com coords()
+        self.trail_item = self.xy.create_line(0, 0, 0, 0, fill="steelblue", width=2)
+        self.target_item = self.xy.create_text(0, 0, text="+", fill="red", font=("Helvetica", 16),
+                                               state=tk.HIDDEN)
+        self.drone_item = self.xy.create_oval(0, 0, 0, 0, fill="orange", outline="black",
+                                              state=tk.HIDDEN)
+        self.z_item = self.z.create_line(0, 0, 0, 0, fill="darkgreen")
+        self.z_label = self.z.create_text(self.MARGIN, self.MARGIN, anchor="nw", text="Z: --")
+
+    def _to_xy(self, x: float, y: float) -> tuple:
+        cx, cy = self.xy_center
+        return (round(cx + x * self.xy_scale), round(cy - y * self.xy_scale))
+
+    def _to_z(self, z: float) -> float:
+        z_min, z_max = PLOT_Z_RANGE
+        z = min(max(z, z_min), z_max)
+        return self.z_size[1] - self.MARGIN - (z - z_min) * self.z_scale
+
+    def _layout(self):
+        """Recalcula as escalas e os itens fixos após uma mudança de tamanho."""
+        w, h = max(self.xy.winfo_width(), 1), max(self.xy.winfo_height(), 1)
+        self.xy_scale = (min(w, h) / 2 - self.MARGIN) / PLOT_XY_LIMIT
+        self.xy_center = (w / 2, h / 2)
+        zw, zh = max(self.z.winfo_width(), 1), max(self.z.winfo_height(), 1)
+        self.z_size = (zw, zh)
+        self.z_scale = (zh - 2 * self.MARGIN) / (PLOT_Z_RANGE[1] - PLOT_Z_RANGE[0])
+        self.seconds_per_px = PLOT_Z_WINDOW / zw
+
+        self.xy.delete("fixed")
+        self.xy.create_line(0, h / 2, w, h / 2, fill="gray85", tags="fixed")
+        self.xy.create_line(w / 2, 0, w / 2, h, fill="gray85", tags="fixed")
+        for name, coords in self.stations.items():
+            px, py = self._to_xy(coords['x'], coords['y'])
+            self.xy.create_rectangle(px - 6, py - 6, px + 6, py + 6, outline="gray40", tags="fixed")
+            self.xy.create_text(px, py + 14, text=name, fill="gray40", tags="fixed")
+        self.xy.tag_lower("fixed")
+
+        self.z.delete("fixed")
+        for z_ref in PLOT_Z_RANGE:
+            zy = self._to_z(z_ref)
+            self.z.create_line(0, zy, zw, zy, fill="gray85", tags="fixed")
+            self.z.create_text(zw - self.MARGIN, zy, anchor="se", text=f"{z_ref:g} m",
+                               fill="gray40", tags="fixed")
+        self.z.tag_lower("fixed")
+
+        # As reduções dependem da escala: refaz a partir do buffer
+        self.trail.clear()
+        self.z_columns.clear()
+        for t, x, y, z in self.buffer:
+            self._reduce(t, x, y, z)
+        self.dirty = True
+        self.redraw(force=True)
+
+    def add(self, t: float, x: float, y: float, z: float):
+        """Registra uma amostra de posição (O(1))."""
+        self.buffer.append(t, x, y, z)
+        self._reduce(t, x, y, z)
+        self.position = (x, y, z)
+        self.dirty = True
+
+    def set_target(self, x: float, y: float):
+        self.target = (x, y)
+        self.dirty = True
+
+    def _reduce(self, t: float, x: float, y: float, z: float):
+        point = self._to_xy(x, y)
+        if not self.trail or self.trail[-1] != point:
+            self.trail.append(point)
+
+        column = int(t / self.seconds_per_px)
+        columns = self.z_columns
+        if columns and columns[-1][0] == column:
+            last = columns[-1]
+            if z < last[1]:
+                last[1] = z
+            elif z > last[2]:
+                last[2] = z
+        else:
+            columns.append([column, z, z])
+            while columns[0][0] <= column - PLOT_Z_WINDOW / self.seconds_per_px:
+                columns.popleft()
+
+    def redraw(self, force: bool = False):
+        """Atualiza os itens do Canvas, no máximo a cada PLOT_REFRESH_MS."""
+        now = time.monotonic()
+        if not self.dirty or (not force and now < self.next_redraw):
+            return
+        if not self.xy.winfo_ismapped():
+            return      # aba oculta: redesenha quando voltar a ser exibida
+        self.next_redraw = now + PLOT_REFRESH_MS / 1000.0
+        self.dirty = False
+
+        flat = [c for point in self.trail for c in point]
+        if len(flat) < 4:
+            flat = (flat * 2) or [0, 0, 0, 0]
+        self.xy.coords(self.trail_item, *flat)
+
+        if self.target is not None:
+            self.xy.coords(self.target_item, *self._to_xy(*self.target))
+            self.xy.itemconfigure(self.target_item, state=tk.NORMAL)
+        if self.position is not None:
+            px, py = self._to_xy(self.position[0], self.position[1])
+            self.xy.coords(self.drone_item, px - 5, py - 5, px + 5, py + 5)
+            self.xy.itemconfigure(self.drone_item, state=tk.NORMAL)
+            self.z.itemconfigure(self.z_label, text=f"Z: {self.position[2]:.3f} m")
+
+        # Uma coluna de pixel por bucket de tempo, traçando do mínimo ao máximo
+        if self.z_columns:
+            right = self.z_size[0] - 1
+            newest = self.z_columns[-1][0]
+            flat = []
+            for column, z_low, z_high in self.z_columns:
+                px = right - (newest - column)
+                flat.extend((px, self._to_z(z_low), px, self._to_z(z_high)))
+            if len(flat) < 4:
+                flat *= 2
+            self.z.coords(self.z_item, *flat)
+
+
 class SynopticApp:
     def __init__(self, master):
         self.master = master
@@ -178,6 +838,10 @@ class SynopticApp:
         self.historian = Historian(HISTORIAN_FILE)
         self.receive_queue = queue.Queue()
         self.tcp_client = TCPClient(HOST, PORT, self.receive_queue)
+        self.gui_timer = REGISTRY.timer('sda_loop_work_seconds', "Tempo gasto no corpo do loop",
+                                        {'loop': 'ihm.gui'})
+        self.positions_coalesced = REGISTRY.counter('sda_gui_positions_coalesced_total',
+                                                    "Posições substituídas por outra mais nova no mesmo quadro")
         
         # 2. Criar a interface
         self.create_widgets()
@@ -200,7 +864,9 @@ class SynopticApp:
         tab_control = ttk.Notebook(self.master)
         control_tab = ttk.Frame(tab_control, padding="10")
         history_tab = ttk.Frame(tab_control, padding="10")
+        plot_tab = ttk.Frame(tab_control, padding="10")
         tab_control.add(control_tab, text='Controle')
+        tab_control.add(plot_tab, text='Trajetória')
         tab_control.add(history_tab, text='Histórico')
         tab_control.pack(expand=True, fill="both")
 
@@ -253,15 +919,9 @@ class SynopticApp:
 
         history_frame = ttk.LabelFrame(history_tab, text="Log de Eventos", padding="10")
         history_frame.pack(fill="both", expand=True)
-        self.history_text = scrolledtext.ScrolledText(history_frame, wrap=tk.WORD, state=tk.DISABLED, height=15)
-        self.history_text.pack(fill="both", expand=True)
+        self.log_view = LogView(history_frame, self.historian)
 
-    def _log_to_gui(self, message: str):
-        """Escreve uma mensagem na caixa de texto de histórico da GUI."""
-        self.history_text.config(state=tk.NORMAL)
-        self.history_text.insert(tk.END, message)
-        self.history_text.see(tk.END)
-        self.history_text.config(state=tk.DISABLED)
+        self.plot = TrajectoryPlot(plot_tab, STATIONS)
 
     def _send_predefined_target(self, station_name: str):
         """Envia um target pré-definido usando o cliente TCP."""
@@ -282,59 +942,102 @@ class SynopticApp:
             messagebox.showerror("Valor Invalido", "Os valores de target devem ser numericos.")
 
     def process_receive_queue(self):
-        """Processa mensagens da fila de comunicação para atualizar a GUI."""
+        """
+        Processa mensagens da fila de comunicação para atualizar a GUI.
+
+        A cada quadro drena até GUI_MAX_BATCH mensagens ou GUI_FRAME_BUDGET
+        segundos, o que vier primeiro. Todas as mensagens vão para o
+        historiador, mas os rótulos de posição são atualizados uma única vez
+        com a última amostra e as linhas do log da GUI são inseridas de uma
+        vez. Se sobrar fila, o próximo quadro vem logo em seguida.
+        """
+        t0 = self.gui_timer.start()
+        deadline = time.perf_counter() + GUI_FRAME_BUDGET
+        lines = []
+        position = None
+        positions = 0
         try:
-            message = self.receive_queue.get_nowait()
-            msg_type = message.get('type')
+            for _ in range(GUI_MAX_BATCH):
+                try:
+                    message = self.receive_queue.get_nowait()
+                except queue.Empty:
+                    break
+                msg_type = message.get('type')
 
-            if msg_type == 'status':
-                payload = message.get('payload')
-                self.connection_status_var.set(f"Status: {payload}")
-                
-                log_msg = self.historian.log('Sistema', f"Status da conexao: {payload}")
-                self._log_to_gui(log_msg)
-                
-                if payload == 'Conectado':
-                    self.status_label.config(foreground="green")
-                    self.send_button.config(state=tk.NORMAL)
-                    for button in self.station_buttons.values():
-                        button.config(state=tk.NORMAL)
-                else:
-                    self.status_label.config(foreground="red")
-                    self.send_button.config(state=tk.DISABLED)
-                    for button in self.station_buttons.values():
-                        button.config(state=tk.DISABLED)
-
-            elif msg_type == 'position_update':
-                payload = message.get('payload')
-                self.pos_x_var.set(f"X: {payload['x']}")
-                self.pos_y_var.set(f"Y: {payload['y']}")
-                self.pos_z_var.set(f"Z: {payload['z']}")
-                self.pos_ts_var.set(f"Timestamp: {payload['timestamp']}")
-                
-                log_content = f"X={payload['x']}, Y={payload['y']}, Z={payload['z']}"
-                log_msg = self.historian.log('Posicao Recebida', log_content, timestamp=payload['timestamp'])
-                self._log_to_gui(log_msg)
+                if msg_type == 'status':
+                    payload = message.get('payload')
+                    lines.append(self.historian.log('Sistema', f"Status da conexao: {payload}"))
+                    self._show_status(payload)
 
-            elif msg_type == 'log':
-                log_msg = self.historian.log(message['event_type'], message['content'])
-                self._log_to_gui(log_msg)
+                elif msg_type == 'position_update':
+                    position = message.get('payload')
+                    positions += 1
+                    self._plot_position(position)
+                    log_content = f"X={position['x']}, Y={position['y']}, Z={position['z']}"
+                    lines.append(self.historian.log('Posicao Recebida', log_content,
+                                                    timestamp=position['timestamp'],
+                                                    values=(position['x'], position['y'], position['z'])))
 
-        except queue.Empty:
-            pass
+                elif msg_type == 'log':
+                    lines.append(self.historian.log(message['event_type'], message['content'],
+                                                    values=message.get('values')))
+                    if message['event_type'] == 'Target Enviado' and message.get('values'):
+                        self.plot.set_target(*message['values'][:2])
+
+                if time.perf_counter() >= deadline:
+                    break
+
+            if position is not None:
+                self.pos_x_var.set(f"X: {position['x']}")
+                self.pos_y_var.set(f"Y: {position['y']}")
+                self.pos_z_var.set(f"Z: {position['z']}")
+                self.pos_ts_var.set(f"Timestamp: {position['timestamp']}")
+                self.positions_coalesced.inc(positions - 1)
+            if lines:
+                self.log_view.append(lines)
+            self.plot.redraw()
         finally:
-            self.master.after(100, self.process_receive_queue)
+            self.gui_timer.stop(t0)
+            delay = GUI_CATCHUP_MS if not self.receive_queue.empty() else GUI_POLL_MS
+            self.master.after(delay, self.process_receive_queue)
+
+    def _plot_position(self, position: dict):
+        """Leva uma amostra de posição aos gráficos (o CSV legado traz texto)."""
+        try:
+            x, y, z = float(position['x']), float(position['y']), float(position['z'])
+        except (TypeError, ValueError):
+            return
+        try:
+            t = float(position['timestamp'])
+        except (TypeError, ValueError):
+            t = time.time()
+        self.plot.add(t, x, y, z)
+
+    def _show_status(self, payload: str):
+        """Atualiza o indicador de conexão e habilita/desabilita os comandos."""
+        self.connection_status_var.set(f"Status: {payload}")
+        if payload == 'Conectado':
+            self.status_label.config(foreground="green")
+            state = tk.NORMAL
+        else:
+            self.status_label.config(foreground="red")
+            state = tk.DISABLED
+        self.send_button.config(state=state)
+        for button in self.station_buttons.values():
+            button.config(state=state)
 
     def on_closing(self):
         """Lida com o evento de fechamento da janela."""
         print("[GUI] Fechando a aplicacao...")
         self.tcp_client.stop()
+        self.historian.close()
         self.master.destroy()
 
 #==============================================================================
 # 4. PONTO DE ENTRADA DA APLICAÇÃO
 #==============================================================================
 if __name__ == "__main__":
+    start_http_server(METRICS_PORT)
     root = tk.Tk()
     app = SynopticApp(root)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,15 @@
+"""
+Stand-ins locais do CoppeliaSim e do Prosys SimulationServer.
+
+Permitem rodar brigde.py, CLP.py, gateway.py e mes.py sem a cena do
+CoppeliaSim nem o servidor da Prosys, para testes e benchmarks offline:
+
+    python -m standin servidor [--frota N] [--endpoint URL]
+    python -m standin bridge   [--frota N]
+
+servidor.py expõe a mesma pasta 3:Drone (e opcionalmente 3:Drone1..N)
+do SimulationServer; sim.py implementa o subconjunto da API `sim` usado
+pelo bridge, com um drone que persegue o target.
+"""
+from .servidor import build_server
+from .sim import FakeSim, RemoteAPIClient, install
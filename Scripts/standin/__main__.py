@@ -0,0 +1,71 @@
+"""
+Linha de comando dos stand-ins (rodar a partir de Scripts/).
+
+    python -m standin servidor [--frota N] [--endpoint URL]
+        Sobe o stand-in do SimulationServer até Ctrl+C.
+
+    python -m standin bridge [--frota N]
+        Roda o brigde.py real contra a cena simulada (com --frota, no modo
+        frota com N pares drone/target).
+"""
+import sys
+import time
+
+from .servidor import ENDPOINT, build_server
+from .sim import install
+
+USAGE = "Uso: python -m standin {servidor|bridge} [--frota N] [--endpoint URL]"
+
+
+def _option(args: list, name: str, default):
+    if name not in args:
+        return default
+    i = args.index(name)
+    value = args[i + 1]
+    del args[i:i + 2]
+    return value
+
+
+def run_server(endpoint: str, fleet: int):
+    server, folders = build_server(endpoint, fleet)
+    server.start()
+    print(f"[STANDIN] SimulationServer em {endpoint} "
+          f"(pastas: {', '.join(folders)})")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print("[STANDIN] Servidor encerrado.")
+
+
+def run_bridge(fleet: int):
+    sim = install(fleet)
+    import brigde
+    if fleet:
+        brigde.FLEET_MODE = True
+    print(f"[STANDIN] Cena simulada com {len(sim.pairs)} par(es) drone/target")
+    try:
+        brigde.main()
+    finally:
+        calls = ", ".join(f"{name}={n}" for name, n in sorted(sim.calls.items()))
+        print(f"[STANDIN] Chamadas à API sim: {calls}")
+
+
+def main():
+    args = sys.argv[1:]
+    fleet = int(_option(args, '--frota', 0))
+    endpoint = _option(args, '--endpoint', ENDPOINT)
+    if len(args) != 1 or args[0] not in ('servidor', 'bridge'):
+        print(USAGE)
+        sys.exit(1)
+    if args[0] == 'servidor':
+        run_server(endpoint, fleet)
+    else:
+        run_bridge(fleet)
+
+
+if __name__ == "__main__":
+    main()
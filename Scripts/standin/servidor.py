@@ -0,0 +1,77 @@
+"""
+Stand-in do Prosys SimulationServer.
+
+Servidor python-opcua no mesmo endpoint do SimulationServer, com a pasta
+Drone no namespace 3 e as seis variáveis Double graváveis (TargetX/Y/Z e
+DroneX/Y/Z). Com frota > 0, cria também as pastas Drone1..DroneN usadas
+pelo modo frota do bridge; Drone1 referencia as mesmas variáveis de Drone,
+de modo que o primeiro drone da frota é o que o CLP e o gateway enxergam.
+
+Cada pasta tem ainda CommandId e CommandAck, usadas pelo rastreamento de
+comandos (tracer.py); o SimulationServer real não as tem e os clientes
+seguem funcionando sem elas.
+"""
+import logging
+
+from opcua import Server, ua
+
+ENDPOINT = "opc.tcp://0.0.0.0:53530/OPCUA/SimulationServer"
+NAMESPACE_URI = "http://www.prosysopc.com/OPCUA/SimulationNodes/"
+NAMESPACE_INDEX = 3
+VARIABLES = ["TargetX", "TargetY", "TargetZ", "DroneX", "DroneY", "DroneZ",
+             "CommandId", "CommandAck"]
+
+
+def add_drone_folder(parent, name: str) -> dict:
+    """Cria uma pasta de drone com as variáveis de VARIABLES; retorna {nome: nó}."""
+    folder = parent.add_folder(ua.NodeId(name, NAMESPACE_INDEX),
+                               ua.QualifiedName(name, NAMESPACE_INDEX))
+    nodes = {}
+    for var in VARIABLES:
+        node = folder.add_variable(ua.NodeId(f"{name}.{var}", NAMESPACE_INDEX),
+                                   ua.QualifiedName(var, NAMESPACE_INDEX),
+                                   ua.Variant(0.0, ua.VariantType.Double))
+        node.set_writable()
+        nodes[var] = node
+    return nodes
+
+
+def add_alias_folder(parent, name: str, nodes: dict) -> dict:
+    """Cria uma pasta que referencia variáveis já existentes."""
+    folder = parent.add_folder(ua.NodeId(name, NAMESPACE_INDEX),
+                               ua.QualifiedName(name, NAMESPACE_INDEX))
+    for node in nodes.values():
+        folder.add_reference(node.nodeid, ua.ObjectIds.HasComponent, bidirectional=False)
+    return nodes
+
+
+def build_server(endpoint: str = ENDPOINT, fleet: int = 0):
+    """
+    Monta (sem iniciar) o servidor stand-in.
+
+    Returns:
+        (server, folders): folders mapeia o nome da pasta ("Drone",
+        "Drone1", ...) para o dicionário de variáveis.
+    """
+    # O python-opcua loga cada sessão em INFO
+    logging.getLogger("opcua").setLevel(logging.WARNING)
+
+    server = Server()
+    server.set_endpoint(endpoint)
+    server.set_server_name("SimulationServer (stand-in)")
+
+    # Os clientes endereçam as variáveis como "3:Drone"; registra
+    # namespaces de preenchimento até o índice 3
+    idx = server.register_namespace("urn:standin:SimulationServer")
+    while idx < NAMESPACE_INDEX - 1:
+        idx = server.register_namespace(f"urn:standin:reserved{idx + 1}")
+    idx = server.register_namespace(NAMESPACE_URI)
+    assert idx == NAMESPACE_INDEX
+
+    objects = server.get_objects_node()
+    folders = {"Drone": add_drone_folder(objects, "Drone")}
+    if fleet > 0:
+        folders["Drone1"] = add_alias_folder(objects, "Drone1", folders["Drone"])
+    for k in range(2, fleet + 1):
+        folders[f"Drone{k}"] = add_drone_folder(objects, f"Drone{k}")
+    return server, folders
@@ -0,0 +1,199 @@
+"""
+Stand-in da API `sim` do CoppeliaSim (cliente ZMQ remote API).
+
+Implementa só o que o bridge usa: getObject, getObjectPosition,
+setObjectPosition, getScript, callScriptFunction, startSimulation,
+stopSimulation e getSimulationState. A cena tem o par "/Quadcopter/base" +
+"/target" e, com frota > 0, os pares "/Quadcopter[i]/base" + "/target[i]"
+e o objeto "/FleetBridge" com a função bridgeFleetStep de fleet_bridge.lua.
+Cada drone persegue o seu target com um controle proporcional de
+velocidade limitada; a dinâmica é integrada sob demanda em passos fixos de
+SIM_DT, pelo relógio real.
+
+install() registra um módulo `coppeliasim_zmqremoteapi_client` falso em
+sys.modules, de modo que `from coppeliasim_zmqremoteapi_client import
+RemoteAPIClient` no brigde.py recebe o stand-in.
+"""
+import math
+import sys
+import threading
+import time
+import types
+from collections import Counter
+
+SIM_DT = 0.005          # passo de integração (s)
+MAX_CATCHUP = 1.0       # tempo máximo integrado de uma vez (s)
+DRONE_GAIN = 2.0        # ganho proporcional (1/s)
+DRONE_VMAX = 1.5        # velocidade máxima do drone (m/s)
+START_HEIGHT = 0.1      # altura inicial dos drones (m)
+FLEET_SPACING = 1.0     # espaçamento da grade inicial da frota (m)
+FLEET_SCRIPT_PATH = "/FleetBridge"
+FLEET_SCRIPT_FUNC = "bridgeFleetStep"
+
+
+class FakeSim:
+    """
+    Cena simulada com pares drone/target.
+
+    O contador `calls` registra quantas chamadas de cada função da API
+    foram feitas (equivale às mensagens ZMQ que o CoppeliaSim receberia).
+    fleet_script=False monta a cena sem o script de fleet_bridge.lua.
+    """
+    handle_world = -1
+    scripttype_customizationscript = 6
+    simulation_stopped = 0
+    simulation_paused = 8
+    simulation_advancing_running = 17
+
+    def __init__(self, fleet: int = 0, fleet_script: bool = True):
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.state = self.simulation_stopped
+        self.sim_time = 0.0
+        self._last = None
+
+        self.paths = {}             # alias -> handle
+        self.positions = {}         # handle -> [x, y, z]
+        self.pairs = []             # (drone, target)
+        self._add_pair("/Quadcopter/base", "/target", (0.0, 0.0))
+        side = max(1, math.ceil(math.sqrt(fleet)))
+        for i in range(fleet):
+            xy = ((i % side) * FLEET_SPACING, (i // side) * FLEET_SPACING)
+            self._add_pair(f"/Quadcopter[{i}]/base", f"/target[{i}]", xy)
+        self.scripts = {}           # handle do objeto -> handle do script
+        if fleet_script:
+            obj = len(self.positions) + 1
+            self.paths[FLEET_SCRIPT_PATH] = obj
+            self.scripts[obj] = obj + 1000
+
+    def _add_pair(self, drone_path: str, target_path: str, xy):
+        drone, target = len(self.positions) + 1, len(self.positions) + 2
+        self.paths[drone_path] = drone
+        self.paths[target_path] = target
+        self.positions[drone] = [xy[0], xy[1], START_HEIGHT]
+        self.positions[target] = [xy[0], xy[1], START_HEIGHT]
+        self.pairs.append((drone, target))
+
+    # ------------------------------------------------------------------
+    # Dinâmica
+    # ------------------------------------------------------------------
+    def _advance(self):
+        now = time.monotonic()
+        if self.state != self.simulation_advancing_running:
+            self._last = now
+            return
+        if now - self._last > MAX_CATCHUP:
+            # Pausa longa sem chamadas: não integra mais que MAX_CATCHUP
+            self._last = now - MAX_CATCHUP
+        steps = int((now - self._last) / SIM_DT)
+        if steps == 0:
+            return
+        self._last += steps * SIM_DT
+        for _ in range(steps):
+            for drone, target in self.pairs:
+                self._step(self.positions[drone], self.positions[target])
+        self.sim_time += steps * SIM_DT
+
+    @staticmethod
+    def _step(p, goal):
+        v = [DRONE_GAIN * (g - a) for a, g in zip(p, goal)]
+        speed = math.sqrt(sum(c * c for c in v))
+        if speed > DRONE_VMAX:
+            v = [c * DRONE_VMAX / speed for c in v]
+        for i in range(3):
+            p[i] += v[i] * SIM_DT
+
+    # ------------------------------------------------------------------
+    # API sim
+    # ------------------------------------------------------------------
+    def getObject(self, path: str, options=None) -> int:
+        self.calls['getObject'] += 1
+        handle = self.paths.get(path)
+        if handle is None:
+            if options and options.get('noError'):
+                return -1
+            raise Exception(f"object does not exist: {path}")
+        return handle
+
+    def getObjectPosition(self, handle: int, relative_to: int = handle_world) -> list:
+        self.calls['getObjectPosition'] += 1
+        with self.lock:
+            self._advance()
+            return list(self.positions[handle])
+
+    def setObjectPosition(self, handle: int, *args):
+        # Aceita as duas ordens da API: (handle, relTo, pos) e (handle, pos[, relTo])
+        self.calls['setObjectPosition'] += 1
+        position = args[0] if isinstance(args[0], (list, tuple)) else args[1]
+        with self.lock:
+            self._advance()
+            self.positions[handle] = [float(v) for v in position]
+
+    def getScript(self, script_type: int, obj: int = -1, name: str = '') -> int:
+        self.calls['getScript'] += 1
+        script = self.scripts.get(obj)
+        if script is None or script_type != self.scripttype_customizationscript:
+            raise Exception(f"script does not exist: object {obj}")
+        return script
+
+    def callScriptFunction(self, func: str, script: int, *args):
+        """Só a bridgeFleetStep de fleet_bridge.lua (mesmos argumentos e retorno)."""
+        self.calls['callScriptFunction'] += 1
+        if func != FLEET_SCRIPT_FUNC or script not in self.scripts.values():
+            raise Exception(f"script function does not exist: {func}")
+        targets, positions, drones = args
+        with self.lock:
+            self._advance()
+            for k, handle in enumerate(targets):
+                self.positions[handle] = [float(v) for v in positions[3 * k:3 * k + 3]]
+            return [v for handle in drones for v in self.positions[handle]]
+
+    def getSimulationState(self) -> int:
+        self.calls['getSimulationState'] += 1
+        return self.state
+
+    def getSimulationTime(self) -> float:
+        self.calls['getSimulationTime'] += 1
+        with self.lock:
+            self._advance()
+            return self.sim_time
+
+    def startSimulation(self):
+        self.calls['startSimulation'] += 1
+        with self.lock:
+            self.state = self.simulation_advancing_running
+            self._last = time.monotonic()
+
+    def stopSimulation(self):
+        self.calls['stopSimulation'] += 1
+        with self.lock:
+            self._advance()
+            self.state = self.simulation_stopped
+
+
+class RemoteAPIClient:
+    """Substituto do RemoteAPIClient: todas as instâncias veem a mesma cena."""
+    scene = None
+
+    def __init__(self, host: str = 'localhost', port: int = 23000, *args, **kwargs):
+        if RemoteAPIClient.scene is None:
+            RemoteAPIClient.scene = FakeSim()
+
+    def getObject(self, name: str):
+        if name != 'sim':
+            raise Exception(f"stand-in only provides 'sim', not '{name}'")
+        return RemoteAPIClient.scene
+
+    require = getObject
+
+
+def install(fleet: int = 0) -> FakeSim:
+    """
+    Cria a cena e registra o módulo coppeliasim_zmqremoteapi_client falso.
+    Deve ser chamado antes de importar o brigde.
+    """
+    RemoteAPIClient.scene = FakeSim(fleet)
+    module = types.ModuleType('coppeliasim_zmqremoteapi_client')
+    module.RemoteAPIClient = RemoteAPIClient
+    sys.modules['coppeliasim_zmqremoteapi_client'] = module
+    return RemoteAPIClient.scene
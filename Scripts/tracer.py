@@ -0,0 +1,262 @@
+"""
+Rastreamento de latência dos comandos de target entre processos.
+
+Cada comando recebe um ID na IHM (o seq do quadro TARGET binário) que é
+repassado a cada etapa: CLP, variável CommandId do servidor OPC UA,
+bridge, variável CommandAck (escrita junto com a primeira pose publicada
+após o comando), amostra de telemetria marcada pelo CLP e quadro TRACE
+de volta à IHM. Cada processo grava um carimbo (id, etapa, instante) por
+etapa em TRACE_DIR/<processo>_<pid>.jsonl. Os carimbos são enfileirados em
+memória e gravados por uma thread própria, fora das threads de Tk e de
+subscription que os produzem.
+
+Os instantes usam time.time(): os processos devem estar na mesma máquina
+(ou com relógios sincronizados).
+
+Uso pela linha de comando:
+    python tracer.py relatorio [diretorio]
+    python tracer.py chrome [diretorio] saida.json   (chrome://tracing, Perfetto)
+"""
+import atexit
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from canais import LatencyStats, TelemetryBuffer
+
+TRACE_DIR = "traces"
+TRACE_QUEUE_SIZE = 100000       # carimbos em memória; cheia, descarta os mais antigos
+TRACE_FLUSH_PERIOD = 0.5        # intervalo entre gravações no arquivo (s)
+
+# Etapas de um comando, na ordem em que acontecem
+HOPS = [
+    'ihm.comando',          # send_target() (botão de estação ou envio manual)
+    'ihm.enviado',          # quadro TARGET enviado pela thread de envio
+    'clp.recebido',         # quadro decodificado pelo servidor TCP
+    'clp.desenfileirado',   # retirado do CommandChannel pela thread OPC
+    'clp.escrito',          # Write de TargetX/Y/Z + CommandId concluído
+    'bridge.lido',          # bridge vê o CommandId novo
+    'bridge.publicado',     # primeira pose publicada após o comando (+ CommandAck)
+    'clp.amostra',          # CLP vê o CommandAck e marca a amostra
+    'ihm.amostra',          # IHM recebe o quadro TRACE da amostra
+]
+
+# Limites (ms) das faixas dos histogramas
+HISTOGRAM_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+class Tracer:
+    """
+    Grava os carimbos de um processo em JSON lines.
+
+    stamp() só monta o registro e o enfileira; a thread de gravação, criada
+    no primeiro carimbo (junto com o arquivo), grava a fila a cada
+    TRACE_FLUSH_PERIOD s e no close(). Com enabled=False, stamp() não faz
+    nada. Use get_tracer() para compartilhar uma instância por processo
+    entre threads (e fechá-la na saída do processo).
+    """
+    def __init__(self, process: str, directory: str = TRACE_DIR, enabled: bool = True,
+                 flush_period: float = TRACE_FLUSH_PERIOD):
+        self.process = process
+        self.directory = directory
+        self.enabled = enabled
+        self.flush_period = flush_period
+        self.queue = TelemetryBuffer("ring", TRACE_QUEUE_SIZE)
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def stamp(self, cmd_id, hop: str, t: float = None, **extra):
+        """Registra a passagem do comando cmd_id pela etapa hop."""
+        if not self.enabled or not cmd_id:
+            return
+        record = {'id': int(cmd_id), 'hop': hop, 't': time.time() if t is None else t,
+                  'proc': self.process, 'pid': os.getpid()}
+        record.update(extra)
+        self.queue.put(record)
+        if self._thread is None:
+            self._start()
+
+    def _start(self):
+        with self.lock:
+            if self._thread is None and not self._stop.is_set():
+                self._thread = threading.Thread(target=self._run, name=f"tracer-{self.process}",
+                                                daemon=True)
+                self._thread.start()
+
+    def close(self):
+        """Grava os carimbos pendentes e fecha o arquivo."""
+        with self.lock:
+            self._stop.set()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.enabled = False
+
+    def _run(self):
+        f = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{self.process}_{os.getpid()}.jsonl")
+            f = open(path, 'a', encoding='utf-8')
+            while True:
+                stopping = self._stop.is_set()
+                records = self.queue.drain()
+                if records:
+                    f.write("".join(json.dumps(r) + "\n" for r in records))
+                    f.flush()
+                if stopping:
+                    break
+                self._stop.wait(self.flush_period)
+        except OSError as e:
+            print(f"[TRACE] Erro ao gravar carimbo: {e}")
+            self.enabled = False
+        finally:
+            if f is not None:
+                f.close()
+
+
+_tracers = {}
+_tracers_lock = threading.Lock()
+
+
+def get_tracer(process: str, directory: str = TRACE_DIR, enabled: bool = True) -> Tracer:
+    """Tracer compartilhado do processo (um arquivo por nome de processo)."""
+    with _tracers_lock:
+        tracer = _tracers.get(process)
+        if tracer is None:
+            tracer = _tracers[process] = Tracer(process, directory, enabled)
+            atexit.register(tracer.close)
+        return tracer
+
+
+############################
+# Análise
+############################
+def load_traces(directory: str = TRACE_DIR) -> dict:
+    """
+    Lê os carimbos de todos os processos.
+
+    Returns:
+        {id: {etapa: registro}}, mantendo o primeiro carimbo de cada etapa
+        (várias IHMs podem carimbar a mesma amostra).
+    """
+    traces = defaultdict(dict)
+    for path in sorted(glob.glob(os.path.join(directory, "*.jsonl"))):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                hops = traces[record['id']]
+                if record['hop'] not in hops or record['t'] < hops[record['hop']]['t']:
+                    hops[record['hop']] = record
+    return traces
+
+
+def hop_latencies(traces: dict) -> dict:
+    """
+    Latência entre etapas consecutivas presentes em cada comando, mais as
+    totais. Retorna {nome: [latência em s, ...]}.
+    """
+    result = defaultdict(list)
+    for hops in traces.values():
+        present = [h for h in HOPS if h in hops]
+        for a, b in zip(present, present[1:]):
+            result[f"{a} -> {b}"].append(hops[b]['t'] - hops[a]['t'])
+        for end in ('bridge.publicado', 'ihm.amostra'):
+            if 'ihm.comando' in hops and end in hops:
+                result[f"TOTAL ihm.comando -> {end}"].append(hops[end]['t'] - hops['ihm.comando']['t'])
+    return result
+
+
+def histogram(latencies: list) -> list:
+    """Contagem por faixa de HISTOGRAM_BOUNDS_MS (a última faixa é aberta)."""
+    counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+    for latency in latencies:
+        ms = latency * 1000.0
+        i = 0
+        while i < len(HISTOGRAM_BOUNDS_MS) and ms >= HISTOGRAM_BOUNDS_MS[i]:
+            i += 1
+        counts[i] += 1
+    return counts
+
+
+def print_report(traces: dict):
+    complete = sum(1 for hops in traces.values() if all(h in hops for h in HOPS))
+    print(f"--- {len(traces)} comando(s) rastreado(s), {complete} completo(s) ---")
+    latencies = hop_latencies(traces)
+
+    def order(name):
+        if name.startswith('TOTAL'):
+            return (len(HOPS), name)
+        return (HOPS.index(name.split(' -> ')[0]), name)
+
+    for name in sorted(latencies, key=order):
+        stats = LatencyStats(len(latencies[name]))
+        for latency in latencies[name]:
+            stats.record(latency)
+        s = stats.summary()
+        print(f"\n{name}: n={s['n']} p50={s['p50_ms']:.1f} ms p99={s['p99_ms']:.1f} ms "
+              f"max={s['max_ms']:.1f} ms")
+        counts = histogram(latencies[name])
+        peak = max(counts) or 1
+        labels = [f"< {b} ms" for b in HISTOGRAM_BOUNDS_MS] + [f">= {HISTOGRAM_BOUNDS_MS[-1]} ms"]
+        for label, count in zip(labels, counts):
+            if count:
+                print(f"  {label:>11} {count:6d} {'#' * max(1, round(40 * count / peak))}")
+
+
+def chrome_events(traces: dict) -> dict:
+    """
+    Converte os comandos em eventos do formato Trace Event (chrome://tracing):
+    um evento de duração por trecho entre etapas, no processo da etapa de
+    chegada, e uma linha (tid) por comando.
+    """
+    events = []
+    processes = {}
+    for cmd_id, hops in sorted(traces.items()):
+        present = [h for h in HOPS if h in hops]
+        for h in present:
+            processes[hops[h]['pid']] = hops[h]['proc']
+        for a, b in zip(present, present[1:]):
+            start, end = hops[a], hops[b]
+            events.append({'name': f"{a} -> {b}", 'cat': 'comando', 'ph': 'X',
+                           'ts': start['t'] * 1e6, 'dur': max(0.0, end['t'] - start['t']) * 1e6,
+                           'pid': end['pid'], 'tid': cmd_id, 'args': {'id': cmd_id}})
+        for h in present:
+            events.append({'name': h, 'cat': 'etapa', 'ph': 'i', 's': 't',
+                           'ts': hops[h]['t'] * 1e6, 'pid': hops[h]['pid'], 'tid': cmd_id})
+    for pid, name in processes.items():
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': name}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] not in ('relatorio', 'chrome'):
+        print("Uso: python tracer.py relatorio [diretorio] | chrome [diretorio] saida.json")
+        sys.exit(1)
+    if args[0] == 'relatorio':
+        print_report(load_traces(args[1] if len(args) > 1 else TRACE_DIR))
+        return
+    if len(args) == 2:
+        directory, out = TRACE_DIR, args[1]
+    elif len(args) == 3:
+        directory, out = args[1], args[2]
+    else:
+        print("Uso: python tracer.py chrome [diretorio] saida.json")
+        sys.exit(1)
+    traces = load_traces(directory)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(chrome_events(traces), f)
+    print(f"{len(traces)} comando(s) exportado(s) para {out}")
+
+
+if __name__ == "__main__":
+    main()